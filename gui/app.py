@@ -58,6 +58,8 @@ class App:
         self.window.set_size_request(950,660)
         self.neteditor = None
         self.project = None
+        self.ptp_server = None
+        self.ptp_server_pending = []
         self.sources_repository = extensions.SourcesRepository()
         self._open_welcome_tab()
         self.grid_size = 6
@@ -111,6 +113,7 @@ class App:
         settings.add_section("main")
         settings.set("main", "save-before-build", "True")
         settings.set("main", "ptp-debug", "False")
+        settings.set("main", "ptp-server", "False")
         settings.add_section("code_completion")
         settings.set("code_completion","enable_highlight_current_line","False")
         settings.set("code_completion", "enable_show_line_numbers", "False")
@@ -615,6 +618,64 @@ class App:
     def _project_filename_changed(self):
         self.window.set_title("Kaira - {0}".format(self.project.get_name()))
 
+    def _run_ptp_server(self, proj, build_config, debug, line_callback, exit_callback):
+        """ Builds the exported project by the ptp server, it is started when
+            it is needed for the first time. Callbacks are called in the same
+            way as for a ptp process. """
+        if self.ptp_server is None:
+            # Exit callbacks of builds without an answer
+            pending = []
+            def on_server_exit(code):
+                if self.ptp_server is server:
+                    self.ptp_server = None
+                self.console_write("PTP server exited\n", "error")
+                for callback in pending:
+                    callback(1)
+                del pending[:]
+            p = process.Process(paths.PTP_BIN, exit_callback=on_server_exit)
+            # Anything on stderr is not a part of answers
+            p.stderr_callback = lambda line: self.console_write(line, "error")
+            server = process.CommandWrapper(p)
+            self.ptp_server = server
+            self.ptp_server_pending = pending
+            server.start([ "server" ])
+
+        server = self.ptp_server
+        pending = self.ptp_server_pending
+        def on_answer(line):
+            if exit_callback not in pending:
+                # The server has already failed
+                return
+            pending.remove(exit_callback)
+            match = re.match(r"(\d+) (\d+)\n$", line)
+            if match is None:
+                # Answers that follow cannot be trusted
+                self.console_write("Invalid answer of PTP server: {0}"
+                                       .format(line), "error")
+                if self.ptp_server is server:
+                    self.ptp_server = None
+                server.shutdown()
+                exit_callback(1)
+                for callback in pending:
+                    callback(1)
+                del pending[:]
+                return
+            for i in xrange(int(match.group(2))):
+                line_callback(server.readline(), None)
+            exit_callback(int(match.group(1)))
+
+        output = "."
+        if build_config.directory is not None:
+            output = build_config.directory
+        pending.append(exit_callback)
+        # The same working directory and arguments as for a ptp process
+        server.run_command("\t".join((
+            proj.get_directory(),
+            build_config.operation,
+            build_config.get_export_filename(),
+            output,
+            str(debug))), on_answer)
+
     def _run_build_program(self, name, args, directory, ok_callback, fail_callback):
         def on_exit(code):
             if code == 0:
@@ -684,6 +745,10 @@ class App:
 
 
         debug = self.settings.getboolean("main", "ptp-debug")
+        if self.settings.getboolean("main", "ptp-server"):
+            self._run_ptp_server(proj, build_config, debug, on_line, on_exit)
+            return
+
         p = process.Process(paths.PTP_BIN, on_line, on_exit)
         p.cwd = proj.get_directory()
 
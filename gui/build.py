@@ -39,12 +39,14 @@ class BuildOptionsWidget(gtk.VBox):
 
         options = [ o for o in self.project.build_options.keys()
                     if o != "OTHER_FILES"
-                    if o != "USE_OCTAVE" ]
+                    if o != "USE_OCTAVE"
+                    if o != "SPLIT_NETS" ]
         for i, option in enumerate(options):
             self.add_line(i, option)
 
         self.pack_start(self.table, False, False)
         self.pack_start(self._octave(), False, False)
+        self.pack_start(self._split_nets(), False, False)
 
         self.filelist, controls = self._filelist()
         self.pack_start(controls, False, False)
@@ -128,6 +130,14 @@ class BuildOptionsWidget(gtk.VBox):
         button.connect("clicked", lambda w: self.project.set_build_option("USE_OCTAVE", str(w.get_active())))
         return button
 
+    def _split_nets(self):
+        button = gtk.CheckButton("Compile each net separately (parallel make)")
+        button.set_tooltip_text("Not available for projects with more than "
+                                "one net and a head code")
+        button.set_active(self.project.get_build_option("SPLIT_NETS") == "True")
+        button.connect("clicked", lambda w: self.project.set_build_option("SPLIT_NETS", str(w.get_active())))
+        return button
+
     def _remove_file(self, w):
         self.filelist.remove_selection()
         self._update_project()
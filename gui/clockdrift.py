@@ -0,0 +1,137 @@
+#
+#    Copyright (C) 2016 Kaira contributors
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Linear clock drift model of processes of a tracelog.
+
+    The clock of each process is corrected by
+
+        c_i(t) = a_i + b_i * (t - T_i) / S
+
+    where t is a raw time of the process, T_i is the center of the tracelog
+    in the raw times of the process and S is a second. The coefficients are
+    fitted by the least squares from all messages; the corrected receive
+    time minus the corrected send time of every message should be equal to
+    one common message delay. The process 0 is the reference clock.
+"""
+
+import math
+import numpy as np
+
+# Unit of rates of drift models (nanoseconds per second)
+SCALE = 1e9
+
+
+class ClockDrift(object):
+
+    """ Corrections of clocks of all processes.
+
+        Attributes:
+        offsets -- a_i, for each process
+        rates -- b_i, for each process
+        centers -- T_i, for each process
+    """
+
+    def __init__(self, offsets, rates, centers):
+        self.offsets = list(offsets)
+        self.rates = list(rates)
+        self.centers = list(centers)
+
+    def get_correction(self, process_id, time):
+        """ Returns the correction (int) of a raw time of the process """
+        return int(math.floor(
+            self.offsets[process_id] + self.rates[process_id] *
+            (float(time - self.centers[process_id]) / SCALE) + 0.5))
+
+    def get_corrections(self, process_id, times):
+        """ Returns corrections (int64) of raw times of the process, they are
+            the same as get_correction returns """
+        times = np.asarray(times, dtype=np.int64) - self.centers[process_id]
+        return np.floor(self.offsets[process_id] + self.rates[process_id] *
+                        (times.astype(np.float64) / SCALE) +
+                        0.5).astype(np.int64)
+
+
+def fit_clock_drift(index, time_offsets):
+    """ Returns ClockDrift fitted from messages of the tracelog. The offsets
+        are shifted so that no event is moved backwards, i.e. all
+        corrections are non-negative.
+
+        Arguments:
+        index -- MessageIndex of the tracelog
+        time_offsets -- initial time offsets of traces
+    """
+    count = len(index.times)
+    firsts = np.zeros(count, dtype=np.int64)
+    lasts = np.zeros(count, dtype=np.int64)
+    for process_id in xrange(count):
+        times = index.get_times(process_id, time_offsets[process_id])
+        if len(times):
+            firsts[process_id] = times.min()
+            lasts[process_id] = times.max()
+    center = (int(firsts.min()) + int(lasts.max())) // 2 if count else 0
+    centers = [ center - offset for offset in time_offsets ]
+
+    send_times, receive_times = index.get_message_times(time_offsets)
+    senders = index.messages["sender"].astype(np.int64)
+    receivers = index.messages["receiver"].astype(np.int64)
+    send_u = (send_times - center).astype(np.float64) / SCALE
+    receive_u = (receive_times - center).astype(np.float64) / SCALE
+
+    # Unknowns are a_1, .., a_n-1, b_1, .., b_n-1 and the message delay,
+    # coefficients of the reference process 0 are pointed to the delay
+    # with a zero weight
+    size = 2 * (count - 1) + 1
+    delay = size - 1
+
+    def a(process):
+        return np.where(process == 0, delay, process - 1)
+
+    def b(process):
+        return np.where(process == 0, delay, count - 1 + process - 1)
+
+    zero = np.zeros(len(senders))
+    columns = [ a(receivers), b(receivers), a(senders), b(senders),
+                np.repeat(delay, len(senders)) ]
+    weights = [ np.where(receivers == 0, zero, 1.0),
+                np.where(receivers == 0, zero, receive_u),
+                np.where(senders == 0, zero, -1.0),
+                np.where(senders == 0, zero, -send_u),
+                -np.ones(len(senders)) ]
+    rhs = (send_times - receive_times).astype(np.float64)
+
+    # Normal equations
+    matrix = np.zeros((size, size))
+    vector = np.zeros(size)
+    for column_i, weight_i in zip(columns, weights):
+        np.add.at(vector, column_i, weight_i * rhs)
+        for column_j, weight_j in zip(columns, weights):
+            np.add.at(matrix, (column_i, column_j), weight_i * weight_j)
+    solution = np.linalg.lstsq(matrix, vector, rcond=None)[0] \
+        if len(senders) else np.zeros(size)
+
+    offsets = np.r_[0.0, solution[:count - 1]]
+    rates = np.r_[0.0, solution[count - 1:delay]]
+    drift = ClockDrift(offsets, rates, centers)
+
+    # Corrections are linear, so the minimum is at the first or last event
+    lowest = min([ min(drift.get_correction(i, firsts[i] - time_offsets[i]),
+                       drift.get_correction(i, lasts[i] - time_offsets[i]))
+                   for i in xrange(count) ] or [ 0 ])
+    drift.offsets = [ offset - lowest for offset in drift.offsets ]
+    return drift
@@ -168,7 +168,7 @@ def get_save_file_filter(type):
 t_tracelog = Type("Kaira tracelog", "Tracelog")
 def load_kth(filename, app, settings=None):
     def load_tracelog():
-        tracelog = TraceLog(filename, True)
+        tracelog = TraceLog(filename, True, mapped=True, cache=True)
         if tracelog.missed_receives > 0:
             app.console_write(
                 "{1} mismatched receives were found in tracelog {0}.\n" \
@@ -193,7 +193,7 @@ t_syncedtracelog = Type("Kaira synchronized tracelog", "Synced tracelog")
 def load_kst(filename, app, settings = None):
 
     def load_syncedtracelog():
-        syncedtracelog = SyncedTraceLog(fromfile=filename)
+        syncedtracelog = SyncedTraceLog(fromfile=filename, cache=True)
         return syncedtracelog
         
     return (app._catch_io_error(load_syncedtracelog), settings)
@@ -19,6 +19,7 @@
 #
 
 import settingswindow
+import tablewriter
 from runinstance import RunInstance
 from table import  Table
 from gtk import RESPONSE_APPLY
@@ -27,7 +28,20 @@ class ExportRunInstance(RunInstance):
 
     basic_header = ["Event", "Time", "Duration", "Process", "ID"]
 
-    def __init__(self, tracelog, transitions, place_functions, columns):
+    def __init__(self, tracelog, transitions, place_functions, columns,
+                 writer_factory=None, chunk_size=100000):
+        """ Initialization.
+
+        Arguments:
+        tracelog -- exported TraceLog
+        transitions -- exported transitions
+        place_functions -- couples (place, index of trace function)
+        columns -- names of exported columns
+        writer_factory -- None or a function that gets a list of couples
+            (name, data type) and returns a TableWriter, rows are then
+            written by chunks and the table holds only the last chunk
+        chunk_size -- number of rows in one chunk of a writer
+        """
         RunInstance.__init__(self,
                              tracelog.project,
                              tracelog.process_count)
@@ -51,13 +65,20 @@ class ExportRunInstance(RunInstance):
         self.column_value = bool(place_functions)
         self.column_tokens = bool(self.traced_places)
 
-        self.table = self._create_table()
+        self.chunk_size = chunk_size
+        self.writer = None
+        if writer_factory is None:
+            self.table = self._create_table(100)
+        else:
+            self.table = self._create_table(chunk_size)
+            self.writer = writer_factory(
+                zip(self.table.header, self.table.types))
 
         self.idles = [None] * self.process_count
         self.tokens_counters = [[0] * len(self.traced_places)
                                 for p in range(tracelog.process_count)]
 
-    def _create_table(self):
+    def _create_table(self, rows_number):
         header = []
         types = [];
         if self.column_event:
@@ -93,7 +114,7 @@ class ExportRunInstance(RunInstance):
                 header.append(col_name)
                 types.append('<i4')
 
-        return Table(zip(header, types), 100)
+        return Table(zip(header, types), rows_number)
 
     def add_row(self, event, time, duration, process, id, (col_name, value)):
         row = []
@@ -119,11 +140,22 @@ class ExportRunInstance(RunInstance):
             row += self.tokens_counters[process]
 
         self.table.add_row(row)
+        if self.writer is not None and len(self.table) == self.chunk_size:
+            self._flush()
 
     def get_table(self):
         self.table.trim()
         return self.table
 
+    def finish(self):
+        """ Writes the rest of rows and closes the writer """
+        self._flush()
+        self.writer.close()
+
+    def _flush(self):
+        self.writer.write(self.table.data[:len(self.table)])
+        self.table.clear()
+
     # Collected events
     def transition_finished(self, process_id, time):
         activity = self.activites[process_id]
@@ -183,6 +215,32 @@ class ExportRunInstance(RunInstance):
                          (place_counter_name(place), change))
 
 
+def export_to_file(tracelog, transitions, place_functions, columns, output,
+                   filename, csv_settings=None, chunk_size=100000):
+    """ Exports events of the tracelog into a CSV or NPY file (output is
+        "csv" or "npy") and returns the number of written rows. When the
+        export fails, the partially written files are removed.
+    """
+    writers = []
+    def writer_factory(columns):
+        writers.append(tablewriter.create_writer(
+            output, filename, columns, csv_settings))
+        return writers[-1]
+
+    try:
+        try:
+            ri = ExportRunInstance(tracelog, transitions, place_functions,
+                                   columns, writer_factory, chunk_size)
+            tracelog.execute_all_events(ri)
+            ri.finish()
+        finally:
+            for writer in writers:
+                writer.close()
+    except:
+        tablewriter.remove_files(output, filename)
+        raise
+    return writers[0].rows
+
 def place_value_name(place, f_index):
     return "V: ({0}/{1})".format(place.get_name_or_id(),
                                  place.trace_tokens_functions[f_index].name)
@@ -191,7 +249,7 @@ def place_counter_name(place):
     return "C: {0}".format(place.get_name_or_id())
 
 def run_assistant(app, tracelog):
-    assistant = settingswindow.BasicSettingAssistant(2,
+    assistant = settingswindow.BasicSettingAssistant(3,
                                                      "Export settings",
                                                      app.window)
     assistant.set_size_request(600, 600)
@@ -230,12 +288,25 @@ def run_assistant(app, tracelog):
         w.add_checkbuttons("columns", "Columns", data)
         return w
 
+    def page_3(setting):
+        w = settingswindow.SettingWidget()
+        w.add_radiobuttons("output",
+                           "Output",
+                           [ ("Table", None),
+                             ("CSV file (written by chunks)", "csv"),
+                             ("NPY file (written by chunks)", "npy") ])
+        w.add_positive_int("chunk_size", "Rows in chunk", 100000)
+        return w
+
     assistant.append_setting_widget("Events", page_1)
     assistant.append_setting_widget("Columns", page_2)
+    assistant.append_setting_widget("Output", page_3)
 
     if assistant.run() != RESPONSE_APPLY:
         return
 
     return (assistant.get_setting("transitions"),
             assistant.get_setting("place_functions"),
-            assistant.get_setting("columns"))
+            assistant.get_setting("columns"),
+            assistant.get_setting("output"),
+            assistant.get_setting("chunk_size"))
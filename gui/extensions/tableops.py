@@ -99,8 +99,7 @@ class Filter(Operation):
             value = utils.convert_to_type(table.types[col_idx], value)
             filters.append((table.header[col_idx], cmp_function, value))
 
-        filtered = table.select(selected_columns, filters)
-        t = Table.create_from_data(filtered)
+        t = table.filter(filters, selected_columns)
         return Source("Filtered table", t_table, t)
 
 add_operation(Filter)
@@ -69,7 +69,8 @@ class TracelogComparison(extensions.Operation):
                               "error")
             return
         
-        comparator = TracelogComparator(settings[0], settings[1], settings[2])
+        comparator = TracelogComparator(settings[0], settings[1], settings[2],
+                                        cache=True)
         
         source = extensions.Source("Tracelog comparison results",
                                  datatypes.t_table,
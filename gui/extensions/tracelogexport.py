@@ -41,10 +41,31 @@ class TracelogExport(extensions.Operation):
         if settings is None:
             return
 
-        ri = ExportRunInstance(tracelog, *settings)
-        tracelog.execute_all_events(ri)
-        return extensions.Source(self._output_name(),
-                                 datatypes.t_table,
-                                 ri.get_table())
+        transitions, place_functions, columns, output, chunk_size = settings
+        if output is None:
+            ri = ExportRunInstance(tracelog, transitions, place_functions,
+                                   columns)
+            tracelog.execute_all_events(ri)
+            return extensions.Source(self._output_name(),
+                                     datatypes.t_table,
+                                     ri.get_table())
+
+        filename = app.run_file_dialog("Export into file", "save",
+                                       output.upper(), "*." + output)
+        if filename is None:
+            return
+        if not filename.endswith("." + output):
+            filename += "." + output
+        csv_settings = None
+        if output == "csv":
+            csv_settings = datatypes.show_csv_settings_dialog(app.window)
+            if csv_settings is None:
+                return
+
+        rows = exportri.export_to_file(
+            tracelog, transitions, place_functions, columns, output,
+            filename, csv_settings, chunk_size)
+        app.console_write("Tracelog exported into '{0}' ({1} rows)\n"
+                              .format(filename, rows), "success")
 
 extensions.add_operation(TracelogExport)
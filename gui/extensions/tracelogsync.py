@@ -57,6 +57,17 @@ class TracelogSync(extensions.Operation):
             w.add_checkbutton("weaksync",
                               "Apply initial weak synchronization",
                               False)
+            w.add_checkbutton("vectorized",
+                              "Use the fast vectorized synchronization "
+                              "(not used with the backward amortization)",
+                              False)
+            w.add_checkbutton("drift",
+                              "Correct linear clock drift of processes "
+                              "before the synchronization",
+                              False)
+            w.add_checkbutton("compress",
+                              "Compress traces in the synchronized tracelog",
+                              False)
             return w
         
         assistant.append_setting_widget("Synchronization settings", page)
@@ -69,7 +80,10 @@ class TracelogSync(extensions.Operation):
                 assistant.get_setting("forward_amort"),
                 assistant.get_setting("backward_amort"),
                 assistant.get_setting("weaksync"),
-                assistant.get_setting("file"))
+                assistant.get_setting("file"),
+                assistant.get_setting("vectorized"),
+                assistant.get_setting("compress"),
+                assistant.get_setting("drift"))
 
     def run(self, app):
         
@@ -81,7 +95,11 @@ class TracelogSync(extensions.Operation):
                               "error")
             return
         
-        syncedtracelog = SyncedTraceLog(fromtracelog=(settings[5], settings))
+        syncedtracelog = SyncedTraceLog(fromtracelog=(settings[5], settings),
+                                        vectorized=settings[6],
+                                        cache=True,
+                                        compress=settings[7],
+                                        drift=settings[8])
         
         source = extensions.Source("Synchronized tracelog",
                                  datatypes.t_syncedtracelog,
@@ -27,7 +27,7 @@ from table import Table
 class TracelogVerifier(extensions.Operation):
 
     name = "Tracelog verifier"
-    description = "Scans chosen tracelog and inspects clock condition violations (i.e. if there exists a send event whose timestamp is greater than a timestamp of the corresponding receive event). Results are stored into a table. "
+    description = "Scans chosen tracelog and inspects clock condition violations (i.e. if there exists a send event whose timestamp is greater than a timestamp of the corresponding receive event). Results are stored into a table, statistics of message delays of each couple of sender and receiver into another one. "
 
     parameters = [ ]
     
@@ -55,15 +55,17 @@ class TracelogVerifier(extensions.Operation):
         return (assistant.get_setting("file"), 
                 assistant.get_setting("weaksync"))
     
-    def create_table(self, app, results):
+    def create_table(self, app, results, percentiles):
         rows = []
         rows.append(("Total number of sent messages", results[0]))
         rows.append(("Clock condition violations", results[1]))
         rows.append(("Maximum delay [ns]", results[2]))
         rows.append(("Average delay [ns]", results[3]))
+        for percentile, delay in percentiles:
+            rows.append(("Message delay p{0:g} [ns]".format(percentile), delay))
         columns = []
         columns.append(("Information", "|S{0}".format(len(max(rows, key=lambda x: len(x[0]))[0]))))
-        columns.append(("Value", "<u8"))
+        columns.append(("Value", "<i8"))
         result_table = Table(columns, len([r[0] for r in rows]))
         for r in rows:
             result_table.add_row(r)
@@ -84,9 +86,14 @@ class TracelogVerifier(extensions.Operation):
                               "error")
             return
         
-        t = VTraceLog(settings[0], settings[1])
+        t = VTraceLog(settings[0], settings[1], cache=True)
         
-        return self.create_table(app, t.get_results())
+        links = extensions.Source("Message delays of links",
+                                  datatypes.t_table,
+                                  t.get_link_table())
+        return [ self.create_table(app, t.get_results(),
+                                   t.get_delay_percentiles()),
+                 links ]
                 
 
 extensions.add_operation(TracelogVerifier)
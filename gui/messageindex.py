@@ -0,0 +1,199 @@
+#
+#    Copyright (C) 2016 Kaira contributors
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import numpy as np
+
+message_dtype = [("receiver", "<i4"),
+                 ("receive", "<i8"),
+                 ("sender", "<i4"),
+                 ("send", "<i8")]
+
+
+class MessageIndex(object):
+
+    """ Timestamped records of all traces of a tracelog and pairs of sends
+        and receives. The n-th message received by a process from a sender is
+        the n-th message sent by the sender to the process, as in the replay.
+
+        Attributes:
+        times -- for each trace, records with a timestamp (see decode_times)
+        sends -- for each trace, targets of sent messages (see decode_times)
+        messages -- one row per received message, ordered by the receiver and
+                    the receive: receiver, index of the receive record in
+                    times of the receiver, sender and index of the send record
+                    in times of the sender
+    """
+
+    # Version of the format of index cache files
+    cache_version = 1
+
+    def __init__(self, times, sends, messages=None):
+        """ Initialization.
+
+            Arguments:
+            times -- list of records of traces, the first item of couples
+                     returned by decode_times
+            sends -- list of message targets of traces, the second item of
+                     couples returned by decode_times
+            messages -- already matched messages, they are matched if None
+        """
+        self.times = times
+        self.sends = sends
+        if messages is None:
+            messages = match_messages(times, sends)
+        self.messages = messages
+        self._bounds = np.searchsorted(messages["receiver"],
+                                       np.arange(len(times) + 1))
+
+    def get_received_messages(self, process_id):
+        """ Returns rows of messages received by the process """
+        return self.messages[self._bounds[process_id]:
+                             self._bounds[process_id + 1]]
+
+    def get_times(self, process_id, time_offset=0):
+        """ Returns times of all records of the trace as int64 """
+        return self.times[process_id]["time"].astype(np.int64) + time_offset
+
+    def get_message_times(self, time_offsets):
+        """ Returns a couple (send times, receive times) of all messages
+
+            Arguments:
+            time_offsets -- list of time offsets of traces
+        """
+        send_times = np.zeros(len(self.messages), dtype=np.int64)
+        receive_times = np.zeros(len(self.messages), dtype=np.int64)
+        for process_id in xrange(len(self.times)):
+            times = self.get_times(process_id, time_offsets[process_id])
+            sent = self.messages["sender"] == process_id
+            send_times[sent] = times[self.messages["send"][sent]]
+            begin, end = self._bounds[process_id], self._bounds[process_id + 1]
+            receive_times[begin:end] = times[self.messages["receive"][begin:end]]
+        return send_times, receive_times
+
+
+def create_message_index(decoded):
+    """ Returns MessageIndex of traces.
+
+        Arguments:
+        decoded -- list of couples (times, sends) returned by decode_times,
+                   one for each trace
+    """
+    return MessageIndex([ times for times, sends in decoded ],
+                        [ sends for times, sends in decoded ])
+
+def match_messages(times, sends):
+    """ Returns an array of messages (see MessageIndex) """
+    receivers, receives, senders, targets, send_records = [], [], [], [], []
+    for process_id, (t, s) in enumerate(zip(times, sends)):
+        records = np.flatnonzero(t["type"] == "R")
+        receivers.append(np.repeat(process_id, len(records)))
+        receives.append(records)
+        senders.append(t["id"][records])
+        send_records.append(s["record"])
+        targets.append(np.repeat(process_id, len(s)) * len(times) + s["target"])
+    receivers = np.concatenate(receivers).astype(np.int64)
+    receives = np.concatenate(receives).astype(np.int64)
+    senders = np.concatenate(senders).astype(np.int64)
+    send_records = np.concatenate(send_records).astype(np.int64)
+    # Channels (sender, receiver) of sent and received messages
+    send_channels = np.concatenate(targets).astype(np.int64)
+    receive_channels = senders * len(times) + receivers
+
+    # Sends sorted by channels keep their order within each channel, so the
+    # n-th message of a channel is at the start of the channel plus n
+    order = np.argsort(send_channels, kind="mergesort")
+    send_channels = send_channels[order]
+    send_records = send_records[order]
+
+    order = np.argsort(receive_channels, kind="mergesort")
+    nth = np.empty(len(order), dtype=np.int64)
+    sorted_channels = receive_channels[order]
+    nth[order] = np.arange(len(order)) - \
+        np.searchsorted(sorted_channels, sorted_channels)
+
+    start = np.searchsorted(send_channels, receive_channels)
+    end = np.searchsorted(send_channels, receive_channels, side="right")
+    missing = np.flatnonzero(start + nth >= end)
+    if len(missing):
+        raise Exception("Process {0} receives more messages than "
+                        "process {1} sends to it"
+                            .format(receivers[missing[0]],
+                                    senders[missing[0]]))
+
+    messages = np.zeros(len(receives), dtype=message_dtype)
+    messages["receiver"] = receivers
+    messages["receive"] = receives
+    messages["sender"] = senders
+    messages["send"] = send_records[start + nth]
+    return messages
+
+def get_cache_key(filenames):
+    """ Returns an array identifying versions of the files """
+    return np.array([ (os.path.getsize(f), os.path.getmtime(f))
+                      for f in filenames ],
+                    dtype=[("size", "<i8"), ("mtime", "<f8")])
+
+def load_message_index(filename, key):
+    """ Loads MessageIndex from a cache file. Returns None if the file does
+        not exist or it was created for other files.
+
+        Arguments:
+        filename -- path to the cache file
+        key -- get_cache_key of files the index was created from
+    """
+    if not os.path.isfile(filename):
+        return None
+    try:
+        with open(filename, "rb") as f:
+            cache = np.load(f)
+            if int(cache["version"]) != MessageIndex.cache_version or \
+                    not np.array_equal(cache["key"], key):
+                return None
+            count = int(cache["process_count"])
+            return MessageIndex(
+                [ cache["times_{0}".format(i)] for i in xrange(count) ],
+                [ cache["sends_{0}".format(i)] for i in xrange(count) ],
+                cache["messages"])
+    except (IOError, ValueError, KeyError):
+        return None
+
+def store_message_index(filename, key, index):
+    """ Stores MessageIndex into a cache file, failures are ignored.
+
+        Arguments:
+        filename -- path to the cache file
+        key -- get_cache_key of files the index was created from
+        index -- MessageIndex
+    """
+    arrays = {}
+    for i, (times, sends) in enumerate(zip(index.times, index.sends)):
+        arrays["times_{0}".format(i)] = times
+        arrays["sends_{0}".format(i)] = sends
+    try:
+        with open(filename, "wb") as f:
+            np.savez(f,
+                     version=MessageIndex.cache_version,
+                     key=key,
+                     process_count=len(index.times),
+                     messages=index.messages,
+                     **arrays)
+    except (IOError, OSError):
+        # The cache is optional, e.g. the directory may be read-only
+        pass
@@ -78,6 +78,20 @@ class ProcessThread(ReadLineThread):
         return self.safe_call(self.line_callback, line, stream)
 
 
+class StderrThread(ReadLineThread):
+
+    def __init__(self, process, line_callback):
+        ReadLineThread.__init__(self, process.stderr)
+        self.line_callback = line_callback
+
+    def on_exit(self):
+        pass
+
+    def on_line(self, line, stream):
+        self.safe_call(self.line_callback, line)
+        return True
+
+
 class ConnectionThread(ReadLineThread):
 
     def __init__(self, host, port, line_callback, exit_callback, connect_callback):
@@ -115,6 +129,8 @@ class Process:
         self.line_callback = line_callback
         self.exit_callback = exit_callback
         self.cwd = None
+        # If it is set, stderr is passed to it instead of line_callback
+        self.stderr_callback = None
 
     def start(self, params = []):
         self._start_process(params)
@@ -133,16 +149,22 @@ class Process:
                              bufsize=0,
                              stdin=PIPE,
                              stdout=PIPE,
-                             stderr=STDOUT,
+                             stderr=STDOUT if self.stderr_callback is None
+                                    else PIPE,
                              cwd=self.cwd)
 
     def _start_thread(self):
         self.thread = ProcessThread(self.process, self.line_callback, self.exit_callback)
         self.thread.start()
+        if self.stderr_callback is not None:
+            StderrThread(self.process, self.stderr_callback).start()
 
     def write(self, string):
         self.pipe_in.write(string)
 
+    def readline(self):
+        return self.thread.readline()
+
     def shutdown(self, silent = True):
         self.thread.set_exit_flag()
         if silent:
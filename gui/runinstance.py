@@ -19,6 +19,7 @@
 
 import utils
 from copy import copy
+from collections import deque
 
 
 class Packet:
@@ -44,11 +45,34 @@ class RunInstance:
         self.packets = [ [] for i in xrange(self.process_count * self.process_count)]
         self.debt_receives = [[] for i in xrange(self.process_count * self.process_count)]
         self.missed_receives = 0
+        self.undo_records = None
+
+    def enable_undo(self, limit):
+        """ Starts recording of changes made by events, so up to 'limit' last
+            events can be reverted by undo() """
+        self.undo_records = deque(maxlen=limit)
+
+    def can_undo(self):
+        return bool(self.undo_records)
+
+    def undo(self):
+        """ Reverts the last processed event """
+        self.undo_records.pop().restore(self)
+
+    def _record_instance(self, process_id):
+        if self.undo_records:
+            self.undo_records[-1].save_instance(self, process_id)
+
+    def _record_inverse(self, fn, *args):
+        if self.undo_records:
+            self.undo_records[-1].operations.append((fn, args))
 
     def add_token(self, place_id, token_pointer, token_value, send_time=None):
+        self._record_instance(self.last_event_instance.process_id)
         self.last_event_instance.add_token(place_id, token_pointer, token_value, send_time)
 
     def remove_token(self, place_id, token_pointer):
+        self._record_instance(self.last_event_instance.process_id)
         self.last_event_instance.remove_token(place_id, token_pointer)
 
     def clear_removed_and_new_tokens(self):
@@ -64,6 +88,8 @@ class RunInstance:
 
     def pre_event(self):
         """ This method is called by tracelog before each event_* """
+        if self.undo_records is not None:
+            self.undo_records.append(UndoRecord(self))
         self.clear_removed_and_new_tokens()
 
     def reset_last_event_info(self):
@@ -77,6 +103,7 @@ class RunInstance:
         assert self.net.id == net_id
         self.last_event = "spawn"
         self.set_activity(process_id, None)
+        self._record_instance(process_id)
         instance = NetInstance(process_id)
         self.net_instances[process_id] = instance
         self.last_event_instance = instance
@@ -91,6 +118,8 @@ class RunInstance:
         if self.last_event_activity is not None:
             # None can occur when we are logging
             # "quit" but not transition fire
+            self._record_inverse(setattr, self.last_event_activity, "quit",
+                                 self.last_event_activity.quit)
             self.last_event_activity.quit = True
         self.last_event_instance = self.net_instances[process_id]
 
@@ -104,11 +133,14 @@ class RunInstance:
     def event_send(self, process_id, time, target_id, size, edge_id):
         debts = self.debt_receives[target_id * self.process_count + process_id]
         if debts:
+            self._record_inverse(debts.insert, 0, debts[0])
             del debts[0]
             self.missed_receives += 1
         else:
             packet = Packet(time, size, edge_id)
-            self.packets[target_id * self.process_count + process_id].append(packet)
+            packets = self.packets[target_id * self.process_count + process_id]
+            self._record_inverse(packets.pop)
+            packets.append(packet)
 
     def event_end(self, process_id, time):
         pass
@@ -120,6 +152,7 @@ class RunInstance:
         packets = self.packets[process_id * self.process_count + origin_id]
         if packets:
             packet = packets[0]
+            self._record_inverse(packets.insert, 0, packet)
             del packets[0]
             self.last_event_instance = self.net_instances[process_id]
             self.set_activity(process_id,
@@ -128,6 +161,7 @@ class RunInstance:
         else:
             # receive on debt
             idx = process_id * self.process_count + origin_id
+            self._record_inverse(self.debt_receives[idx].pop)
             self.debt_receives[idx].append(Receive(time, process_id, origin_id))
 
     def transition_fired(self, process_id, time, transition_id, values):
@@ -142,6 +176,8 @@ class RunInstance:
             self.activites[process_id] = self.last_event_activity
 
     def transition_blocked(self, process_id):
+        self._record_inverse(setattr, self.activites[process_id], "blocked",
+                             self.activites[process_id].blocked)
         self.activites[process_id].blocked = True
 
     def transition_finished(self, process_id, time):
@@ -162,6 +198,44 @@ class RunInstance:
         runinstance.activites = self.activites[:]
         return runinstance
 
+    def snapshot(self):
+        """ Returns an independent copy of the whole replay state. Unlike
+            copy(), the result can be used for processing of further events
+            and it does not share any mutable data with the original.
+        """
+        runinstance = RunInstance(self.project, self.process_count)
+        runinstance.net = self.net
+        for i in self.net_instances:
+            runinstance.net_instances[i] = self.net_instances[i].snapshot()
+
+        activities = {}
+        def copy_activity(activity):
+            if activity is None:
+                return None
+            if id(activity) not in activities:
+                activities[id(activity)] = copy(activity)
+            return activities[id(activity)]
+
+        runinstance.activites = map(copy_activity, self.activites)
+        runinstance.last_event = self.last_event
+        runinstance.last_event_activity = \
+            copy_activity(self.last_event_activity)
+        if self.last_event_instance is not None:
+            runinstance.last_event_instance = \
+                runinstance.net_instances[self.last_event_instance.process_id]
+        runinstance.last_event_time = self.last_event_time
+        if hasattr(self, "last_event_process"):
+            runinstance.last_event_process = self.last_event_process
+        runinstance.packets = [ packets[:] for packets in self.packets ]
+        runinstance.debt_receives = [ debts[:] for debts in self.debt_receives ]
+        runinstance.missed_receives = self.missed_receives
+        return runinstance
+
+    def get_size(self):
+        """ Returns the number of tokens and packets in the run instance """
+        return sum(n.get_size() for n in self.net_instances.values()) + \
+               sum(len(packets) for packets in self.packets)
+
     def get_perspectives(self):
         perspectives = [ Perspective("All", self, self.net_instances) ]
         v = self.net_instances.keys()
@@ -198,6 +272,61 @@ class RunInstance:
         return len(self.packets[target_id * self.process_count + origin_id])
 
 
+class UndoRecord:
+
+    """ Changes of a run instance made by one event """
+
+    def __init__(self, runinstance):
+        self.net = runinstance.net
+        self.activites = runinstance.activites[:]
+        self.last_event = runinstance.last_event
+        self.last_event_activity = runinstance.last_event_activity
+        self.last_event_time = runinstance.last_event_time
+        self.last_event_process = getattr(runinstance, "last_event_process", None)
+        if runinstance.last_event_instance is not None:
+            self.last_event_instance = \
+                runinstance.last_event_instance.process_id
+        else:
+            self.last_event_instance = None
+        self.missed_receives = runinstance.missed_receives
+        self.operations = []
+        # Original states of changed net instances (None = did not exist);
+        # instances with pending new and removed tokens are changed by
+        # pre_event, other ones are saved before their first change
+        self.instances = {}
+        for i, instance in runinstance.net_instances.items():
+            if instance.new_tokens or instance.removed_tokens:
+                self.instances[i] = instance.snapshot()
+
+    def save_instance(self, runinstance, process_id):
+        if process_id not in self.instances:
+            instance = runinstance.net_instances.get(process_id)
+            if instance is not None:
+                instance = instance.snapshot()
+            self.instances[process_id] = instance
+
+    def restore(self, runinstance):
+        for fn, args in reversed(self.operations):
+            fn(*args)
+        for i, instance in self.instances.items():
+            if instance is None:
+                del runinstance.net_instances[i]
+            else:
+                runinstance.net_instances[i] = instance
+        runinstance.net = self.net
+        runinstance.activites = self.activites
+        runinstance.last_event = self.last_event
+        runinstance.last_event_activity = self.last_event_activity
+        runinstance.last_event_time = self.last_event_time
+        runinstance.last_event_process = self.last_event_process
+        if self.last_event_instance is not None:
+            runinstance.last_event_instance = \
+                runinstance.net_instances[self.last_event_instance]
+        else:
+            runinstance.last_event_instance = None
+        runinstance.missed_receives = self.missed_receives
+
+
 class ProcessActivity:
 
     def __init__(self, time, process_id):
@@ -297,6 +426,19 @@ class NetInstance:
         netinstance.enabled_transitions = copy(self.enabled_transitions)
         return netinstance
 
+    def snapshot(self):
+        def copy_lists(tokens):
+            return dict((place_id, lst[:] if lst is not None else None)
+                        for place_id, lst in tokens.items())
+        netinstance = NetInstance(self.process_id, copy_lists(self.tokens))
+        netinstance.new_tokens = copy_lists(self.new_tokens)
+        netinstance.removed_tokens = copy_lists(self.removed_tokens)
+        netinstance.enabled_transitions = copy(self.enabled_transitions)
+        return netinstance
+
+    def get_size(self):
+        return sum(len(lst) for lst in self.tokens.values() if lst is not None)
+
 
 class Perspective(utils.EqMixin):
 
@@ -154,17 +154,15 @@ def process_utilization(table, processes):
 
     columns = ["Time", "Duration"]
     # collect idles
-    filters = [("Event", f_eq, 'I')]
-    idles = []
-    for p in processes:
-        idles.append(table.select(columns, filters + [("Process", f_eq, p)]))
+    groups = table.group_by(
+        "Process", columns, [("Event", f_eq, 'I')], processes)
+    idles = [ groups[p] for p in processes ]
 
     # collect TETs
-    filters = [("Event", f_eq, 'T')]
-    names, values = [], []
-    for p in processes:
-        names.append(str(p))
-        values.append(table.select(columns, filters + [("Process", f_eq, p)]))
+    groups = table.group_by(
+        "Process", columns, [("Event", f_eq, 'T')], processes)
+    names = [ str(p) for p in processes ]
+    values = [ groups[p] for p in processes ]
 
     names.reverse()
     values.reverse()
@@ -186,14 +184,15 @@ def transition_utilization(table, processes, transitions):
     columns = ["Time", "Duration"]
     filters = [("Event", f_eq, 'T')]
     if "Process" in header:
+        groups = table.group_by(
+            ["ID", "Process"], columns, filters,
+            [ (t.id, p) for t in transitions for p in processes ])
         names, values = [], []
         for p in processes:
             pnames, pvalues = [], []
             for t in transitions:
                 pnames.append("{0} {1}".format(t.get_name_or_id(), p))
-                pvalues.append(table.select(
-                    columns,
-                    filters + [("ID", f_eq, t.id), ("Process", f_eq, p)]))
+                pvalues.append(groups[(t.id, p)])
             names.append(pnames)
             values.append(pvalues)
 
@@ -205,11 +204,12 @@ def transition_utilization(table, processes, transitions):
         values = reduce(f_concate, values, [])
         names = reduce(f_concate, names, [])
     else:
+        groups = table.group_by(
+            "ID", columns, filters, [ t.id for t in transitions ])
         names, values = [], []
         for t in transitions:
             names.append(t.get_name_or_id())
-            values.append(table.select(
-                columns, filters + [("ID", f_eq, t.id)]))
+            values.append(groups[t.id])
 
     return ("Utilization of transitions",
             charts.utilization_chart(
@@ -226,12 +226,14 @@ def tet_per_processes_and_transitions_histogram(table, processes, transitions):
     f_eq = lambda x, y: x == y
     columns = ["Duration"]
     filters = [("Event", f_eq, 'T')]
+    groups = table.group_by(
+        ["ID", "Process"], columns, filters,
+        [ (t.id, p) for t in transitions for p in processes ])
     names, values = [], []
     for tran in transitions:
-        f = filters + [("ID", f_eq, tran.id)]
         for p in processes:
             names.append("{0}`{1}".format(tran.get_name_or_id(), p))
-            tets = table.select(columns, f + [("Process", f_eq, p)])
+            tets = groups[(tran.id, p)]
 
             if len(tets) == 0: # tets is a numpy array
                 tets = [0] # data for a histogram chart must not be empty
@@ -252,10 +254,11 @@ def tet_per_processes_histogram(table, processes):
     f_eq = lambda x, y: x == y
     columns = ["Duration"]
     filters = [("Event", f_eq, 'T')]
+    groups = table.group_by("Process", columns, filters, processes)
     names, values = [], []
     for p in processes:
         names.append("Process {0}".format(p))
-        tets = table.select(columns, filters + [("Process", f_eq, p)])
+        tets = groups[p]
 
         if len(tets) == 0:
             tets = [0]
@@ -276,10 +279,12 @@ def tet_per_transitions_histogram(table, transitions):
     f_eq = lambda x, y: x == y
     columns = ["Duration"]
     filters = [("Event", f_eq, 'T')]
+    groups = table.group_by(
+        "ID", columns, filters, [ t.id for t in transitions ])
     names, values = [], []
     for t in transitions:
         names.append(t.get_name_or_id())
-        tets = table.select(columns, filters + [("ID", f_eq, t.id)])
+        tets = groups[t.id]
 
         if len(tets) == 0:
             tets = [0]
@@ -300,13 +305,14 @@ def tokens_count(table, processes, places, collapse=True):
 
     f_eq = lambda x, y: x == y
     filters = [("Event", f_eq, 'C')]
+    columns = ["Time"] + [place_counter_name(place) for place in places]
+    groups = table.group_by("Process", columns, filters, processes)
     names, values = [], []
     for place in places:
-        columns = ["Time", place_counter_name(place)]
         for p in processes:
             names.append("{0}@{1}".format(place.get_name_or_id(), p))
-            counts = table.select(columns, filters + [("Process", f_eq, p)])
-            values.append((counts[columns[0]], counts[columns[1]]))
+            counts = groups[p]
+            values.append((counts["Time"], counts[place_counter_name(place)]))
 
     return ("Number of tokens",
             charts.place_chart(
@@ -26,6 +26,8 @@ class SettingsWidget(gtk.Notebook):
         vbox = gtk.VBox()
         settings_button("main", "save-before-build", "Save project before build")
         settings_button("main", "ptp-debug", "PTP debugging")
+        settings_button("main", "ptp-server",
+                        "Keep PTP running between builds")
         return vbox
 
     def _completion_settings(self):
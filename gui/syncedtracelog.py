@@ -18,12 +18,39 @@
 #
 
 import xml.etree.ElementTree as xml
+import bisect
+import os
+import shutil
+import struct
+import zlib
+import numpy as np
 import loader
+import syncengine
+from clockdrift import fit_clock_drift
 from runinstance import RunInstance
-from tracelog import TraceLog, Trace
+from tracedecoder import decode_dropped_tokens
+from tracelog import TraceLog, Trace, read_trace_data, map_trace_data
 from Queue import Queue
-from collections import OrderedDict
-from cStringIO import StringIO
+from collections import deque
+
+# Indexed *.kst layout (version 2): the header, the table of traces, traces
+# and the project XML. The first version has no header, it starts by
+# the pointer size written as a text line.
+KST_MAGIC = "KAIRAKST"
+KST_VERSION = 2
+# magic, version, pointer size, process count, project offset, project size
+kst_header = struct.Struct("<8sIIIQQ")
+# offset, stored size, size of the trace data, compression (0 none, 1 zlib)
+kst_entry = struct.Struct("<QQQI")
+KST_NO_COMPRESSION = 0
+KST_ZLIB = 1
+
+# Sends and their messages kept by SyncedTrace for the backward amortization
+send_dtype = [ ("record", np.int64), ("first_row", np.int64) ]
+send_row_dtype = [ ("send", np.int64), ("receiver", np.int32),
+                   ("receive", np.int64), ("offset", np.int64) ]
+receive_dtype = [ ("record", np.int64), ("origin", np.int32),
+                  ("send_record", np.int64), ("row", np.int64) ]
            
 class SyncedTraceLog (TraceLog):
     """ SyncedTraceLog -- synchronizes timestamps within a Kaira tracelog 
@@ -52,25 +79,56 @@ class SyncedTraceLog (TraceLog):
                 weak_sync -- True/False, turns on/off initial weak synchronization
                 Creates a new SyncedTraceLog object from an existing TraceLog 
                 object and does the synchronization
+            Key: 'vectorized' -> Value: True/False, optional with
+                'fromtracelog', times are corrected by the vectorized engine
+                (syncengine) instead of the replay of traces; it is not used
+                with the backward amortization
+            Key: 'drift' -> Value: True/False, optional with 'fromtracelog',
+                a linear clock drift model of each process is fitted from
+                messages and applied to times before the synchronization
+                (see clockdrift)
             Key: 'fromfile' -> Value: A path to a *.kst
                 Loads an existing already synchronized *.kst file
+            Key: 'cache' -> Value: True/False, optional; with 'fromfile',
+                stores/loads results of preprocessing into/from a cache file,
+                with 'fromtracelog', stores/loads the message index used by
+                the vectorized synchronization (see TraceLog.get_message_index)
+            Key: 'jobs' -> Value: number of processes decoding traces,
+                optional, None means one per CPU; with 'fromtracelog', the
+                processes also prepare times for the vectorized engine (the
+                correction of receive times is not parallel)
+            Key: 'compress' -> Value: True/False, optional, traces are
+                compressed when the tracelog is exported into a *.kst
         """
         
+        self.compress = kwargs.get("compress", False)
         if "fromtracelog" in kwargs:
-            TraceLog.__init__(self, kwargs["fromtracelog"][0], False, True, False)
+            TraceLog.__init__(self, kwargs["fromtracelog"][0], False, True, False,
+                              mapped=True, cache=kwargs.get("cache", False),
+                              jobs=kwargs.get("jobs", 1))
             self._syncing = True         
-            self._from_tracelog(kwargs["fromtracelog"][1])
+            self._from_tracelog(kwargs["fromtracelog"][1],
+                                kwargs.get("vectorized", False),
+                                kwargs.get("drift", False))
 
         elif "fromfile" in kwargs:
             TraceLog.__init__(self, kwargs["fromfile"][0], False, False)
             self._syncing = False
+            self.cache = kwargs.get("cache", False)
+            self.jobs = kwargs.get("jobs", 1)
             self._from_file(kwargs["fromfile"])
             
         else:
             raise Exception("Unknown keyword argument!")
     
     
-    def _from_tracelog(self, settings):
+    def _from_tracelog(self, settings, vectorized=False, drift=False):
+            vectorized = vectorized and not settings[3]
+            index = None
+            if vectorized or drift:
+                # Traces are decoded before they are replaced by SyncedTraces
+                index = self.get_message_index()
+
             # Matrix of unprocessed sent messages        
             self.messages = [[SQueue() for x in range(self.process_count)] for x in range(self.process_count)] 
             
@@ -93,12 +151,16 @@ class SyncedTraceLog (TraceLog):
                 self.straces.append(strace)
             self.traces = self.straces
                                                
-            self._synchronize()
+            self.clock_drift = None
+            if vectorized:
+                self._synchronize_vectorized(index, drift)
+            else:
+                self._synchronize(index if drift else None)
             
     
     def _from_file(self, filename):
         self.process_count, self.pointer_size, self.traces, self.project = \
-            SyncedTraceLogLoader(filename).load()
+            SyncedTraceLogLoader(filename, True).load()
         
         self.filename = filename
         self.export_data = True        
@@ -106,13 +168,50 @@ class SyncedTraceLog (TraceLog):
         self.first_runinstance = RunInstance(self.project, self.process_count)
         
         self._preprocess(False)
-        
+
+    def _get_source_filenames(self):
+        return [ self.filename ]
            
-    def _synchronize(self):
+    def _synchronize(self, index=None):
         """ Main feature of this class. It controls whole synchronization 
             procedure 
+
+            Arguments:
+            index -- MessageIndex of the tracelog, if it is not None the clock
+                     drift model is fitted from it and applied
         """
-        
+        self._init_time_offsets()
+        if index is not None:
+            self._init_clock_drift(index)
+        self._replay()
+
+    def _synchronize_vectorized(self, index, drift=False):
+        """ Synchronization by the vectorized engine, without the backward
+            amortization. Falls back to the replay of traces for inputs the
+            engine does not handle.
+
+            Arguments:
+            index -- MessageIndex of the tracelog
+            drift -- if True the clock drift model is applied
+        """
+        self._init_time_offsets()
+        if drift:
+            self._init_clock_drift(index)
+        try:
+            processes = syncengine.synchronize(self.traces, index,
+                                               self.minimal_event_diff,
+                                               self.minimum_msg_delay,
+                                               self.forward_amort,
+                                               self.jobs,
+                                               self.clock_drift)
+        except syncengine.SyncError:
+            self._replay()
+            return
+        for trace, process in zip(self.traces, processes):
+            trace.set_synced_times(process.pointers, process.get_times())
+
+    def _init_time_offsets(self):
+        """ Sets initial time offsets and init times of traces """
         # Apply initial weak synchronization
         if self.weak_sync:
             maxspawntrace = max( self.traces, key=lambda x: x.get_next_event_time() )
@@ -126,7 +225,16 @@ class SyncedTraceLog (TraceLog):
             for trace in self.traces:
                 trace.time_offset = trace.get_init_time() - starttime
                 trace.set_init_time(trace.time_offset)
-        
+
+    def _init_clock_drift(self, index):
+        """ Fits the clock drift model and sets it to traces """
+        self.clock_drift = fit_clock_drift(
+            index, [ trace.time_offset for trace in self.traces ])
+        for trace in self.traces:
+            trace.clock_drift = self.clock_drift
+
+    def _replay(self):
+        """ Corrects times by processing events of traces one by one """
         # List of unprocessed processes
         processes = [x for x in range(self.process_count)]
         # A process which will be processed
@@ -150,7 +258,8 @@ class SyncedTraceLog (TraceLog):
                                 #Backward amortization - add receive time and maximum offset
                                 self.traces[sender].refill_received_time(trace.get_last_received_sent_time(),\
                                                                          trace.get_last_receive_event_time(),\
-                                                                         working_p) 
+                                                                         working_p,\
+                                                                         send=trace.get_last_received_send())
                         else:
                             current_p = sender
                     else:
@@ -183,44 +292,108 @@ class SyncedTraceLog (TraceLog):
         if self._syncing:
             self.traces[target].refill_received_time(send_time, receive_time, \
                                                     receiver, new_record)
+
+    def refill_received_times(self, target, records, rows, receive_times,
+                              receiver):
+        """ Updates received times of several messages sent by one process,
+            see SyncedTrace.refill_received_times
+        """
+        if self._syncing:
+            self.traces[target].refill_received_times(records, rows,
+                                                      receive_times, receiver)
     
-    def export_to_file(self, filename):
-        """ Saves synchronized tracelog to a file 
+    def export_to_file(self, filename, compress=None):
+        """ Saves synchronized tracelog to a file (the indexed layout, see
+            KST_VERSION). Traces are streamed into the file one by one, the
+            table of traces is written when all of them are stored.
             
             Arguments:
             filename -- Path to a *.kst
+            compress -- if True, traces are compressed by zlib; if None, the
+                        'compress' keyword given to the constructor is used
         """
-        data = str(self.pointer_size) + '\n' + str(self.process_count) + '\n'
-        
-        traces = ""
+        if compress is None:
+            compress = self.compress
+        # The file is written under a temporary name, so a failed export
+        # does not leave a broken *.kst
+        tmp_filename = filename + ".tmp"
+        try:
+            with open(tmp_filename, "wb") as f:
+                self._write_kst(f, compress)
+        except:
+            if os.path.exists(tmp_filename):
+                os.unlink(tmp_filename)
+            raise
+        os.rename(tmp_filename, filename)
 
+    def _write_kst(self, f, compress):
+        # The header and the table are filled at the end
+        f.write("\0" * (kst_header.size + 
+                        kst_entry.size * self.process_count))
+        entries = []
         for t in self.traces:
-            tdata = t.export_data()
-            data += str(len(tdata)) + '\n'
-            traces += tdata
-        
-        data += traces
-        
-        with open(self.filename, "r") as f:
-            f.readline()
-            data += f.read()
-            
-        with open(filename, "wb") as f:
-            f.write(data)
+            offset = f.tell()
+            if compress:
+                writer = _CompressedWriter(f)
+                t.write_data(writer)
+                writer.close()
+                entries.append((offset, f.tell() - offset, writer.size,
+                                KST_ZLIB))
+            else:
+                t.write_data(f)
+                entries.append((offset, f.tell() - offset,
+                                f.tell() - offset, KST_NO_COMPRESSION))
+
+        project_offset = f.tell()
+        with open(self.filename, "r") as source:
+            source.readline()
+            shutil.copyfileobj(source, f)
+        project_size = f.tell() - project_offset
+
+        f.seek(0)
+        f.write(kst_header.pack(KST_MAGIC, KST_VERSION, self.pointer_size,
+                                self.process_count, project_offset,
+                                project_size))
+        for entry in entries:
+            f.write(kst_entry.pack(*entry))
+
+
+class _CompressedWriter(object):
+
+    """ File-like object compressing written data into another file """
+
+    def __init__(self, f):
+        self._file = f
+        self._compressor = zlib.compressobj()
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        self._file.write(self._compressor.compress(data))
+
+    def close(self):
+        self._file.write(self._compressor.flush())
 
 
 class SyncedTraceLogLoader(object):
     
-    """ Performs loading of a *.kst file """
+    """ Performs loading of a *.kst file. Both the indexed layout and the
+        original one (a text header with lengths of traces) are supported.
+        Traces can be loaded all at once (load) or one by one (load_trace).
+    """
     
-    def __init__(self, filename):
+    def __init__(self, filename, mapped=False):
         """ Initialization. 
             
             Arguments:
             filename -- path to a *.kst file
+            mapped -- if True the file is memory-mapped and uncompressed
+                        traces are zero-copy views into the mapping
         """
         self._filename = filename
+        self._mapped = mapped
         self._loaded = False
+        self._entries = None
         
     def load(self):
         """ Loads content of *.kst.
@@ -228,31 +401,81 @@ class SyncedTraceLogLoader(object):
             binary data, XML description of program/project)
         """
         if not self._loaded:
-            self.pointer_size = 0
-            self.traces = []
-            self.project = None
-            
-            with open(self._filename, "rb") as f:
-                self.pointer_size = int(f.readline())
-                self.process_count = int(f.readline())
-                
-                i = 0
-                processes_length = []
-                while i < self.process_count:
-                    processes_length.append(int(f.readline()))
-                    i += 1
-                
-                i = 0
-                for p in processes_length:
-                    trace = Trace(f.read(p), i, self.pointer_size)
-                    self.traces.append(trace)
-                    i += 1
-                
-                x = xml.fromstring(f.read())
-                self.project = loader.load_project_from_xml(x, "")
+            self.read_index()
+            self.traces = [ self.load_trace(i)
+                            for i in xrange(self.process_count) ]
+            self.project = self.load_project()
             self._loaded = True
         return (self.process_count, self.pointer_size, self.traces, 
                 self.project)
+
+    def read_index(self):
+        """ Reads the header of the file: the version, the pointer size, the
+            number of processes and positions of traces and of the project.
+        """
+        if self._entries is not None:
+            return
+        with open(self._filename, "rb") as f:
+            if f.read(len(KST_MAGIC)) == KST_MAGIC:
+                f.seek(0)
+                magic, self.version, self.pointer_size, self.process_count, \
+                    self._project_offset, self._project_size = \
+                    kst_header.unpack(f.read(kst_header.size))
+                if self.version > KST_VERSION:
+                    raise Exception("Unsupported version of *.kst file "
+                                    "({0})".format(self.version))
+                self._entries = [ kst_entry.unpack(f.read(kst_entry.size))
+                                  for i in xrange(self.process_count) ]
+            else:
+                f.seek(0)
+                self.version = 1
+                self.pointer_size = int(f.readline())
+                self.process_count = int(f.readline())
+                processes_length = [ int(f.readline())
+                                     for i in xrange(self.process_count) ]
+                offset = f.tell()
+                self._entries = []
+                for length in processes_length:
+                    self._entries.append(
+                        (offset, length, length, KST_NO_COMPRESSION))
+                    offset += length
+                self._project_offset = offset
+                self._project_size = None
+        self._data = None
+        if self._mapped:
+            self._data = read_trace_data(self._filename, True)
+
+    def load_trace(self, process_id):
+        """ Returns Trace of one process, other traces are not read. """
+        self.read_index()
+        offset, size, length, compression = self._entries[process_id]
+        if compression == KST_NO_COMPRESSION and self._data is not None:
+            tdata = map_trace_data(self._data, offset, size)
+        else:
+            with open(self._filename, "rb") as f:
+                f.seek(offset)
+                tdata = f.read(size)
+        source = (self._filename, offset, size)
+        if compression == KST_ZLIB:
+            tdata = zlib.decompress(tdata)
+            # Workers of decode_traces cannot map compressed data
+            source = None
+        elif compression != KST_NO_COMPRESSION:
+            raise Exception("Unknown compression of a trace in *.kst file")
+        trace = Trace(tdata, process_id, self.pointer_size)
+        trace.source = source
+        return trace
+
+    def load_project(self):
+        """ Returns the project stored in the file """
+        self.read_index()
+        with open(self._filename, "rb") as f:
+            f.seek(self._project_offset)
+            if self._project_size is None:
+                x = xml.fromstring(f.read())
+            else:
+                x = xml.fromstring(f.read(self._project_size))
+        return loader.load_project_from_xml(x, "")
         
 class SyncedTrace(Trace):
     
@@ -276,7 +499,8 @@ class SyncedTrace(Trace):
             backward_amort -- see the SyncedTraceLog class
             messages -- shared variable among SyncedTraces, 2-dimensional array
                         of SQueues, first coordinate is a sender of a message,
-                        second is the recipient, SQueues store sent events.
+                        second is the recipient, SQueues store sent events
+                        as tuples (sender's SyncedTrace, record, row).
             messenger -- an object of the Messenger class, communicator between
                             the SyncedTrace and a SyncedTraceLog
         """
@@ -287,15 +511,40 @@ class SyncedTrace(Trace):
         self._backward_amort = backward_amort
         self._messages = messages
         self._messenger = messenger
+        # Records without their times, the times are kept in _times
         self._data_list = []
+        self._times = _GrowingArray(np.int64)
         self._header_info = self.data[:self.pointer]
         self._last_event_time = 0
-        self._send_events = OrderedDict()
-        self._last_received_sent_time = 0
+        # Indexes of all send records in _data_list
+        self._send_records = []
+        # While send times are unique, sends are kept in arrays: the record
+        # and the first row of each send, and a row (the send, receiver,
+        # receive time, offset) for each message. BA is then done in
+        # batches over whole arrays.
+        self._regular = True
+        self._sends = _GrowingArray(send_dtype)
+        self._max_send_time = 0
+        self._rows = _GrowingArray(send_row_dtype)
+        self._last_refilled_send = None
+        # Otherwise sends are converted into send times in the order of their
+        # records (as they are repaired by BA, they do not have to stay
+        # sorted), lists of SendEvents for each time and positions of the
+        # times in the order
+        self._send_times = None
+        self._send_events = None
+        self._send_positions = None
         self._last_refilled_send_time = None
+        # Receive records with the record and the row of their send
+        self._receives = _GrowingArray(receive_dtype)
+        self._last_received_sent_time = 0
+        self._last_received_send = None
         self._last_receive_event_time = 0
         self._receive_send_table = {}
         self._BA_tasks = []
+        self._synced_times = None
+        # ClockDrift applied to raw times, None means no correction
+        self.clock_drift = None
         
     def _clock_check(self, time, start_pointer, end_pointer=False, \
                      is_receive=False, sent_time=0):
@@ -313,6 +562,7 @@ class SyncedTrace(Trace):
          """
         newtime = 0
         
+        time = self._get_drifted_time(time)
         if not is_receive:
             newtime = self._clock(time + self.time_offset)
         else:
@@ -421,20 +671,25 @@ class SyncedTrace(Trace):
             origin_time -- the original timestamp of receive event
             new_time -- corrected/synchronized timestamp of the event
         """
+        if self._regular and self._amortize_sends(origin_time, new_time):
+            return
+        self._make_irregular()
+
         offset = new_time - origin_time
-        send_event_keys = [ key for key in self._send_events.keys() if key > new_time ]
-        linear_send_events = OrderedDict()
+        send_times = self._send_times
+        send_event_keys = [ key for key in send_times if key > new_time ]
         
         # Pick send events which occurred before the receive event    
         if send_event_keys:
-            tmp_point = self._send_events.keys().index(send_event_keys[0])
-            send_set = self._send_events.keys()[ : tmp_point ]
+            tmp_point = self._send_positions[send_event_keys[0]]
+            send_set = send_times[ : tmp_point ]
         else:
-            send_set = self._send_events.keys()
+            send_set = send_times
         
         # Linear correction - formation of a set of breakpoints
         previous = SendEvent()
-        delete_events = Queue()
+        breakpoints = []
+        delete_events = set()
         for event in send_set:
             se = self._send_events[event]
             if len(se) > 1:
@@ -443,16 +698,15 @@ class SyncedTrace(Trace):
             else:
                 bp = se[0]
             bp.time = event
-            linear_send_events[event] = bp
+            breakpoints.append((event, bp))
             if bp.offset <= previous.offset or previous.offset >= offset:
-                delete_events.put(previous.time)
+                delete_events.add(previous.time)
             previous = bp
         if previous.offset >= offset:
-            delete_events.put(previous.time)        
-        length = delete_events.qsize()
-        while length > 0:
-            linear_send_events.pop(delete_events.get(), None)
-            length -= 1        
+            delete_events.add(previous.time)
+        # Breakpoints in the order of send times, consumed from the front
+        linear_send_events = deque(bp for bp in breakpoints
+                                   if bp[0] not in delete_events)
         
         # Repair times
         send_event = [0]
@@ -460,16 +714,21 @@ class SyncedTrace(Trace):
         # Is there any event that cannot be shifted by full amount of the 
         # offset?
         if linear_send_events:
-            send_event = linear_send_events.popitem(False)
+            send_event = linear_send_events.popleft()
             local_offset = send_event[1].offset
-        new_send_events = OrderedDict()
+        new_send_events = {}
+        new_send_times = []
+        refill_received_time = self._messenger.refill_received_time
+        times = self._times.view()
         for index, event in enumerate(self._data_list):
-            if event[1] == new_time:
+            if times[index] == new_time:
                 break
             if event[0] == "M":
-                tmp_time = event[1]
+                tmp_time = int(times[index])
                 time = tmp_time + local_offset
-                event[1] = time
+                times[index] = time
+                if time not in new_send_events:
+                    new_send_times.append(time)
                 new_send_events[time] = []
                 for e in self._send_events[tmp_time]:
                     e.offset -= local_offset
@@ -477,27 +736,133 @@ class SyncedTrace(Trace):
                 self._last_refilled_send_time = time
                 if tmp_time == send_event[0]:
                     if linear_send_events:
-                        send_event = linear_send_events.popitem(False)
+                        send_event = linear_send_events.popleft()
                         local_offset = send_event[1].offset
                     else:
                         send_event = [0]
                         local_offset = offset
             else:
-                event[1] += local_offset
+                times[index] += local_offset
             if event[0] == "R":
                 send_time = self._receive_send_table[index].get_sent_time()
                 origin_id = self._receive_send_table[index].origin_id
-                self._messenger.refill_received_time(origin_id, send_time, \
-                                                                    event[1], \
+                refill_received_time(origin_id, send_time, \
+                                                                    int(times[index]), \
                                                                     self.process_id, \
                                                                     False)
         
         # Add send events behind the receive event back
         for key in send_event_keys:
+            if key not in new_send_events:
+                new_send_times.append(key)
             new_send_events[key] = self._send_events[key]
             self._last_refilled_send_time = key
         
-        self._send_events = new_send_events        
+        self._send_times = new_send_times
+        self._send_events = new_send_events
+        self._send_positions = dict((time, i) for i, time
+                                    in enumerate(new_send_times))
+
+    def _amortize_sends(self, origin_time, new_time):
+        """ Applies the backward amortization over arrays of sends, the
+            result is the same as the one of the walk through records in
+            _backward_amortization. Breakpoints are found over whole arrays
+            and records are shifted by segments between them.
+
+            Returns False, without any change, if the walk would not pass
+            exactly the sends which are not later than new_time, or if send
+            times would not stay unique.
+        """
+        offset = new_time - origin_time
+        times = self._times.view()
+        sends = self._sends.view()
+        rows = self._rows.view()
+        records = sends["record"]
+        send_times = times[records]
+
+        # The walk through records stops at the first event of the new time
+        same = np.flatnonzero(times == new_time)
+        end = same[0] if len(same) else len(times)
+        count = np.searchsorted(records, end)
+        if bisect.bisect_left(self._send_records, end) != count or \
+                np.any(send_times[:count] > new_time) or \
+                np.any(send_times[count:] <= new_time):
+            return False
+
+        first_rows = sends["first_row"][:count]
+        walked_rows = sends["first_row"][count] if count < len(sends) \
+                      else len(rows)
+        if count:
+            # The minimal offset of each send; a send is a breakpoint if the
+            # next one has a greater offset and its own one is lower than
+            # the offset. The initial breakpoint at time 0 removes the send
+            # at time 0 if its offset is not positive.
+            minimal = np.minimum.reduceat(rows["offset"][:walked_rows],
+                                          first_rows)
+            kept = minimal < offset
+            kept[:-1] &= minimal[1:] > minimal[:-1]
+            if minimal[0] <= 0:
+                kept[send_times[:count] == 0] = False
+            breakpoints = np.flatnonzero(kept)
+            # A record of a breakpoint is shifted by the breakpoint's offset,
+            # following ones by the offset of the next breakpoint
+            bounds = np.concatenate(([0], records[breakpoints] + 1, [end]))
+            shifts = np.repeat(np.append(minimal[breakpoints], offset),
+                               np.diff(bounds))
+            send_times[:count] += shifts[records[:count]]
+            if len(np.unique(send_times)) != len(send_times):
+                return False
+            self._max_send_time = send_times.max()
+        else:
+            shifts = offset
+
+        times[:end] += shifts
+        if count:
+            rows["offset"][:walked_rows] -= np.repeat(
+                shifts[records[:count]],
+                np.diff(np.append(first_rows, walked_rows)))
+        if len(sends):
+            # The last walked send or the last one behind the receive
+            self._last_refilled_send = len(sends) - 1
+
+        receives = self._receives.view()
+        receives = receives[:np.searchsorted(receives["record"], end)]
+        for origin in np.unique(receives["origin"]):
+            selected = receives[receives["origin"] == origin]
+            self._messenger.refill_received_times(
+                origin, selected["send_record"], selected["row"],
+                times[selected["record"]], self.process_id)
+        return True
+
+    def _make_irregular(self):
+        """ Converts arrays of sends into SendEvents, which are used when
+            sends cannot be amortized in arrays (see _amortize_sends)
+        """
+        if not self._regular:
+            return
+        self._regular = False
+        times = self._times.view()
+        sends = self._sends.view()
+        rows = self._rows.view()
+        bounds = np.append(sends["first_row"], len(rows))
+        self._send_times = []
+        self._send_events = {}
+        self._send_positions = {}
+        for i, record in enumerate(sends["record"]):
+            time = int(times[record])
+            if time not in self._send_events:
+                self._send_positions[time] = len(self._send_times)
+                self._send_times.append(time)
+                self._send_events[time] = []
+            for row in rows[bounds[i]:bounds[i + 1]]:
+                send_event = SendEvent()
+                send_event.receiver = int(row["receiver"])
+                send_event.receive = int(row["receive"])
+                send_event.offset = int(row["offset"])
+                self._send_events[time].append(send_event)
+        if self._last_refilled_send is not None:
+            self._last_refilled_send_time = \
+                int(times[sends["record"][self._last_refilled_send]])
     
     def are_receive_times_refilled(self, received_time=None):
         """ Returns True if all send events (SendEvents) in chosen interval 
@@ -508,19 +873,39 @@ class SyncedTrace(Trace):
                             border for the set of send events that is going 
                             to be checked
         """
-        times = self._send_events.keys()
+        if self._regular:
+            start = 0
+            if self._last_refilled_send is not None:
+                start = self._last_refilled_send
+            else:
+                received_time = None
+            sends = self._sends.view()
+            if start >= len(sends):
+                return True
+            rows = self._rows.view()[sends["first_row"][start]:]
+            if received_time is None:
+                return not np.any(rows["receive"] == 0)
+            send_times = self._times.view()[sends["record"][rows["send"]]]
+            return not np.any((rows["receive"] == 0) &
+                              (send_times < received_time))
+
+        times = self._send_times
+        start = 0
         if self._last_refilled_send_time is not None:
-            start = times.index(self._last_refilled_send_time)
-            times = times[start:]
-            if received_time is not None:
-                times = [t for t in times if t < received_time]
-        for t in times:
+            start = self._send_positions[self._last_refilled_send_time]
+        else:
+            received_time = None
+        for i in xrange(start, len(times)):
+            t = times[i]
+            if received_time is not None and t >= received_time:
+                continue
             for e in self._send_events[t]:
                 if e.receive == 0:
                     return False
         return True
     
-    def refill_received_time(self, sent_time, received_time, receiver, new_record=True):
+    def refill_received_time(self, sent_time, received_time, receiver,
+                             new_record=True, send=None):
         """ Matches receive time to a specific sent time and computes 
             maximum offset.
             
@@ -530,7 +915,20 @@ class SyncedTrace(Trace):
             receiver -- ID of a process where the receive event happened
             new_record -- if True you are adding missing received time otherwise
                             you are updating an existing received time
+            send -- None or a tuple (record, row) of the send event, it saves
+                    the search of the sent time
         """
+        if self._regular:
+            row = self._find_send_row(sent_time, receiver, send)
+            if row is not None:
+                rows = self._rows.view()
+                rows["receive"][row] = received_time
+                rows["offset"][row] = received_time - \
+                    self._minimum_msg_delay - sent_time
+                if new_record:
+                    self._last_refilled_send = int(rows["send"][row])
+            return
+
         for event in self._send_events[sent_time]:
             if event.receiver == receiver:
                 event.receive = received_time
@@ -539,19 +937,94 @@ class SyncedTrace(Trace):
                 if new_record:
                     self._last_refilled_send_time = sent_time
                 break
+
+    def refill_received_times(self, records, rows, received_times, receiver):
+        """ Updates received times of messages sent to one receiver, the same
+            as refill_received_time with new_record=False for each of them.
+
+            Arguments:
+            records -- indexes of send records
+            rows -- rows of the messages in sends of this trace
+            received_times -- new receive times
+            receiver -- ID of a process where the receive events happened
+        """
+        times = self._times.view()
+        if self._regular:
+            send_rows = self._rows.view()
+            send_rows["receive"][rows] = received_times
+            send_rows["offset"][rows] = received_times - \
+                self._minimum_msg_delay - times[records]
+            return
+        for record, received_time in zip(records, received_times):
+            self.refill_received_time(int(times[record]), int(received_time),
+                                      receiver, False)
+
+    def _find_send_row(self, sent_time, receiver, send):
+        """ Returns the row of a message from arrays of sends, or None """
+        times = self._times.view()
+        if send is not None and send[1] >= 0 and times[send[0]] == sent_time:
+            return send[1]
+        sends = self._sends.view()
+        found = np.flatnonzero(times[sends["record"]] == sent_time)
+        if not len(found):
+            raise KeyError(sent_time)
+        i = found[0]
+        end = sends["first_row"][i + 1] if i + 1 < len(sends) \
+              else len(self._rows)
+        rows = np.flatnonzero(
+            self._rows.view()["receiver"][sends["first_row"][i]:end] == receiver)
+        if len(rows):
+            return sends["first_row"][i] + rows[0]
+        return None
+
+    def get_time(self, record):
+        """ Returns the synchronized time of a record """
+        return int(self._times.view()[record])
     
-    def export_data(self):
-        """ Returns synchronized data in a raw binary form. """
-        stream = StringIO()
-        stream.write(self._header_info)
-        for event in self._data_list:
-            event[1] = self.struct_basic.pack(event[1])
-            for data in event:
-                stream.write(data)
-        export = stream.getvalue()
-        stream.close()
-        return export
-    
+    def set_synced_times(self, pointers, times):
+        """ Stores times corrected by the vectorized engine, the events are
+            not processed by this trace then.
+
+            Arguments:
+            pointers -- pointers to type chars of records with a timestamp
+            times -- corrected times of the records
+        """
+        self._synced_times = (pointers, times)
+
+    def write_data(self, f):
+        """ Writes synchronized data in the raw binary form into a file.
+            Events are written in chunks, so the whole data is never held in
+            memory twice.
+
+            Arguments:
+            f -- a file object open for writing
+        """
+        f.write(self._header_info)
+        if self._synced_times is not None:
+            pointers, times = self._synced_times
+            data = np.frombuffer(self.data, dtype=np.uint8).copy()
+            positions = np.asarray(pointers)[:, None] + 1 + np.arange(8)
+            data[positions] = times.astype("<u8").view(np.uint8).reshape(-1, 8)
+            # The same data as the replay writes, see _extra_tokens_add
+            starts, ends = decode_dropped_tokens(self)
+            if len(starts):
+                bounds = np.zeros(len(data) + 1, dtype="<i8")
+                bounds[starts] += 1
+                bounds[ends] -= 1
+                data = data[np.cumsum(bounds[:-1]) == 0]
+            f.write(buffer(data, self.pointer))
+            return
+        pack = self.struct_basic.pack
+        chunk = []
+        for event, time in zip(self._data_list, self._times.view().tolist()):
+            chunk.append(event[0])
+            chunk.append(pack(time))
+            chunk.extend(event[1:])
+            if len(chunk) > 65536:
+                f.write("".join(chunk))
+                chunk = []
+        f.write("".join(chunk))
+
     def set_init_time(self, increment, direct=False):
         """ Increase initial time of a process by the increment
          
@@ -586,10 +1059,23 @@ class SyncedTrace(Trace):
         """ Returns last received (obtained from messages) sent time. """
         return self._last_received_sent_time
     
+    def get_last_received_send(self):
+        """ Returns the record and the row of the last received send event
+            in the sender's trace, the row is -1 if the sender does not keep
+            sends in arrays.
+        """
+        return self._last_received_send
+
     def get_last_receive_event_time(self):
         """ Returns time of last synchronized receive event. """
         return self._last_receive_event_time
     
+    def _get_drifted_time(self, time):
+        """ Returns a raw time corrected by the clock drift model """
+        if self.clock_drift is None:
+            return time
+        return time + self.clock_drift.get_correction(self.process_id, time)
+
     def _repair_time(self, time, start_pointer, end_pointer):
         """ Overwrites original time in tracelog's data string with the new one 
             
@@ -599,7 +1085,7 @@ class SyncedTrace(Trace):
             end_pointer -- points to the end of event ('s data)
         """
         event = self._data_list[-1]
-        event.append(time)
+        self._times.append(time)
         start_pointer += self.struct_basic.size
         if end_pointer is False:
             end_pointer = self.pointer
@@ -620,13 +1106,19 @@ class SyncedTrace(Trace):
         else:
             if origin_id is None:
                 raise Exception("Origin_id for a receive event not entered!")
-            send_event = self._messages[origin_id][self.process_id].get()
-            sent_time = send_event[1]
-            self._receive_send_table[ len(self._data_list) - 1 ] = RSTableElement(send_event, origin_id)
-            tmp_original_time = time + self.time_offset 
+            sender, record, row = \
+                self._messages[origin_id][self.process_id].get()
+            sent_time = sender.get_time(record)
+            index = len(self._data_list) - 1
+            self._receive_send_table[index] = RSTableElement(sender, record,
+                                                             origin_id)
+            self._receives.append((index, origin_id, record, row))
+            tmp_original_time = self._get_drifted_time(time) + \
+                self.time_offset
             ctime = self._clock_check(time, pointer, False, True, sent_time)
             self._do_BA(ctime, tmp_original_time)
             self._last_received_sent_time = sent_time
+            self._last_received_send = (record, row)
             return ctime
 
     def _extra_event_send(self, time, target_id):
@@ -636,16 +1128,41 @@ class SyncedTrace(Trace):
             time -- already synchronized time of the send event
             target_id -- message recipient
         """
-        self._messages[self.process_id][target_id].put(self._data_list[-1])
+        record = len(self._data_list) - 1
+        if self._regular:
+            sends = self._sends.view()
+            rows = self._rows.view()
+            if len(sends) and sends["record"][-1] == record:
+                if np.any(rows["receiver"][sends["first_row"][-1]:] ==
+                          target_id):
+                    self._make_irregular()
+            elif len(sends) and time <= self._max_send_time and \
+                    np.any(self._times.view()[sends["record"]] == time):
+                self._make_irregular()
+            else:
+                self._sends.append((record, len(rows)))
+                self._max_send_time = max(self._max_send_time, time)
+        if self._regular:
+            row = len(self._rows)
+            self._rows.append((len(self._sends) - 1, target_id, 0, 0))
+            self._messages[self.process_id][target_id].put(
+                (self, record, row))
+            return
+
+        self._messages[self.process_id][target_id].put((self, record, -1))
         send_event = SendEvent()
         send_event.receiver = target_id
-        if time not in self._send_events.keys():
+        if time not in self._send_events:
+            self._send_positions[time] = len(self._send_times)
+            self._send_times.append(time)
             self._send_events[time] = [send_event]
         else:
             self._send_events[time].append(send_event)
     
     def _extra_event(self, event):
         """ Stores event symbol into trace's data """
+        if event == "M":
+            self._send_records.append(len(self._data_list))
         self._data_list.append([event])
     
     def _extra_value(self):
@@ -659,6 +1176,28 @@ class SyncedTrace(Trace):
             
             
     
+class _GrowingArray(object):
+    """ One-dimensional numpy array with appends of single items """
+
+    def __init__(self, dtype, size=1024):
+        self._data = np.zeros(size, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        if self._size == len(self._data):
+            self._data = np.concatenate(
+                (self._data, np.zeros(len(self._data), self._data.dtype)))
+        self._data[self._size] = value
+        self._size += 1
+
+    def view(self):
+        """ Returns a view of items, it is valid until the next append """
+        return self._data[:self._size]
+
+
 class SQueue(Queue):
     """ Classic Queue with possibility of reading an element instead of popping """
     
@@ -697,6 +1236,14 @@ class Messenger(object):
         """
         self._target.refill_received_time(target, send_time, receive_time, \
                                         receiver, new_record)
+
+    def refill_received_times(self, target, records, rows, receive_times,
+                              receiver):
+        """ Updates received times of several messages sent by the target
+            process, see SyncedTrace.refill_received_times
+        """
+        self._target.refill_received_times(target, records, rows,
+                                           receive_times, receiver)
         
 
 class SendEvent(object):
@@ -717,20 +1264,22 @@ class SendEvent(object):
 class RSTableElement(object):
     """ Reference to a send event """
     
-    def __init__(self, send_event, origin_id):
+    def __init__(self, trace, record, origin_id):
         """ Initialization.
         
             Arguments:
-            send_event -- reference to a send event
+            trace -- SyncedTrace of the message sender
+            record -- index of the send event in the sender's data
             origin_id -- ID of the message sender
         """
         
-        self.send_event = send_event
+        self.trace = trace
+        self.record = record
         self.origin_id = origin_id
     
     def get_sent_time(self):
         """ Returns time of sent event """
-        return self.send_event[1]
+        return self.trace.get_time(self.record)
 
 class BATask(object):
     """ Task for Backward Amortization 
@@ -0,0 +1,284 @@
+#
+#    Copyright (C) 2016 Kaira contributors
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Vectorized timestamp synchronization.
+
+    It computes the same times as SyncedTrace does without the backward
+    amortization. Times of a process are split into segments, each segment
+    starts by a receive event. For an event j of the segment started by
+    the receive K, the corrected time is
+
+        max(x_K + P_j, Q_j)
+
+    where x_K is the corrected time of the receive and P, Q depend only on raw
+    times of the process, so they are computed for all events at once. The
+    corrected time of a receive is
+
+        x_K = max(sent + min_msg_delay, x_prev + A_K, B_K)
+
+    where x_prev is the time of the previous receive of the process and A, B
+    are again computed at once. Only this recurrence over receives is
+    evaluated one by one, in the order given by messages.
+
+    P, Q, A and B of different processes are independent, so they can be
+    computed in a pool of worker processes. The recurrence needs only a few
+    scalar operations per message, it stays in the calling process; sending
+    each message time between workers would cost more than computing it.
+"""
+
+import multiprocessing as mp
+import numpy as np
+
+# "Minus infinity" of corrected times, small enough to lose every maximum
+# and big enough not to overflow when a time is added
+NEG = -2 ** 61
+
+
+class SyncError(Exception):
+
+    """ Raised when times cannot be computed by the vectorized engine, the
+        replay of traces has to be used instead """
+    pass
+
+
+class ProcessTimes(object):
+
+    """ Timestamps of one process prepared for the synchronization.
+
+        Attributes:
+        raw -- raw times of all records with a timestamp (int64), with
+               corrections of the clock drift
+        pointers -- pointers to the record type chars
+        segments -- for each record, the number of receives up to the record
+                    (inclusive)
+        receives -- indexes of receive records
+        p, q -- see the module docstring
+        a, b -- see the module docstring, one value per receive
+        x -- corrected times of receives, x[0] is NEG
+    """
+
+    def __init__(self, times, time_offset, minimal_event_diff,
+                 forward_amort, corrections=None):
+        """ Initialization.
+
+            Arguments:
+            times -- records of the trace as returned by decode_times
+            time_offset -- the initial time offset of the trace
+            minimal_event_diff -- see the SyncedTraceLog class
+            forward_amort -- see the SyncedTraceLog class
+            corrections -- if not None, corrections of the clock drift
+                           added to the raw times
+        """
+        d = minimal_event_diff
+        raw = times["time"].astype(np.int64)
+        if corrections is not None:
+            raw += corrections
+        is_receive = times["type"] == "R"
+        index = np.arange(len(raw), dtype=np.int64)
+        segments = np.cumsum(is_receive)
+        receives = np.flatnonzero(is_receive)
+
+        self.raw = raw
+        self.pointers = times["pointer"]
+        self.segments = segments
+        self.receives = receives
+
+        # Events before the first receive are shifted only by time_offset
+        p = np.empty(len(raw), dtype=np.int64)
+        q = np.empty(len(raw), dtype=np.int64)
+        first = segments == 0
+        p[first] = NEG
+        q[first] = index[first] * d + np.maximum.accumulate(
+            raw[first] + time_offset - index[first] * d)
+
+        # Each later segment is anchored to its receive
+        rest = ~first
+        anchor = receives[segments[rest] - 1]
+        if forward_amort:
+            # The time offset follows the corrected time of the receive
+            p[rest] = index[rest] * d - raw[anchor] + \
+                _segmented_cummax(raw[rest] - index[rest] * d, anchor)
+            q[rest] = NEG
+        else:
+            p[rest] = (index[rest] - anchor) * d
+            # Without the receive itself, its time is already in P
+            inner = rest & ~is_receive
+            anchor = receives[segments[inner] - 1]
+            q[inner] = index[inner] * d + _segmented_cummax(
+                raw[inner] + time_offset - index[inner] * d, anchor)
+            q[receives] = NEG
+        self.p = p
+        self.q = q
+
+        a = np.zeros(len(receives), dtype=np.int64)
+        b = raw[receives] + time_offset
+        if len(receives):
+            if receives[0] > 0:
+                b[0] = max(b[0], q[receives[0] - 1] + d)
+            previous = receives[1:] - 1
+            if forward_amort:
+                a[1:] = np.maximum(raw[receives[1:]] - raw[receives[:-1]],
+                                   p[previous] + d)
+                b[1:] = NEG
+            else:
+                a[1:] = p[previous] + d
+                b[1:] = np.maximum(b[1:], q[previous] + d)
+        self.a = a.tolist()
+        self.b = b.tolist()
+        self.x = [ NEG ]
+
+    def is_finished(self):
+        return len(self.x) > len(self.receives)
+
+    def get_times(self):
+        """ Returns corrected times of all records """
+        x = np.array(self.x, dtype=np.int64)[self.segments]
+        times = np.maximum(x + self.p, self.q)
+        times[self.receives] = x[self.receives]
+        return times
+
+
+def synchronize(traces, index, minimal_event_diff, minimum_msg_delay,
+                forward_amort, jobs=1, clock_drift=None):
+    """ Computes corrected times of all records of traces.
+
+        Returns a list of ProcessTimes, call get_times() to obtain the times.
+        Raises SyncError if times cannot be computed this way, i.e. when an
+        event gets time 0 (SyncedTrace does not apply the minimal difference
+        after such event).
+
+        Only ProcessTimes are created in the pool of workers. The recurrence
+        over receives (_correct_receives) and the final times are always
+        computed in the calling process, so jobs do not speed them up.
+
+        Arguments:
+        traces -- list of Trace objects with initial time offsets
+        index -- MessageIndex of the traces
+        minimal_event_diff -- see the SyncedTraceLog class
+        minimum_msg_delay -- see the SyncedTraceLog class
+        forward_amort -- see the SyncedTraceLog class
+        jobs -- number of worker processes creating ProcessTimes, None means
+                one per CPU
+        clock_drift -- ClockDrift applied to raw times, or None
+    """
+    args = []
+    for trace, times in zip(traces, index.times):
+        corrections = None
+        if clock_drift is not None:
+            corrections = clock_drift.get_corrections(trace.process_id,
+                                                      times["time"])
+        args.append((times, trace.time_offset, minimal_event_diff,
+                     forward_amort, corrections))
+    if jobs == 1 or len(args) < 2:
+        processes = map(_create_process_times, args)
+    else:
+        pool = mp.Pool(jobs)
+        try:
+            processes = pool.map(_create_process_times, args)
+        finally:
+            pool.close()
+            pool.join()
+
+    sent = [ _get_sent_messages(processes, index, process_id)
+             for process_id in xrange(len(processes)) ]
+    _correct_receives(processes, sent, minimum_msg_delay)
+
+    for process in processes:
+        times = process.get_times()
+        if (times[:-1] == 0).any():
+            raise SyncError("An event has time 0")
+    return processes
+
+def _create_process_times(args):
+    """ Creates ProcessTimes, also in a worker process of synchronize """
+    return ProcessTimes(*args)
+
+def _get_sent_messages(processes, index, process_id):
+    """ Returns lists (senders, segments, p, q) describing sends of messages
+        received by the process, one item per receive. The send time is
+        max(x[segment] + p, q) where x are corrected receive times of the
+        sender.
+    """
+    messages = index.get_received_messages(process_id)
+    senders = messages["sender"]
+    sends = messages["send"]
+    segments = np.empty(len(messages), dtype=np.int64)
+    p = np.empty(len(messages), dtype=np.int64)
+    q = np.empty(len(messages), dtype=np.int64)
+    for sender in np.unique(senders):
+        selected = senders == sender
+        records = sends[selected]
+        segments[selected] = processes[sender].segments[records]
+        p[selected] = processes[sender].p[records]
+        q[selected] = processes[sender].q[records]
+    return senders.tolist(), segments.tolist(), p.tolist(), q.tolist()
+
+def _segmented_cummax(values, starts):
+    """ Returns the running maximum of values restarted whenever the value
+        in starts changes (starts have to be non-decreasing) """
+    if len(values) == 0:
+        return values
+    # Lift each segment above all previous ones, then one running maximum
+    # is enough
+    low = values.min()
+    high = values.max()
+    step = high - low + 1
+    group = np.cumsum(np.r_[0, np.diff(starts) != 0])
+    if np.log2(float(step)) + np.log2(float(group[-1] + 1)) < 62:
+        lifted = (values - low) + group * step
+        return np.maximum.accumulate(lifted) - group * step + low
+    result = np.empty_like(values)
+    bounds = np.r_[0, np.flatnonzero(np.diff(group)) + 1, len(values)]
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        result[begin:end] = np.maximum.accumulate(values[begin:end])
+    return result
+
+def _correct_receives(processes, sent, minimum_msg_delay):
+    """ Computes corrected times of receives. A process is processed until it
+        reaches a receive whose message has not been sent yet, then the
+        sender continues. """
+    unfinished = [ i for i, process in enumerate(processes)
+                   if not process.is_finished() ]
+    current = unfinished[0] if unfinished else None
+    blocked = 0
+    while unfinished:
+        process = processes[current]
+        x = process.x
+        a = process.a
+        b = process.b
+        senders, segments, p, q = sent[current]
+        count = len(senders)
+        while len(x) <= count:
+            m = len(x) - 1
+            sender_x = processes[senders[m]].x
+            segment = segments[m]
+            if segment >= len(sender_x):
+                break
+            sent_time = max(sender_x[segment] + p[m], q[m])
+            x.append(max(sent_time + minimum_msg_delay, x[m] + a[m], b[m]))
+            blocked = 0
+        if process.is_finished():
+            unfinished.remove(current)
+            if unfinished:
+                current = unfinished[0]
+        else:
+            blocked += 1
+            if blocked > len(processes):
+                raise Exception("Messages are received before they are sent")
+            current = senders[len(x) - 1]
@@ -21,6 +21,17 @@ import numpy as np
 
 class Table(object):
 
+    """ A table stored by columns. Values of each column are appended into
+    chunks of fixed size, so the table grows without copying of already
+    stored rows. Each chunk of a column has a validity bitmap (packed bits,
+    or None when all values are valid); invalid values are shown as None.
+    Chunks are joined into one array per column when the table is read;
+    only chunks added since the last read are copied.
+    """
+
+    # Maximal number of rows in one chunk
+    chunk_size = 65536
+
     def __init__(self, columns, rows_number=10, init_data=True):
         """ An initialization of a table.
         Note: there should not be used general PyObject type ('O' description),
@@ -34,13 +45,27 @@ class Table(object):
         self.columns_number = len(columns)
         if not columns:
             self.header, self.types = [], []
-            columns = None
         else:
             self.header, self.types = map(list, zip(*columns))
-        self.rows_number = rows_number
-        if init_data:
-            self.data = np.ma.zeros((self.rows_number,), dtype=columns)
+        self.dtypes = [ np.dtype(t) for t in self.types ]
+        self.rows_number = max(1, min(rows_number, self.chunk_size))
 
+        # Full chunks of columns and their validity bitmaps
+        self._chunks = [ [] for i in xrange(self.columns_number) ]
+        self._bitmaps = [ [] for i in xrange(self.columns_number) ]
+        self._chunk_lengths = []
+        # The last chunk that is filled by add_row; it is allocated when the
+        # first row is added
+        self._tail = None
+        self._tail_valid = None
+        self._tail_length = 0
+        # Joined chunks: arrays of columns and their validity (boolean arrays,
+        # None when all values are valid), both may be longer than the table
+        self._columns = [ None ] * self.columns_number
+        self._validity = [ None ] * self.columns_number
+        self._length = 0
+
+        self._data = None
         self.last_row_index = 0
 
     @classmethod
@@ -48,17 +73,23 @@ class Table(object):
         assert isinstance(data, np.ma.core.MaskedArray), \
             "The data must be of numpy masked array type."
 
-        columns = data.dtype.descr
-        rows_number = len(data)
-        t = Table(columns, rows_number)
-        if isinstance(data, np.ma.core.MaskedArray):
-            t.data = data
+        mask = np.ma.getmaskarray(data)
+        if data.dtype.names is None:
+            t = Table([ ("V 1", data.dtype.str) ], len(data))
+            t.append_columns([ data.data ], [ ~mask ])
         else:
-            t.data = np.ma.zeros((rows_number,), dtype=columns)
-            t.data.data = data
-        t.last_row_index = rows_number
+            t = Table(data.dtype.descr, len(data))
+            t.append_columns([ data.data[name] for name in data.dtype.names ],
+                             [ ~mask[name] for name in data.dtype.names ])
         return t
 
+    @property
+    def data(self):
+        """ The table as a numpy masked record array """
+        if self._data is None:
+            self._data = self._create_array(range(self.columns_number))
+        return self._data
+
     def __getitem__(self, key):
         return self.data[key]
 
@@ -67,22 +98,20 @@ class Table(object):
 
     def __iter__(self):
         self._index = 0
+        self._iter_columns = [ (self.get_column(i), self._get_validity(i))
+                               for i in xrange(self.columns_number) ]
         return self
 
     def next(self):
         if self._index == self.last_row_index:
+            self._iter_columns = None
             raise StopIteration
 
-        # returns modified data; masked values are replaced by None
-        data, mask = self.data.data[self._index], self.data.mask[self._index]
-        try:
-            ndata, nmask = iter(data), iter(mask)
-            raw_data = zip(data, mask)
-        except TypeError:
-            # data and mask are both one element
-            raw_data = [(data, mask)]
-
-        row = [None if masked else item for item, masked in raw_data]
+        # masked values are replaced by None
+        index = self._index
+        row = [ None if valid is not None and not valid[index]
+                     else values[index]
+                for values, valid in self._iter_columns ]
 
         self._index += 1
         return row
@@ -92,23 +121,90 @@ class Table(object):
         assert len(row) == self.columns_number, \
                "The row has to have the same length as the table has columns."
 
-        if self.last_row_index >= self.rows_number: # resize
-            self.rows_number *= 2
-            self.data = np.ma.resize(self.data, self.rows_number)
+        if self._tail is None or self._tail_length == self._tail_valid.shape[1]:
+            self._grow_tail()
 
-        for i, item in enumerate(row): # append row
+        index = self._tail_length
+        for values, valid, item in zip(self._tail, self._tail_valid, row):
             if item is None: # invalid values
-                self.data.mask[self.last_row_index][i] = True
+                valid[index] = False
             else:
-                self.data.mask[self.last_row_index][i] = False
-                self.data.data[self.last_row_index][i] = item
+                valid[index] = True
+                values[index] = item
+        self._tail_length += 1
         self.last_row_index += 1
+        self._data = None
+
+    def append_columns(self, columns, validity=None):
+        """ Appends rows given by whole columns. Arrays that already have the
+        type of the column are stored without copying.
+
+        Arguments:
+        columns -- a list of arrays (one for each column, all of the same
+        length) or a dictionary column name -> array
+        validity -- None (all values are valid) or a list/dictionary of
+        boolean arrays (or None) in the same form as columns
+        """
+        columns = self._get_columns_list(columns)
+        if validity is None:
+            validity = [ None ] * self.columns_number
+        else:
+            validity = self._get_columns_list(validity)
+        columns = [ np.asarray(values, dtype=dtype)
+                    for values, dtype in zip(columns, self.dtypes) ]
+        lengths = set(len(values) for values in columns)
+        assert len(lengths) <= 1, "All columns must have the same length."
+        length = lengths.pop() if lengths else 0
+        if length == 0:
+            return
+
+        self._seal_tail()
+        for i, (values, valid) in enumerate(zip(columns, validity)):
+            self._chunks[i].append(values)
+            self._bitmaps[i].append(self._pack_validity(valid, length))
+        self._chunk_lengths.append(length)
+        self.last_row_index += length
+        self._data = None
 
     def trim(self):
-        self.data = np.ma.resize(self.data, self.last_row_index)
+        """ Releases unused memory of the last chunk and of joined columns """
+        self._seal_tail(True)
+        length = self._length
+        for i in xrange(self.columns_number):
+            if self._columns[i] is not None and len(self._columns[i]) > length:
+                self._columns[i] = self._columns[i][:length].copy()
+            if self._validity[i] is not None and \
+                    len(self._validity[i]) > length:
+                self._validity[i] = self._validity[i][:length].copy()
+
+    def clear(self):
+        """ Removes all rows """
+        self._chunks = [ [] for i in xrange(self.columns_number) ]
+        self._bitmaps = [ [] for i in xrange(self.columns_number) ]
+        self._chunk_lengths = []
+        self._tail_length = 0
+        self._columns = [ None ] * self.columns_number
+        self._validity = [ None ] * self.columns_number
+        self._length = 0
+        self.last_row_index = 0
+        self._data = None
 
     def get_column(self, column):
-        return self.data.data[self._get_colum_name(column)]
+        """ Returns values of the column as one numpy array. The array is
+        shared with the table (values of invalid rows are undefined).
+        """
+        index = self._get_column_index(column)
+        self._consolidate()
+        if self._columns[index] is not None:
+            return self._columns[index][:self._length]
+        return np.zeros(0, dtype=self.dtypes[index])
+
+    def get_column_validity(self, column):
+        """ Returns a boolean array, True for valid values of the column """
+        valid = self._get_validity(self._get_column_index(column))
+        if valid is None:
+            return np.ones(self.last_row_index, dtype=bool)
+        return valid.copy()
 
     def select(self, columns=None, filters=[]):
         """ Select columns and filter data.
@@ -119,29 +215,287 @@ class Table(object):
         index of column, the second one is a compare function, and the last
         is compared value.
         """
-        if columns is not None:
+        single = False
+        if columns is None:
+            indexes = range(self.columns_number)
+        else:
             if not isinstance(columns, list):
                 columns = [columns]
-            columns = [self._get_colum_name(column) for column in columns]
+            indexes = [ self._get_column_index(column) for column in columns ]
+            single = len(indexes) == 1
+
+        rows = self._filter_rows(filters)
+        result = self._create_array(indexes, rows)
+        if single:
+            return result[self.header[indexes[0]]]
+        return result
+
+    def filter(self, filters, columns=None):
+        """ Returns a new table with rows that pass all filters.
+
+        Arguments:
+        filters -- a list of triples as in the select method
+        columns -- a list of names or indexes of columns of the new table,
+        all columns by default
+        """
+        if columns is None:
+            indexes = range(self.columns_number)
+        else:
+            indexes = [ self._get_column_index(column) for column in columns ]
+        rows = self._filter_rows(filters)
+        t = Table([ (self.header[i], self.types[i]) for i in indexes ],
+                  len(rows))
+        validity = [ self._get_validity(i) for i in indexes ]
+        t.append_columns(
+            [ self.get_column(i)[rows] for i in indexes ],
+            [ valid[rows] if valid is not None else None
+              for valid in validity ])
+        return t
+
+    def group_by(self, keys, columns=None, filters=[], groups=None):
+        """ Splits filtered rows into groups by values of key columns in one
+        pass (rows are sorted by keys, the order of rows within a group is
+        kept). Rows with an invalid key value are skipped.
+
+        Returns a dictionary: key value (a tuple if there are more key
+        columns) -> data of the group in the same form as the select method
+        returns.
+
+        Arguments:
+        keys -- a name or index of the key column or a list of them
+        columns -- a list of names or indexes of columns
+        filters -- a list of triples as in the select method
+        groups -- an optional list of key values; the dictionary contains
+        exactly these groups, groups without rows are empty
+        """
+        single_key = not isinstance(keys, list)
+        rows, starts, values = self._group_rows(keys, filters)
 
+        single = False
+        if columns is None:
+            indexes = range(self.columns_number)
+        else:
+            if not isinstance(columns, list):
+                columns = [columns]
+            indexes = [ self._get_column_index(column) for column in columns ]
+            single = len(indexes) == 1
+        data = self._create_array(indexes, rows)
+        if single:
+            data = data[self.header[indexes[0]]]
+
+        result = {}
+        ends = starts[1:] + [ len(rows) ]
+        for key, start, end in zip(values, starts, ends):
+            if single_key:
+                key = key[0]
+            result[key] = data[start:end]
+        if groups is not None:
+            result = dict((key, result.get(key, data[0:0])) for key in groups)
+        return result
+
+    def aggregate(self, keys, column, function=np.add, filters=[]):
+        """ Aggregates valid values of the column in groups of rows given by
+        values of key columns.
+
+        Returns a dictionary: key value (a tuple if there are more key
+        columns) -> function.reduce of values in the group.
+
+        Arguments:
+        keys -- a name or index of the key column or a list of them
+        column -- a name or index of the aggregated column
+        function -- numpy ufunc (np.add, np.maximum, np.minimum, ...)
+        filters -- a list of triples as in the select method
+        """
+        index = self._get_column_index(column)
+        single_key = not isinstance(keys, list)
+        rows, starts, values = self._group_rows(keys, filters, [ index ])
+        if not starts:
+            return {}
+        results = function.reduceat(self.get_column(index)[rows], starts)
+        if single_key:
+            values = [ key[0] for key in values ]
+        return dict(zip(values, results.tolist()))
+
+    def _group_rows(self, keys, filters, valid_columns=()):
+        """ Returns indexes of filtered rows sorted by keys, starts of groups
+        and values of keys (tuples) of groups """
+        if not isinstance(keys, list):
+            keys = [keys]
+        keys = [ self._get_column_index(key) for key in keys ]
+        rows = self._filter_rows(filters, keys + list(valid_columns))
+
+        key_values = [ self.get_column(key)[rows] for key in keys ]
+        # lexsort is stable and the last key is the primary one
+        order = np.lexsort(key_values[::-1])
+        rows = rows[order]
+        key_values = [ values[order] for values in key_values ]
+
+        change = np.zeros(len(rows), dtype=bool)
+        if len(rows):
+            change[0] = True
+        for values in key_values:
+            change[1:] |= values[1:] != values[:-1]
+        starts = np.flatnonzero(change)
+        keys = zip(*[ values[starts].tolist() for values in key_values ])
+        return rows, starts.tolist(), keys
+
+    def _filter_rows(self, filters, valid_columns=()):
+        """ Returns indexes of rows that pass all filters; each filter is
+        evaluated over the whole column, invalid values never pass. Rows
+        with invalid values in valid_columns are also removed.
+        """
         if not isinstance(filters, list):
             filters = [filters]
 
-        mask = np.ma.ones(self.last_row_index, dtype='bool')
+        mask = np.ones(self.last_row_index, dtype=bool)
+        indexes = list(valid_columns)
         for col, f_cmp, value in filters:
-            mask &= f_cmp(self.data[self._get_colum_name(col)], value)
+            index = self._get_column_index(col)
+            mask &= np.asarray(f_cmp(self.get_column(index), value), dtype=bool)
+            indexes.append(index)
+        for index in set(indexes):
+            valid = self._get_validity(index)
+            if valid is not None:
+                mask &= valid
+        return np.flatnonzero(mask)
 
-        if columns is None:
-            return self.data[mask]
-        elif len(columns) == 1:
-            columns = columns[0]
-        return self.data[mask][columns]
+    def _create_array(self, indexes, rows=None):
+        """ Returns a masked record array of the columns """
+        if not indexes:
+            return np.ma.zeros((self.last_row_index,))
+        dtype = [ (self.header[i], self.types[i]) for i in indexes ]
+        length = self.last_row_index if rows is None else len(rows)
+        data = np.zeros(length, dtype=dtype)
+        mask = np.zeros(length, dtype=np.ma.make_mask_descr(data.dtype))
+        for i in indexes:
+            name = self.header[i]
+            values = self.get_column(i)
+            valid = self._get_validity(i)
+            if rows is not None:
+                values = values[rows]
+                if valid is not None:
+                    valid = valid[rows]
+            data[name] = values
+            if valid is not None:
+                mask[name] = ~valid
+        return np.ma.masked_array(data, mask=mask)
+
+    def _get_validity(self, index):
+        """ Returns None if all values of the column are valid, otherwise
+        a boolean array """
+        self._consolidate()
+        if self._validity[index] is None:
+            return None
+        return self._validity[index][:self._length]
+
+    def _grow_tail(self):
+        """ Doubles the last chunk up to the chunk size, a full chunk is
+        sealed and a new one is started """
+        if self._tail is None:
+            size = self.rows_number
+        elif self._tail_valid.shape[1] < self.chunk_size:
+            size = min(2 * self._tail_valid.shape[1], self.chunk_size)
+        else:
+            self._seal_tail()
+            size = self.chunk_size
+        tail = [ np.zeros(size, dtype=dtype) for dtype in self.dtypes ]
+        tail_valid = np.ones((self.columns_number, size), dtype=bool)
+        if self._tail is not None:
+            length = self._tail_length
+            for values, old in zip(tail, self._tail):
+                values[:length] = old[:length]
+            tail_valid[:, :length] = self._tail_valid[:, :length]
+        self._tail = tail
+        self._tail_valid = tail_valid
+
+    def _seal_tail(self, release=False):
+        """ Moves filled rows of the last chunk among full chunks """
+        length = self._tail_length
+        if length == 0:
+            if release:
+                self._tail = self._tail_valid = None
+            return
+        for i in xrange(self.columns_number):
+            values = self._tail[i][:length]
+            self._chunks[i].append(values.copy() if release else values)
+            self._bitmaps[i].append(
+                self._pack_validity(self._tail_valid[i][:length], length))
+        self._chunk_lengths.append(length)
+        # Sealed arrays are shared, a new last chunk is allocated when needed
+        self._tail = self._tail_valid = None
+        self._tail_length = 0
+
+    def _consolidate(self):
+        """ Appends chunks added since the last call to joined columns. The
+        columns grow twice when they are full, so reads interleaved with
+        appends do not copy the whole table each time.
+        """
+        self._seal_tail()
+        if not self._chunk_lengths:
+            return
+        start = self._length
+        length = start + sum(self._chunk_lengths)
+        for i in xrange(self.columns_number):
+            chunks, bitmaps = self._chunks[i], self._bitmaps[i]
+            if start == 0 and len(chunks) == 1:
+                # A single chunk is used without copying
+                self._columns[i] = chunks[0]
+            else:
+                self._columns[i] = self._reserve(self._columns[i], start,
+                                                 length, self.dtypes[i])
+                np.concatenate(chunks, out=self._columns[i][start:length])
 
-    def _get_colum_name(self, column):
+            valid = self._validity[i]
+            if valid is None and all(bitmap is None for bitmap in bitmaps):
+                continue
+            if valid is None:
+                valid = np.ones(start, dtype=bool)
+            valid = self._reserve(valid, start, length, bool)
+            position = start
+            for bitmap, n in zip(bitmaps, self._chunk_lengths):
+                if bitmap is None:
+                    valid[position:position + n] = True
+                else:
+                    valid[position:position + n] = np.unpackbits(bitmap)[:n]
+                position += n
+            self._validity[i] = valid
+        self._chunks = [ [] for i in xrange(self.columns_number) ]
+        self._bitmaps = [ [] for i in xrange(self.columns_number) ]
+        self._chunk_lengths = []
+        self._length = length
+
+    def _reserve(self, array, used, length, dtype):
+        """ Returns the array or its larger copy that has at least length
+        items, the first 'used' items are kept """
+        if array is not None and len(array) >= length:
+            return array
+        size = length if array is None else max(length, 2 * len(array))
+        result = np.empty(size, dtype=dtype)
+        if used:
+            result[:used] = array[:used]
+        return result
+
+    def _pack_validity(self, valid, length):
+        if valid is None:
+            return None
+        valid = np.asarray(valid, dtype=bool)
+        assert len(valid) == length, \
+            "Validity has to have the same length as the column."
+        if valid.all():
+            return None
+        return np.packbits(valid)
+
+    def _get_columns_list(self, columns):
+        if isinstance(columns, dict):
+            return [ columns.get(name) for name in self.header ]
+        assert len(columns) == self.columns_number, \
+            "The number of columns does not match the table."
+        return list(columns)
+
+    def _get_column_index(self, column):
         if isinstance(column, int) and 0 <= column < self.columns_number:
-            return self.header[column]
-        elif column in self.header:
             return column
+        elif column in self.header:
+            return self.header.index(column)
         else:
             raise Exception("Invalid '{0}' column.".format(column))
-
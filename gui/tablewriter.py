@@ -0,0 +1,190 @@
+#
+#    Copyright (C) 2016 Kaira contributors
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import csv
+import os
+import struct
+import numpy as np
+
+
+class TableWriter(object):
+
+    """ Writes rows of a table into a file chunk by chunk, so the whole
+        table never has to be in memory.
+    """
+
+    def __init__(self, filename, columns):
+        """ Initialization.
+
+        Arguments:
+        filename -- a path to the output file
+        columns -- a list of couples (name, data type) as in Table
+        """
+        self.filename = filename
+        if columns:
+            self.header, self.types = map(list, zip(*columns))
+        else:
+            self.header, self.types = [], []
+        self.rows = 0
+        self.closed = False
+
+    def write(self, data):
+        """ Writes a chunk of rows.
+
+        Arguments:
+        data -- numpy masked array with the columns of the writer
+        """
+        self._write(data)
+        self.rows += len(data)
+
+    def close(self):
+        """ Finishes and closes the output file, repeated calls are ignored """
+        if not self.closed:
+            self.closed = True
+            self._close()
+
+    def _write(self, data):
+        pass
+
+    def _close(self):
+        pass
+
+
+class CsvTableWriter(TableWriter):
+
+    """ Writes a table in the same form as the CSV store of Table sources.
+        Masked values are written as empty cells.
+    """
+
+    def __init__(self, filename, columns, delimiter=",", quotechar="\"",
+                 has_header=True, has_types=True):
+        TableWriter.__init__(self, filename, columns)
+        self.file = open(filename, "w")
+        self.writer = csv.writer(
+            self.file, delimiter=delimiter, quotechar=quotechar)
+        if has_types:
+            self.writer.writerow(self.types)
+        if has_header:
+            self.writer.writerow(self.header)
+
+    def _write(self, data):
+        writerow = self.writer.writerow
+        for row, mask in zip(data.data, np.ma.getmaskarray(data)):
+            writerow([ None if masked else item
+                       for item, masked in zip(row, mask) ])
+
+    def _close(self):
+        self.file.close()
+
+
+class NpyTableWriter(TableWriter):
+
+    """ Writes a table as a structured NumPy array (*.npy). The mask of
+        invalid values is written into a file with the suffix '.mask.npy'
+        instead of '.npy', so the table can be loaded as
+        np.ma.masked_array(np.load(filename), mask=np.load(mask_filename)).
+        Both files are written progressively, the shape in their headers is
+        filled when the writer is closed.
+    """
+
+    def __init__(self, filename, columns):
+        TableWriter.__init__(self, filename, columns)
+        self.dtype = np.dtype(columns)
+        self.mask_dtype = np.ma.make_mask_descr(self.dtype)
+        self.mask_filename = get_mask_filename(filename)
+        self.file = open(filename, "wb")
+        try:
+            self.mask_file = open(self.mask_filename, "wb")
+        except:
+            self.file.close()
+            raise
+        self._write_headers()
+
+    def _write(self, data):
+        data = np.ma.asarray(data)
+        self.file.write(data.data.astype(self.dtype).tobytes())
+        self.mask_file.write(
+            np.ma.getmaskarray(data).astype(self.mask_dtype).tobytes())
+
+    def _close(self):
+        try:
+            self._write_headers()
+        finally:
+            self.file.close()
+            self.mask_file.close()
+
+    def _write_headers(self):
+        for f, dtype in ((self.file, self.dtype),
+                         (self.mask_file, self.mask_dtype)):
+            # The header is reserved for the maximal number of rows
+            size = len(npy_header(dtype, 2 ** 64))
+            position = f.tell()
+            f.seek(0)
+            f.write(npy_header(dtype, self.rows, size))
+            if position > 0:
+                f.seek(position)
+
+
+def get_mask_filename(filename):
+    """ Returns the name of the file with the mask of a npy table """
+    base, suffix = os.path.splitext(filename)
+    return base + ".mask" + suffix
+
+def remove_files(format, filename):
+    """ Removes files written by a writer of the format, e.g. after a failed
+        export; missing files are skipped """
+    filenames = [ filename ]
+    if format == "npy":
+        filenames.append(get_mask_filename(filename))
+    for f in filenames:
+        if os.path.isfile(f):
+            os.remove(f)
+
+def npy_header(dtype, rows, size=None):
+    """ Returns a header of npy file (format version 1.0). The header is
+        padded to the given size (or to a multiple of 64 bytes), so it can be
+        rewritten when the number of rows is known.
+    """
+    header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': ({1},), }}" \
+        .format(np.lib.format.dtype_to_descr(dtype), rows)
+    prefix = len(np.lib.format.magic(1, 0)) + 2
+    if size is None:
+        size = (prefix + len(header) + 1 + 63) // 64 * 64
+    length = size - prefix
+    if len(header) + 1 > length or length > 65535:
+        raise Exception("Data type is too large for the npy header")
+    header = header.ljust(length - 1) + "\n"
+    return np.lib.format.magic(1, 0) + struct.pack("<H", length) + header
+
+def create_writer(format, filename, columns, settings=None):
+    """ Creates a writer for the format.
+
+    Arguments:
+    format -- "csv" or "npy"
+    filename -- a path to the output file
+    columns -- a list of couples (name, data type)
+    settings -- CSV settings (delimiter, quotechar, has_header, has_types)
+    """
+    if format == "csv":
+        if settings is None:
+            return CsvTableWriter(filename, columns)
+        return CsvTableWriter(filename, columns, *settings)
+    elif format == "npy":
+        return NpyTableWriter(filename, columns)
+    raise Exception("Unknown table format '{0}'".format(format))
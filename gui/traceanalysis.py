@@ -0,0 +1,395 @@
+#
+#    Copyright (C) 2016 Kaira contributors
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Timestamp analysis of tracelogs shared by the verifier and the
+    comparator. Everything is computed from a MessageIndex in one pass over
+    the times of its records, the results are NumPy arrays.
+"""
+
+import numpy as np
+from table import Table
+
+# Percentiles of message delays reported by the verifier
+delay_percentiles = (50, 99, 99.9)
+
+
+class TraceAnalysis(object):
+
+    """ Statistics of times of one tracelog.
+
+        Attributes:
+        first_times -- for each process, the time of its first record
+        last_times -- for each process, the latest time of its records
+        idle_times -- for each process, the total time spent in idle events
+        idle_counts -- for each process, the number of idle events
+        send_intervals -- intervals between sends (M records) and records
+                          following them, of all processes one after another
+        send_bounds -- send_intervals[send_bounds[p]:send_bounds[p + 1]]
+                       belong to the process p
+        send_times -- send times of all messages of the index
+        receive_times -- receive times of all messages of the index
+        senders, receivers -- processes of all messages of the index
+    """
+
+    def __init__(self, index, time_offsets):
+        """ Initialization.
+
+            Arguments:
+            index -- MessageIndex of the tracelog
+            time_offsets -- list of time offsets of traces
+        """
+        count = len(index.times)
+        self.first_times = np.zeros(count, dtype=np.int64)
+        self.last_times = np.zeros(count, dtype=np.int64)
+        self.idle_times = np.zeros(count, dtype=np.int64)
+        self.idle_counts = np.zeros(count, dtype=np.int64)
+        self.send_bounds = np.zeros(count + 1, dtype=np.int64)
+        send_intervals = []
+        has_times = np.zeros(count, dtype=bool)
+        for process_id in xrange(count):
+            times = index.get_times(process_id, time_offsets[process_id])
+            if len(times) == 0:
+                send_intervals.append(times)
+                self.send_bounds[process_id + 1] = self.send_bounds[process_id]
+                continue
+            has_times[process_id] = True
+            self.first_times[process_id] = times[0]
+            self.last_times[process_id] = times.max()
+            # Each interval belongs to the type of the event it starts with
+            intervals = np.diff(times)
+            previous = index.times[process_id]["type"][:-1]
+            idle = intervals[previous == "I"]
+            self.idle_times[process_id] = idle.sum()
+            self.idle_counts[process_id] = len(idle)
+            sends = intervals[previous == "M"]
+            send_intervals.append(sends)
+            self.send_bounds[process_id + 1] = \
+                self.send_bounds[process_id] + len(sends)
+        self.send_intervals = np.concatenate(send_intervals) \
+            if send_intervals else np.zeros(0, dtype=np.int64)
+        self._has_times = has_times
+        self.send_times, self.receive_times = \
+            index.get_message_times(time_offsets)
+        self.senders = index.messages["sender"]
+        self.receivers = index.messages["receiver"]
+        self._sketch = None
+
+    def get_execution_time(self):
+        """ Returns the time from the first to the last record """
+        if not self._has_times.any():
+            return 0
+        return int(self.last_times[self._has_times].max() -
+                   self.first_times[self._has_times].min())
+
+    def get_idle_time(self):
+        return int(self.idle_times.sum())
+
+    def get_idle_average(self):
+        """ Returns the average length of idle events (rounded down) """
+        count = int(self.idle_counts.sum())
+        if count == 0:
+            return 0
+        return self.get_idle_time() // count
+
+    def get_message_delays(self):
+        """ Returns receive time minus send time for all messages """
+        return self.receive_times - self.send_times
+
+    def get_violations(self):
+        """ Returns a tuple (number of messages, number of clock condition
+            violations, maximum delay, average delay); the delays are how
+            much earlier than sent the violated messages were received
+        """
+        delays = -self.get_message_delays()
+        delays = delays[delays > 0]
+        if len(delays) == 0:
+            return (len(self.send_times), 0, 0, 0)
+        return (len(self.send_times), len(delays), int(delays.max()),
+                int(delays.sum()) // len(delays))
+
+    def get_delay_sketch(self, chunk_size=1 << 20):
+        """ Returns DelaySketch of message delays of links, messages are
+            added in chunks, so no array of all delays is created.
+
+            Arguments:
+            chunk_size -- the number of messages added at once
+        """
+        if self._sketch is None:
+            sketch = DelaySketch()
+            process_count = len(self.first_times)
+            for start in xrange(0, len(self.send_times), chunk_size):
+                end = start + chunk_size
+                links = self.senders[start:end].astype(np.int64) * \
+                    process_count + self.receivers[start:end]
+                sketch.add(links, self.receive_times[start:end] -
+                                  self.send_times[start:end])
+            self._sketch = sketch
+        return self._sketch
+
+    def get_delay_percentiles(self, percentiles=delay_percentiles):
+        """ Returns a list of percentiles of message delays, the error is
+            at most the relative accuracy of DelaySketch
+
+            Arguments:
+            percentiles -- sequence of percentiles in the range 0-100
+        """
+        sketch = self.get_delay_sketch().merge_links()
+        if len(sketch.links) == 0:
+            return [ 0 ] * len(percentiles)
+        return sketch.get_percentiles(percentiles)[0].tolist()
+
+    def get_link_table(self, percentiles=delay_percentiles):
+        """ Returns Table with statistics of message delays of each couple
+            (sender, receiver) that exchanged a message. The delays are
+            receive times minus send times, a negative delay is a clock
+            condition violation. Percentiles are estimated by DelaySketch,
+            other columns are exact.
+
+            Arguments:
+            percentiles -- sequence of percentiles in the range 0-100
+        """
+        sketch = self.get_delay_sketch()
+        process_count = len(self.first_times)
+
+        columns = [ ("Sender", "<i4"),
+                    ("Receiver", "<i4"),
+                    ("Messages", "<i8"),
+                    ("Violations", "<i8"),
+                    ("Minimum delay [ns]", "<i8") ]
+        columns += [ ("Delay p{0:g} [ns]".format(p), "<i8")
+                     for p in percentiles ]
+        columns.append(("Maximum delay [ns]", "<i8"))
+        data = np.zeros(len(sketch.links), dtype=columns)
+        data["Sender"] = sketch.links // process_count
+        data["Receiver"] = sketch.links % process_count
+        data["Messages"] = sketch.get_counts()
+        data["Violations"] = sketch.get_counts(negative=True)
+        data["Minimum delay [ns]"] = sketch.minimums
+        values = sketch.get_percentiles(percentiles)
+        for i, p in enumerate(percentiles):
+            data["Delay p{0:g} [ns]".format(p)] = values[:, i]
+        data["Maximum delay [ns]"] = sketch.maximums
+        return Table.create_from_data(np.ma.masked_array(data))
+
+
+class DelaySketch(object):
+
+    """ Mergeable histogram of message delays of links (any integer ids,
+        e.g. couples sender, receiver). Buckets grow logarithmically with
+        the absolute value of a delay, so a percentile is estimated with
+        the relative error at most 'accuracy' and the memory depends on
+        the number of links and used buckets (at most about 4400 buckets of
+        a link for the default accuracy), not on the number of messages.
+        Counts of messages, minimums and maximums are exact.
+
+        Attributes:
+        links -- sorted ids of links with a message
+        minimums, maximums -- the minimal and maximal delay of each link
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = np.log(self._gamma)
+        # Buckets of delays -max_bucket .. max_bucket of one link
+        self._max_bucket = int(np.ceil(63 * np.log(2) / self._log_gamma)) + 1
+        self._bucket_count = 2 * self._max_bucket + 1
+        # Sorted keys (link * bucket_count + shifted bucket) and their counts
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self.links = np.zeros(0, dtype=np.int64)
+        self.minimums = np.zeros(0, dtype=np.int64)
+        self.maximums = np.zeros(0, dtype=np.int64)
+
+    def add(self, links, delays):
+        """ Adds delays of messages.
+
+            Arguments:
+            links -- array of non-negative link ids of messages
+            delays -- array of delays of messages
+        """
+        links = np.asarray(links, dtype=np.int64)
+        delays = np.asarray(delays, dtype=np.int64)
+        if len(links) == 0:
+            return
+        keys = links * self._bucket_count + self._get_buckets(delays) + \
+            self._max_bucket
+        keys, counts = np.unique(keys, return_counts=True)
+        self._merge_counts(keys, counts)
+        order = np.argsort(links, kind="mergesort")
+        links = links[order]
+        delays = delays[order]
+        starts = _get_starts(links)
+        self._merge_extremes(links[starts],
+                             np.minimum.reduceat(delays, starts),
+                             np.maximum.reduceat(delays, starts))
+
+    def merge(self, sketch):
+        """ Adds delays of another sketch with the same accuracy """
+        if sketch.accuracy != self.accuracy:
+            raise Exception("Sketches with different accuracies")
+        self._merge_counts(sketch._keys, sketch._counts)
+        self._merge_extremes(sketch.links, sketch.minimums, sketch.maximums)
+
+    def merge_links(self):
+        """ Returns a new sketch where all delays belong to the link 0 """
+        sketch = DelaySketch(self.accuracy)
+        if len(self.links):
+            sketch._merge_counts(self._keys % self._bucket_count,
+                                 self._counts)
+            sketch._merge_extremes(np.zeros(1, dtype=np.int64),
+                                   self.minimums.min(keepdims=True),
+                                   self.maximums.max(keepdims=True))
+        return sketch
+
+    def get_counts(self, negative=False):
+        """ Returns the number of messages of each link; if negative is True,
+            only messages with a negative delay are counted """
+        counts = self._counts
+        if negative:
+            counts = counts * (self._keys % self._bucket_count <
+                               self._max_bucket)
+        return np.add.reduceat(counts, self._get_link_starts()) \
+            if len(counts) else np.zeros(0, dtype=np.int64)
+
+    def get_percentiles(self, percentiles):
+        """ Returns an array with a row of estimated percentiles for each
+            link. The rank of a percentile is the one of the 'lower'
+            interpolation of np.percentile, the value is the middle of its
+            bucket limited by the minimum and the maximum of the link (the
+            first and the last rank are the minimum and the maximum).
+
+            Arguments:
+            percentiles -- sequence of percentiles in the range 0-100
+        """
+        result = np.zeros((len(self.links), len(percentiles)), dtype=np.int64)
+        if len(self.links) == 0:
+            return result
+        starts = self._get_link_starts()
+        cumulative = np.cumsum(self._counts)
+        before = cumulative[starts] - self._counts[starts]
+        totals = np.add.reduceat(self._counts, starts)
+        buckets = self._keys % self._bucket_count - self._max_bucket
+        for i, p in enumerate(percentiles):
+            ranks = np.floor((totals - 1) * (p / 100.0)).astype(np.int64)
+            indexes = np.searchsorted(cumulative, before + ranks, "right")
+            values = np.clip(self._get_values(buckets[indexes]),
+                             self.minimums, self.maximums)
+            # The first and the last delay are known exactly
+            values[ranks == 0] = self.minimums[ranks == 0]
+            values[ranks == totals - 1] = self.maximums[ranks == totals - 1]
+            result[:, i] = values
+        return result
+
+    def _get_buckets(self, delays):
+        """ Returns signed buckets of delays, 0 is the bucket of 0 and the
+            bucket k > 0 holds values from gamma^(k - 2) to gamma^(k - 1) """
+        magnitudes = np.abs(delays).astype(np.float64)
+        buckets = np.zeros(len(delays), dtype=np.int64)
+        nonzero = magnitudes > 0
+        buckets[nonzero] = np.ceil(np.log(magnitudes[nonzero]) /
+                                   self._log_gamma).astype(np.int64) + 1
+        return buckets * np.sign(delays)
+
+    def _get_values(self, buckets):
+        """ Returns the value with the lowest relative error of buckets """
+        magnitudes = np.abs(buckets)
+        values = 2 * self._gamma ** (magnitudes - 1.0) / (self._gamma + 1)
+        values[magnitudes == 0] = 0
+        return (np.round(values) * np.sign(buckets)).astype(np.int64)
+
+    def _get_link_starts(self):
+        return _get_starts(self._keys // self._bucket_count)
+
+    def _merge_counts(self, keys, counts):
+        keys = np.concatenate((self._keys, keys))
+        counts = np.concatenate((self._counts, counts))
+        order = np.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        starts = _get_starts(keys)
+        self._keys = keys[starts]
+        self._counts = np.add.reduceat(counts[order], starts) \
+            if len(keys) else counts
+
+    def _merge_extremes(self, links, minimums, maximums):
+        links = np.concatenate((self.links, links))
+        order = np.argsort(links, kind="mergesort")
+        links = links[order]
+        starts = _get_starts(links)
+        if len(links) == 0:
+            return
+        self.links = links[starts]
+        self.minimums = np.minimum.reduceat(
+            np.concatenate((self.minimums, minimums))[order], starts)
+        self.maximums = np.maximum.reduceat(
+            np.concatenate((self.maximums, maximums))[order], starts)
+
+
+def get_time_offsets(traces, weak_sync):
+    """ Returns initial time offsets of traces.
+
+        Arguments:
+        traces -- list of Trace objects with pointers at their first events
+        weak_sync -- if True, the initial weak synchronization is applied,
+                     otherwise the init time of the process with the lowest
+                     init time is the reference time of all processes
+    """
+    if weak_sync:
+        maxspawntrace = max(traces, key=lambda x: x.get_next_event_time())
+        return [ maxspawntrace.get_next_event_time() -
+                 trace.get_next_event_time() for trace in traces ]
+    starttime = min([ trace.get_init_time() for trace in traces ])
+    return [ trace.get_init_time() - starttime for trace in traces ]
+
+def _get_starts(values):
+    """ Returns indexes where runs of equal values of a sorted array start """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+
+def compare_send_intervals(original, synced):
+    """ Finds breakpoints, i.e. intervals after sends changed by the
+        synchronization. Intervals are compared only for processes with the
+        same number of sends in both tracelogs (*.kst files of the first
+        version store each send twice). Returns a tuple (number of
+        breakpoints, maximum arisen gap, average arisen gap, number of
+        processes with a different number of sends).
+
+        Arguments:
+        original -- TraceAnalysis of the original tracelog
+        synced -- TraceAnalysis of the synced tracelog
+    """
+    # Processes missing in one of the tracelogs are also different
+    count = min(len(original.send_bounds), len(synced.send_bounds)) - 1
+    same = np.diff(original.send_bounds[:count + 1]) == \
+        np.diff(synced.send_bounds[:count + 1])
+    mismatches = int(np.count_nonzero(~same)) + \
+        max(len(original.send_bounds), len(synced.send_bounds)) - 1 - count
+    def get_intervals(analysis):
+        bounds = analysis.send_bounds[:count + 1]
+        return np.concatenate(
+            [ analysis.send_intervals[start:end] for start, end in
+              zip(bounds[:-1][same], bounds[1:][same]) ] +
+            [ np.zeros(0, dtype=np.int64) ])
+    diffs = get_intervals(synced) - get_intervals(original)
+    diffs = diffs[diffs != 0]
+    if len(diffs) == 0:
+        return (0, 0, 0, mismatches)
+    return (len(diffs), max(0, int(diffs.max())),
+            int(diffs.sum()) // len(diffs), mismatches)
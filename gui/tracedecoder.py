@@ -0,0 +1,379 @@
+#
+#    Copyright (C) 2016 Kaira contributors
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import struct
+import numpy as np
+
+zero_char = chr(0)
+struct_int = struct.Struct("<i")
+
+event_dtype = [("type", "S1"),
+               ("time", "<u8"),
+               ("id", "<i4"),
+               ("pointer", "<i8")]
+
+token_dtype = [("event", "<i4"),
+               ("kind", "S1"),
+               ("place", "<i4"),
+               ("token", "<u8")]
+
+time_dtype = [("type", "S1"),
+              ("time", "<u8"),
+              ("id", "<i4"),
+              ("pointer", "<i8")]
+
+send_dtype = [("event", "<i4"),
+              ("time", "<u8"),
+              ("target", "<i4"),
+              ("size", "<u8"),
+              ("edge", "<i4")]
+
+
+class TraceEvents(object):
+
+    """ Columnar form of one KairaThreadTrace.
+
+        Attributes:
+        events -- one row per top-level event: event type, raw time (without
+                    the time offset of the trace), transition id (T), net id
+                    (S) or sender (R), -1 otherwise, and the pointer to the
+                    event type char (the value stored in timelines)
+        tokens -- one row per token record: index of the event, kind ("t" for
+                    added token, "r" for removed token), place id and token
+                    pointer
+        sends -- one row per message target: index of the event, send time,
+                    target process, size of the message and edge id
+    """
+
+    def __init__(self, events, tokens, sends):
+        self.events = events
+        self.tokens = tokens
+        self.sends = sends
+
+    def __len__(self):
+        return len(self.events)
+
+    def get_visible_mask(self):
+        """ Returns a boolean array, True for events shown in the replay """
+        types = self.events["type"]
+        return (types != "I") & (types != "M") & (types != "N")
+
+    def get_receives(self):
+        """ Returns indexes of receive events """
+        return np.flatnonzero(self.events["type"] == "R")
+
+
+def decode_trace(trace):
+    """ Scans the whole data of a trace once and returns TraceEvents.
+
+        Records have variable sizes (token values, strings, message targets);
+        their boundaries are found by _scan, then the fixed-size fields at
+        the found positions are unpacked at once by NumPy.
+
+        Arguments:
+        trace -- Trace object, its pointer is not changed
+    """
+    data = trace.data
+    token_size = trace.struct_token.size - 4
+    event_ptrs, token_ptrs, token_events, send_ptrs, send_events, _, _ = \
+        _scan(data, trace.pointer, token_size, trace.process_id)
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+
+    event_ptrs = np.array(event_ptrs, dtype="<i8")
+    events = np.zeros(len(event_ptrs), dtype=event_dtype)
+    if len(event_ptrs):
+        events["pointer"] = event_ptrs
+        events["type"] = raw[event_ptrs].view("S1")
+        events["time"] = _gather(raw, event_ptrs + 1, "<u8")
+        events["id"] = -1
+        with_id = np.flatnonzero((events["type"] == "T") |
+                                 (events["type"] == "S") |
+                                 (events["type"] == "R"))
+        events["id"][with_id] = _gather(raw, event_ptrs[with_id] + 9, "<i4")
+
+    token_ptrs = np.array(token_ptrs, dtype="<i8")
+    tokens = np.zeros(len(token_ptrs), dtype=token_dtype)
+    if len(token_ptrs):
+        tokens["event"] = token_events
+        tokens["kind"] = raw[token_ptrs].view("S1")
+        if token_size == 4:
+            tokens["token"] = _gather(raw, token_ptrs + 1, "<u4")
+        else:
+            tokens["token"] = _gather(raw, token_ptrs + 1, "<u8")
+        tokens["place"] = _gather(raw, token_ptrs + 1 + token_size, "<i4")
+
+    send_ptrs = np.array(send_ptrs, dtype="<i8")
+    counts = _gather(raw, send_ptrs + 21, "<i4")
+    # One row for each target of a message
+    rows = np.repeat(send_ptrs, counts)
+    sends = np.zeros(len(rows), dtype=send_dtype)
+    if len(rows):
+        first = np.cumsum(counts) - counts
+        nth = np.arange(len(rows)) - np.repeat(first, counts)
+        sends["event"] = np.repeat(send_events, counts)
+        sends["time"] = _gather(raw, rows + 1, "<u8")
+        sends["size"] = _gather(raw, rows + 9, "<u8")
+        sends["edge"] = _gather(raw, rows + 17, "<i4")
+        sends["target"] = _gather(raw, rows + 25 + 4 * nth, "<i4")
+
+    return TraceEvents(events, tokens, sends)
+
+def decode_times(trace):
+    """ Finds all timestamps of a trace, i.e. times of top-level events and
+        of nested quit ("Q"), send ("M") and end ("X") records, in the order
+        of the data.
+
+        Returns a couple (times, sends):
+        times -- one row per timestamp: record type, raw time (without the time
+                    offset of the trace), sender for receive records (-1
+                    otherwise) and the pointer to the record type char
+        sends -- one row per message target: index of the send record in
+                    times and target process
+
+        Arguments:
+        trace -- Trace object, its pointer is not changed
+    """
+    data = trace.data
+    token_size = trace.struct_token.size - 4
+    _, _, _, send_ptrs, _, time_ptrs, _ = \
+        _scan(data, trace.pointer, token_size, trace.process_id)
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+
+    time_ptrs = np.array(time_ptrs, dtype="<i8")
+    times = np.zeros(len(time_ptrs), dtype=time_dtype)
+    if len(time_ptrs):
+        times["pointer"] = time_ptrs
+        times["type"] = raw[time_ptrs].view("S1")
+        times["time"] = _gather(raw, time_ptrs + 1, "<u8")
+        times["id"] = -1
+        receives = np.flatnonzero(times["type"] == "R")
+        times["id"][receives] = _gather(raw, time_ptrs[receives] + 9, "<i4")
+
+    send_ptrs = np.array(send_ptrs, dtype="<i8")
+    counts = _gather(raw, send_ptrs + 21, "<i4")
+    rows = np.repeat(send_ptrs, counts)
+    sends = np.zeros(len(rows), dtype=[("record", "<i8"), ("target", "<i4")])
+    if len(rows):
+        first = np.cumsum(counts) - counts
+        nth = np.arange(len(rows)) - np.repeat(first, counts)
+        sends["record"] = np.searchsorted(time_ptrs, rows)
+        sends["target"] = _gather(raw, rows + 25 + 4 * nth, "<i4")
+    return times, sends
+
+def decode_dropped_tokens(trace):
+    """ Finds added tokens that the replay of a synchronized trace does not
+        write. Tokens added by an event are written in runs split by sends;
+        a run is written only when its last token has values.
+
+        Returns a couple (starts, ends) of arrays, the data from starts[i] to
+        ends[i] are dropped.
+
+        Arguments:
+        trace -- Trace object, its pointer is not changed
+    """
+    token_size = trace.struct_token.size - 4
+    dropped = _scan(trace.data, trace.pointer, token_size, trace.process_id)[6]
+    return dropped[:, 0], dropped[:, 1]
+
+def _gather(raw, positions, dtype):
+    """ Unpacks values of the given type stored at the positions """
+    size = np.dtype(dtype).itemsize
+    indexes = np.asarray(positions, dtype="<i8")[:, None] + np.arange(size)
+    return raw[indexes].view(dtype).ravel()
+
+def _record_sizes(token_size):
+    """ Returns a table of sizes of records indexed by their type chars; zero
+        for chars that do not start any record and 1 for strings ("s") and
+        sends ("M") whose sizes are found in the data """
+    sizes = np.zeros(256, dtype="<i8")
+    for t, size in (("T", 13), ("F", 9), ("R", 13), ("S", 13), ("I", 9),
+                    ("Q", 9), ("X", 9), ("i", 5), ("d", 9), ("s", 1),
+                    ("M", 1), ("t", token_size + 5), ("r", token_size + 5)):
+        sizes[ord(t)] = size
+    return sizes
+
+def _char_mask(chars):
+    mask = np.zeros(256, dtype=bool)
+    for t in chars:
+        mask[ord(t)] = True
+    return mask
+
+_hard_events = _char_mask("TFRSI")
+_body_records = _char_mask("rids")
+_token_records = _char_mask("rt")
+_added_values = _char_mask("tMids")
+_body_ends = _char_mask("tMX")
+_values = _char_mask("ids")
+_ending_events = _char_mask("TFR")
+_events_with_tokens = _char_mask("TFRS")
+
+def _invalid_event(data, p, process_id):
+    t = data[p]
+    return Exception("Invalid event type '{0}/{1}' (pointer={2}, process={3})"
+                        .format(t, ord(t), hex(int(p) + 1), process_id))
+
+def _walk(raw, pointer, end, sizes):
+    """ Returns positions of records that follow each other from the pointer
+        and start before the end, and the position after the last of them.
+        When this position is before the end, there is no valid record.
+
+        Every byte of the window that may start a record gets the position
+        of the record following it; the chain from the pointer is then
+        extracted by pointer doubling: levels[k] jumps over 2**k records.
+    """
+    window = raw[pointer:end]
+    positions = pointer + np.flatnonzero((sizes != 0).take(window))
+    if len(positions) == 0 or positions[0] != pointer:
+        return positions[:0], pointer
+    types = raw[positions]
+    nexts = positions + sizes[types]
+
+    strings = np.flatnonzero(types == ord("s"))
+    if len(strings):
+        nuls = pointer + np.flatnonzero(window == 0)
+        i = np.searchsorted(nuls, positions[strings] + 1)
+        found = i < len(nuls)
+        nexts[strings[found]] = nuls[i[found]] + 1
+        for s in strings[~found]:
+            # The string continues behind the window
+            nuls = np.flatnonzero(raw[positions[s] + 1:] == 0)
+            if len(nuls):
+                nexts[s] = positions[s] + nuls[0] + 2
+            else:
+                nexts[s] = len(raw) + 1
+
+    sends = np.flatnonzero(types == ord("M"))
+    if len(sends):
+        starts = positions[sends]
+        complete = starts + 25 <= len(raw)
+        counts = np.zeros(len(sends), dtype="<i8")
+        counts[complete] = _gather(raw, starts[complete] + 21, "<i4")
+        nexts[sends] = starts + 25 + 4 * np.maximum(counts, 0)
+
+    count = len(positions)
+    index = np.searchsorted(positions, nexts)
+    linked = positions[np.minimum(index, count - 1)] == nexts
+    jump = np.append(np.where(linked, index, count), count)
+
+    levels = [ jump ]
+    while jump[0] != count:
+        jump = jump[jump]
+        levels.append(jump)
+    chain = np.zeros(1, dtype=jump.dtype)
+    for jump in reversed(levels[:-1]):
+        expanded = np.empty(2 * len(chain), dtype=chain.dtype)
+        expanded[0::2] = chain
+        expanded[1::2] = jump[chain]
+        chain = expanded[expanded != count]
+
+    return positions[chain], nexts[chain[-1]]
+
+def _scan(data, pointer, token_size, process_id, window_size=1 << 18):
+    """ Walks through records with the same rules as Trace.process_event and
+        returns positions of events, token records, send records, of all
+        records with a timestamp and couples (start, end) of runs of added
+        tokens whose last token has no values.
+
+        The size of a record depends only on its type char (and on the data
+        of strings and sends), so records are found window by window by
+        _walk. Whether a record is nested in the previous event or starts a
+        new one is then decided from the sequence of record types.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    length = len(raw)
+    sizes = _record_sizes(token_size)
+    chains = []
+    invalid_pointer = None
+    while pointer < length:
+        end = min(pointer + window_size, length)
+        chain, pointer = _walk(raw, pointer, end, sizes)
+        chains.append(chain)
+        if pointer < end:
+            # Records before the invalid one may be also invalid in their
+            # context, the first of them is reported
+            invalid_pointer = pointer
+            break
+    if not chains:
+        empty = np.zeros(0, dtype="<i8")
+        return empty, empty, empty, empty, empty, empty, \
+            np.zeros((0, 2), dtype="<i8")
+    positions = np.concatenate(chains)
+    if not len(positions):
+        raise _invalid_event(data, invalid_pointer, process_id)
+    types = raw[positions]
+    indexes = np.arange(len(positions))
+
+    # "Q" is nested when it directly follows a transition fired (and data of
+    # its trace function) or a transition finished, otherwise it is an event
+    hard = _hard_events[types]
+    last_hard = np.maximum.accumulate(np.where(hard, indexes, -1))
+    quits = np.flatnonzero((types == ord("Q")) & (last_hard >= 0))
+    outside_body = np.cumsum(~_body_records[types])
+    event = last_hard[quits]
+    event_type = types[event]
+    nested_quit = np.zeros(len(positions), dtype=bool)
+    nested_quit[quits] = \
+        ((event_type == ord("T")) &
+         (outside_body[quits - 1] == outside_body[event])) | \
+        ((event_type == ord("F")) & (event == quits - 1))
+
+    starts = hard | ((types == ord("Q")) & ~nested_quit)
+    if not starts[0]:
+        raise _invalid_event(data, positions[0], process_id)
+    events = np.cumsum(starts) - 1
+    first = np.flatnonzero(starts)[events]
+    event_type = types[first]
+
+    def seen_in_event(mask):
+        """ Number of records of the mask before each record in its event """
+        before = np.cumsum(mask) - mask
+        return before - before[first]
+
+    ended = seen_in_event(types == ord("X"))
+    body_ended = seen_in_event(_body_ends[types] | nested_quit)
+    valid = starts | nested_quit
+    valid |= (types == ord("r")) & (event_type == ord("T")) & (body_ended == 0)
+    valid |= _added_values[types] & _events_with_tokens[event_type] & \
+                (ended == 0)
+    valid |= (types == ord("X")) & _ending_events[event_type] & (ended == 0)
+    invalid = np.flatnonzero(~valid)
+    if len(invalid):
+        raise _invalid_event(data, positions[invalid[0]], process_id)
+    if invalid_pointer is not None:
+        raise _invalid_event(data, invalid_pointer, process_id)
+
+    tokens = _token_records[types]
+    sends = types == ord("M")
+    times = starts | sends | nested_quit | (types == ord("X"))
+
+    # Added tokens with their values, runs of them are split by any other
+    # record (a send, an end or the next event)
+    added = (types == ord("t")) | \
+        (_values[types] & ((event_type != ord("T")) | (body_ended != 0)))
+    run_starts = np.flatnonzero(added & ~np.append(False, added[:-1]))
+    run_ends = np.flatnonzero(added & ~np.append(added[1:], False))
+    value_less = types[run_ends] == ord("t")
+    ends = np.append(positions[1:], pointer)
+    dropped = np.column_stack((positions[run_starts[value_less]],
+                               ends[run_ends[value_less]]))
+
+    return positions[starts], positions[tokens], events[tokens], \
+        positions[sends], events[sends], positions[times], dropped
@@ -22,22 +22,192 @@
 import xml.etree.ElementTree as xml
 import utils
 import loader
+import os
 import struct
+import mmap
+import multiprocessing as mp
+import numpy as np
 import controlseq
 
 from table import Table
+from tracedecoder import decode_trace, decode_times
+from messageindex import create_message_index, get_cache_key, \
+                         load_message_index, store_message_index
 from runinstance import RunInstance
 from exportri import ExportRunInstance, place_counter_name
 
 zero_char = chr(0)
 
+def read_trace_data(filename, mapped=False):
+    """ Returns the content of a trace file. If mapped is True the file is
+        memory-mapped instead of read, so the OS pages the data in and out on
+        demand. The mapped object supports the same indexing, slicing and
+        struct.unpack_from access as a string.
+    """
+    with open(filename, "rb") as f:
+        if mapped:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                pass
+        return f.read()
+
+def map_trace_data(data, offset, length):
+    """ Returns a zero-copy view of a part of (possibly mapped) data """
+    return buffer(data, offset, length)
+
+def decode_traces(traces, pointer_size, jobs=1, decoder=decode_trace):
+    """ Returns TraceEvents of all traces. If jobs is not 1 the traces are
+        decoded in a pool of worker processes, each worker maps the trace
+        itself and sends back only the decoded arrays.
+
+        Arguments:
+        traces -- list of Trace objects
+        pointer_size -- 4 or 8, type of binary data within traces
+        jobs -- number of worker processes, None means one per CPU
+        decoder -- a module-level function decoding one trace, results of
+                   decode_times can be obtained instead of TraceEvents
+    """
+    if jobs == 1 or len(traces) < 2 or \
+            any(trace.source is None for trace in traces):
+        return [ decoder(trace) for trace in traces ]
+    pool = mp.Pool(jobs)
+    try:
+        return pool.map(_decode_trace_source,
+                        [ (trace.source, trace.process_id, pointer_size,
+                           decoder)
+                          for trace in traces ])
+    finally:
+        pool.close()
+        pool.join()
+
+def merge_events(times):
+    """ Returns indexes into the concatenation of times in the order of
+        utils.merge_indexes, i.e. by time and the lower process id first on
+        equal times.
+
+        Arguments:
+        times -- list of arrays of event times, one for each process
+    """
+    processes = np.repeat(np.arange(len(times)), [ len(t) for t in times ])
+    if all(np.all(t[1:] >= t[:-1]) for t in times):
+        return np.lexsort((processes, np.concatenate(times)))
+    # Sequences that are not sorted are merged as the heap does it
+    starts = np.cumsum([ 0 ] + [ len(t) for t in times ])
+    positions = list(starts[:-1])
+    order = np.empty(len(processes), dtype=np.int64)
+    for i, process_id in enumerate(
+            utils.merge_indexes([ t.tolist() for t in times ])):
+        order[i] = positions[process_id]
+        positions[process_id] += 1
+    return order
+
+def count_missed_receives(decoded, order):
+    """ Returns the number of receives that precede their sends in the merged
+        order, as counted by RunInstance during the replay. Messages of each
+        channel are received in the order they were sent.
+
+        Arguments:
+        decoded -- list of TraceEvents, one for each process
+        order -- result of merge_events
+    """
+    process_count = len(decoded)
+    starts = np.cumsum([ 0 ] + [ len(events) for events in decoded ])
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    send_channels, send_ranks = [], []
+    receive_channels, receive_ranks = [], []
+    for process_id, events in enumerate(decoded):
+        sends = events.sends
+        send_channels.append(process_id * process_count + sends["target"])
+        send_ranks.append(rank[starts[process_id] + sends["event"]])
+        receives = events.get_receives()
+        receive_channels.append(events.events["id"][receives] * process_count
+                                + process_id)
+        receive_ranks.append(rank[starts[process_id] + receives])
+
+    def nth_in_channel(channels, ranks):
+        channels = np.concatenate(channels).astype(np.int64)
+        ranks = np.concatenate(ranks)
+        indexes = np.argsort(channels, kind="mergesort")
+        channels = channels[indexes]
+        first = np.searchsorted(channels, channels)
+        return channels, np.arange(len(channels)) - first, ranks[indexes]
+
+    send_channels, send_nth, send_ranks = \
+        nth_in_channel(send_channels, send_ranks)
+    receive_channels, receive_nth, receive_ranks = \
+        nth_in_channel(receive_channels, receive_ranks)
+    if not len(receive_channels) or not len(send_channels):
+        return 0
+
+    # The n-th receive of a channel takes the n-th send of the channel
+    keys = send_channels * (len(send_channels) + 1) + send_nth
+    index = np.searchsorted(keys,
+                            receive_channels * (len(send_channels) + 1)
+                            + receive_nth)
+    index = np.minimum(index, len(keys) - 1)
+    matched = keys[index] == receive_channels * (len(send_channels) + 1) \
+                             + receive_nth
+    # A receive processed within the event of its own send precedes the send
+    return int(np.count_nonzero(
+        receive_ranks[matched] <= send_ranks[index[matched]]))
+
+def _decode_trace_source(args):
+    """ Decodes one trace in a worker process of decode_traces """
+    (filename, offset, length), process_id, pointer_size, decoder = args
+    data = map_trace_data(read_trace_data(filename, True), offset, length)
+    return decoder(Trace(data, process_id, pointer_size))
+
+def get_message_index(traces, pointer_size, jobs=1, cache_filename=None,
+                      sources=()):
+    """ Returns MessageIndex of traces.
+
+        Arguments:
+        traces -- list of Trace objects with pointers at their first events
+        pointer_size -- 4 or 8, type of binary data within traces
+        jobs -- see decode_traces
+        cache_filename -- if not None, the index is loaded from/stored into
+                          this file
+        sources -- files the traces are read from, the cached index is used
+                   only if they have not changed
+    """
+    if cache_filename is not None:
+        key = get_cache_key(sources)
+        index = load_message_index(cache_filename, key)
+        if index is not None:
+            return index
+    index = create_message_index(
+        decode_traces(traces, pointer_size, jobs, decode_times))
+    if cache_filename is not None:
+        store_message_index(cache_filename, key, index)
+    return index
+
+
 class TraceLog:
 
-    def __init__(self, filename, export_data=False, init=True, default=True):
+    # Number of visible events between two stored states of the replay
+    checkpoint_interval = 1000
+    # Maximal number of tokens and packets held by all stored states
+    checkpoint_budget = 2000000
+    # Number of events that can be stepped back without a new replay
+    undo_limit = 100
+    # Version of the format of preprocessing cache files
+    cache_version = 1
+    # MessageIndex, created by get_message_index
+    _message_index = None
+
+    def __init__(self, filename, export_data=False, init=True, default=True,
+                 mapped=False, cache=False, jobs=1):
         if not init:
             return
         self.filename = filename
         self.export_data = export_data
+        self.mapped = mapped
+        self.cache = cache
+        self.jobs = jobs
         self._read_header()
 
         self.traces = [None] * self.process_count
@@ -70,8 +240,73 @@ class TraceLog:
         return ri
 
     def get_event_runinstance(self, index):
-        return self.execute_visible_events(
-            self.first_runinstance.copy(), 0, index)
+        """ Returns the run instance after 'index' visible events. The result
+            is a live cursor of the replay, it is changed by the next call.
+        """
+        if self.cursor is not None:
+            cursor_index, ri = self.cursor
+            if index == cursor_index + 1:
+                self.execute_visible_events(ri, cursor_index, index)
+                self.cursor = (index, ri)
+                return ri
+            if index == cursor_index - 1 and ri.can_undo():
+                ri.undo()
+                self.cursor = (index, ri)
+                return ri
+            if index == cursor_index:
+                return ri
+
+        ri = self._seek_runinstance(index)
+        self.cursor = (index, ri)
+        return ri
+
+    def _seek_runinstance(self, index):
+        # The replay starts from the nearest checkpoint before the index
+        start = self._find_checkpoint(index)
+        ri = self._checkpoint_runinstance(start)
+
+        # Missing checkpoints on the way are created
+        interval = self.checkpoint_interval
+        for i in xrange(start + interval, index + 1, interval):
+            self.execute_visible_events(ri, start, i)
+            self.checkpoints[i] = ri.snapshot()
+            start = i
+        self._check_checkpoints_budget()
+
+        # Last events are recorded for stepping backward; when they begin
+        # before the checkpoint, the replay starts from an earlier one
+        undo_start = max(0, index - self.undo_limit)
+        if undo_start < start:
+            start = self._find_checkpoint(undo_start)
+            ri = self._checkpoint_runinstance(start)
+        self.execute_visible_events(ri, start, undo_start)
+        ri.enable_undo(self.undo_limit)
+        return self.execute_visible_events(ri, undo_start, index)
+
+    def _find_checkpoint(self, index):
+        """ Returns the index of the nearest checkpoint before the index,
+            0 stands for the first run instance """
+        interval = self.checkpoint_interval
+        start = index - index % interval
+        while start > 0 and start not in self.checkpoints:
+            start -= interval
+        return start
+
+    def _checkpoint_runinstance(self, start):
+        if start == 0:
+            return self.first_runinstance.copy()
+        return self.checkpoints[start].snapshot()
+
+    def _check_checkpoints_budget(self):
+        """ When checkpoints hold more tokens and packets than allows
+            checkpoint_budget, every second one is dropped """
+        while len(self.checkpoints) > 1 and \
+                sum(ri.get_size() for ri in self.checkpoints.values()) + \
+                len(self.checkpoints) > self.checkpoint_budget:
+            self.checkpoint_interval *= 2
+            for i in self.checkpoints.keys():
+                if i % self.checkpoint_interval != 0:
+                    del self.checkpoints[i]
 
     def get_event_process(self, index):
         if index == 0:
@@ -132,22 +367,145 @@ class TraceLog:
             x = xml.fromstring(f.read())
             self.project = loader.load_project_from_xml(x, "")
 
-    def _read_trace(self, process_id):
-        filename = "{0}-{1}-0.ktt".format(
+    def _get_trace_filename(self, process_id):
+        return "{0}-{1}-0.ktt".format(
             utils.trim_filename_suffix(self.filename),
             process_id)
-        with open(filename, "rb") as f:
-            trace = Trace(f.read(), process_id, self.pointer_size)
-            self.traces[process_id] = trace
+
+    def _get_source_filenames(self):
+        """ Returns files which the preprocessing results depend on """
+        return [ self.filename ] + [ self._get_trace_filename(process_id)
+                                     for process_id in xrange(self.process_count) ]
+
+    def _get_cache_filename(self):
+        return self.filename + ".cache"
+
+    def _get_cache_key(self):
+        return get_cache_key(self._get_source_filenames())
+
+    def get_message_index(self):
+        """ Returns MessageIndex of traces of the tracelog. It is created
+            once; if caching is turned on, it is also stored next to the
+            tracelog and shared by later analyses of the same files. Traces
+            have to be at their first events when it is called for the first
+            time.
+        """
+        if self._message_index is None:
+            cache_filename = None
+            if self.cache:
+                cache_filename = self.filename + ".messages"
+            self._message_index = get_message_index(
+                self.traces, self.pointer_size, self.jobs, cache_filename,
+                self._get_source_filenames())
+        return self._message_index
+
+    def _load_cache(self):
+        """ Loads results of _preprocess from the cache file if the file
+            exists and it was created from the same tracelog.
+            Returns True if the results were loaded.
+        """
+        filename = self._get_cache_filename()
+        if not os.path.isfile(filename):
+            return False
+        try:
+            with open(filename, "rb") as f:
+                cache = np.load(f)
+                if int(cache["version"]) != self.cache_version or \
+                        int(cache["process_count"]) != self.process_count or \
+                        int(cache["pointer_size"]) != self.pointer_size or \
+                        bool(cache["export_data"]) != self.export_data or \
+                        not np.array_equal(cache["key"], self._get_cache_key()):
+                    return False
+                def load_table(name):
+                    return Table.create_from_data(
+                        np.ma.masked_array(cache[name + "_data"],
+                                           mask=cache[name + "_mask"]))
+                timeline = load_table("timeline")
+                full_timeline = load_table("full_timeline")
+                if self.export_data:
+                    data = load_table("data")
+                else:
+                    data = Table([], 0)
+                time_offsets = cache["time_offsets"].tolist()
+                missed_receives = int(cache["missed_receives"])
+        except (IOError, ValueError, KeyError):
+            return False
+
+        for trace, time_offset in zip(self.traces, time_offsets):
+            trace.time_offset = time_offset
+        self.timeline, self.full_timeline = timeline, full_timeline
+        self.data = data
+        self.missed_receives = missed_receives
+        return True
+
+    def _store_cache(self):
+        tables = { "timeline" : self.timeline,
+                   "full_timeline" : self.full_timeline }
+        if self.export_data:
+            tables["data"] = self.data
+        arrays = {}
+        for name, table in tables.items():
+            arrays[name + "_data"] = table.data.data[:len(table)]
+            arrays[name + "_mask"] = np.ma.getmaskarray(table.data)[:len(table)]
+        try:
+            with open(self._get_cache_filename(), "wb") as f:
+                np.savez(f,
+                         version=self.cache_version,
+                         key=self._get_cache_key(),
+                         process_count=self.process_count,
+                         pointer_size=self.pointer_size,
+                         export_data=self.export_data,
+                         time_offsets=np.array([ trace.time_offset
+                                                 for trace in self.traces ],
+                                               dtype="<i8"),
+                         missed_receives=self.missed_receives,
+                         **arrays)
+        except (IOError, OSError):
+            # The cache is optional, e.g. the directory may be read-only
+            pass
+
+    def _read_trace(self, process_id):
+        filename = self._get_trace_filename(process_id)
+        data = read_trace_data(filename, self.mapped)
+        trace = Trace(data, process_id, self.pointer_size)
+        trace.source = (filename, 0, len(data))
+        self.traces[process_id] = trace
 
     def _preprocess(self, offsets=True):
+        self.checkpoints = {}
+        self.cursor = None
+        if self.cache and self._load_cache():
+            return
+
         # Set time offsets
         if offsets:
             starttime = min([ trace.get_init_time() for trace in self.traces ])
             for trace in self.traces:
                 trace.time_offset = trace.get_init_time() - starttime
-        trace_times = [ trace.get_next_event_time() for trace in self.traces ]
 
+        # Timelines are built from the decoded events, the replay is needed
+        # only for the exported data
+        decoded = decode_traces(self.traces, self.pointer_size, self.jobs)
+        times = [ events.events["time"].astype(np.int64) + trace.time_offset
+                  for trace, events in zip(self.traces, decoded) ]
+        order = merge_events(times)
+        processes = np.repeat(np.arange(self.process_count, dtype="<i4"),
+                              [ len(t) for t in times ])[order]
+        pointers = np.concatenate([ events.events["pointer"]
+                                    for events in decoded ])[order]
+        visible = np.concatenate([ events.get_visible_mask()
+                                   for events in decoded ])[order]
+
+        full_timeline = Table([("process", "<i4"), ("pointer", "<i4")],
+                              len(order))
+        full_timeline.append_columns([ processes, pointers ])
+        timeline = Table([("process", "<i4"), ("pointer", "<i4")],
+                         int(visible.sum()))
+        timeline.append_columns([ processes[visible], pointers[visible] ])
+        self.timeline, self.full_timeline = timeline, full_timeline
+        self.missed_receives = count_missed_receives(decoded, order)
+
+        self.data = Table([], 0)
         if self.export_data:
             place_counters = [place_counter_name(p)
                               for p in self.project.nets[0].places()
@@ -160,42 +518,11 @@ class TraceLog:
                          for i, tracing in enumerate(p.trace_tokens_functions)
                          if tracing.return_numpy_type != 'O' ],
                 ExportRunInstance.basic_header + place_counters)
-        else:
-            ri = RunInstance(
-                self.project, self.process_count)
-
-        index = 0
-        timeline = Table([("process", "<i4"), ("pointer", "<i4")], 100)
-        full_timeline = Table([("process", "<i4"), ("pointer", "<i4")], 100)
-        while True:
-
-            # Searching for trace with minimal event time
-            minimal_time_index = utils.index_of_minimal_value(trace_times)
-            if minimal_time_index is None:
-                break
-
-            trace = self.traces[minimal_time_index]
-
-            full_timeline.add_row((minimal_time_index, trace.pointer))
-
-            # Timeline update
-            if trace.is_next_event_visible():
-                timeline.add_row(full_timeline[index])
-
-            trace.process_event(ri)
-            trace_times[minimal_time_index] = trace.get_next_event_time()
-
-            index += 1
-
-        self.data = Table([], 0)
-        if self.export_data:
+            self.execute_all_events(ri)
             self.data = ri.get_table()
 
-        timeline.trim()
-        full_timeline.trim()
-        self.timeline, self.full_timeline = timeline, full_timeline
-
-        self.missed_receives = ri.missed_receives
+        if self.cache:
+            self._store_cache()
 
 
 class Trace:
@@ -216,6 +543,8 @@ class Trace:
         self.data = data
         self.pointer = 0
         self.process_id = process_id
+        # (filename, offset, length) of the data, if they are stored in a file
+        self.source = None
         self.time_offset = 0
         if pointer_size == 4:
             self.struct_token = self.struct_token_4
@@ -310,8 +639,13 @@ class Trace:
                 value = self._read_cstring()
                 values.append(value)
             elif t == "M":
+                # Tokens before the send belong to the current event, tokens
+                # after it follow the send
+                self._extra_tokens_add(pointer1, extra, values)
                 self.pointer += 1
                 self._process_event_send(runinstance)
+                pointer1 = self.pointer
+                extra = self._extra_value()
             else:
                 if runinstance is not None and place_id is not None and token_pointer is not None:
                     runinstance.add_token(place_id, token_pointer, values, send_time)
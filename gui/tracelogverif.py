@@ -17,23 +17,28 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from tracelog import TraceLog, Trace
-from Queue import Queue
+from tracelog import TraceLog
+from traceanalysis import TraceAnalysis, get_time_offsets, delay_percentiles
 
 class VTraceLog(TraceLog):
     
     """ Tracelog verifier - Scans traces and finds clock condition violations 
         and maximum and average message delay """
     
-    def __init__(self, filename, weak_sync):
+    def __init__(self, filename, weak_sync, jobs=1, cache=False):
         """ VTraceLog initialization
         
             Arguments:
             filename -- a path to a tracelog file (*.kth)
             weak_sync -- if True the initial weak synchronization is applied
+            jobs -- if not 1, traces are decoded in a pool of 'jobs' processes
+                    (None means one per CPU)
+            cache -- if True, the message index is loaded from/stored into
+                    a file next to the tracelog (see TraceLog.get_message_index)
         """
         
-        TraceLog.__init__(self, filename, False, True, False)
+        TraceLog.__init__(self, filename, False, True, False, mapped=True,
+                          cache=cache, jobs=jobs)
         
 #         self.filename = tracelog
 #         self._read_header()
@@ -42,76 +47,12 @@ class VTraceLog(TraceLog):
 #         for process_id in xrange(self.process_count):
 #             self._read_trace(process_id)
         
-        self.messages = [[Queue() for x in range(self.process_count)] for x in range(self.process_count)]
         self._weak_sync = weak_sync
-        
-        self.vtraces = []
-        for t in self.traces:
-            self.vtraces.append(VTrace(t.data, t.process_id, self.pointer_size, 
-                                      self.messages))
-        self.traces = self.vtraces
-        
-        self._verify()
-        
-    def _verify(self):
-        """ Scans traces and finds clock condition violations and maximum and 
-            average message delay """
-        
-        if self._weak_sync:
-            maxspawntrace = max( self.traces, key=lambda x: x.get_next_event_time() )
-            for trace in self.traces:
-                trace.time_offset = maxspawntrace.get_next_event_time() - trace.get_next_event_time()
-        else:
-            # Make an init time of the process with the lowest init time reference
-            # time for all events from all processes
-            starttime = min([ trace.get_init_time() for trace in self.traces ])
-            for trace in self.traces:
-                trace.time_offset = trace.get_init_time() - starttime
-        
-        # List of unprocessed processes
-        processes = [x for x in range(self.process_count)]
-        # A process which will be processed
-        current_p = processes[0]
-        
-        # Traverse algorithm goes through every event of a process,
-        # it jumps to another process if a send event of reached receive event
-        # is found to be unprocessed or if the end of process is reached
-        while processes:
-            
-            working_p = current_p
-            trace = self.traces[working_p]
-            
-            while working_p == current_p:
-                if trace.get_next_event_time() is not None:
-                    if trace.get_next_event_name() == "Recv ":
-                        sender = trace.get_msg_sender()
-                        if self.messages[sender][current_p].empty() is False:
-                            trace.process_event()                                        
-                        else:
-                            current_p = sender
-                    else:
-                        trace.process_event()
-                else:
-                    processes.remove(current_p)
-                    #List is empty, stops the loop
-                    if not processes:
-                        current_p += 1
-                    else:
-                        current_p = processes[0]
-        
-        self.violations = sum([t.get_violations_number() for t in self.traces])
-        self.receives = sum([t.get_receives_number() for t in self.traces])
-        self.max_delay = 0
-        self.avrg_delay = 0
-        if self.violations > 0:
-            self.max_delay = max([t.get_maximum_delay() for t in self.traces])
-            self.avrg_delay = []
-            for t in self.traces:
-                delay_list = t.get_delays_list()
-                if delay_list is not None:
-                    self.avrg_delay += t.get_delays_list()
-            self.avrg_delay = sum(self.avrg_delay) / self.violations
-    
+        offsets = get_time_offsets(self.traces, weak_sync)
+        for trace, offset in zip(self.traces, offsets):
+            trace.time_offset = offset
+        self.analysis = TraceAnalysis(self.get_message_index(), offsets)
+
     def get_results(self):
         """ Returns results of verification in a tuple:
             1. Total number of sent messages
@@ -119,78 +60,14 @@ class VTraceLog(TraceLog):
             3. Maximum delay [ns]
             4. Average delay [ns]
          """
-        return (self.receives, self.violations, self.max_delay, self.avrg_delay)
-        
-
-
-class VTrace(Trace):
-    
-    """ Represents one trace (*.ktt) file. Reveals clock condition violations
-        and counts the delays for one trace. """
-    
-    def __init__(self, data, process_id, pointer_size, messages):
-        """ VTrace initialization
-            
-            Arguments:
-            data -- content of a *.ktt file
-            process_id -- id (rank) of the process logged in trace
-            pointer_size -- 4 or 8, type of binary data within the *.ktt file
-            messages -- shared variable among VTraces, 2-dimensional array
-                        of Queues, first coordinate is a sender of message,
-                        second is the recipient, Queues stores sent times.
-        """
-        
-        Trace.__init__(self, data, process_id, pointer_size)
-        
-        self._messages = messages
-        self._receives = 0
-        self._ccviolations = 0
-        self._delays = []
+        return self.analysis.get_violations()
 
-    def get_msg_sender(self):
-        """ Returns None, or the id of a process, who is the sender of the 
-            received message if the next event is receive event
-        """
-        if self.get_next_event_name() == "Recv ":
-            tmp_pointer = self.pointer
-            self.pointer += 1
-            origin_id = self._read_struct_receive()[1]
-            self.pointer = tmp_pointer
-            return origin_id
-        else:
-            return None
-
-    def get_maximum_delay(self):
-        """ Returns maximum delay of violated receives within trace """
-        if self._delays:
-            return max(self._delays)
-        return None
-    
-    def get_delays_list(self):
-        """ Returns list of delays of violated receives within trace """
-        return self._delays
+    def get_delay_percentiles(self):
+        """ Returns a list of couples (percentile, message delay [ns]), see
+            delay_percentiles """
+        return zip(delay_percentiles, self.analysis.get_delay_percentiles())
 
-    def get_violations_number(self):
-        """ Returns number of violations within trace """
-        return self._ccviolations
-    
-    def get_receives_number(self):
-        """ Returns total number of received messages within trace """
-        return self._receives
-        
-    def _extra_event_send(self, time, target_id):
-        """ Saves sent time in shared variable of messages """
-        self._messages[self.process_id][target_id].put(time + self.time_offset)
-        
-    def _extra_time(self, time, pointer, receive=False, origin_id=None):
-        """ Resolves the violation and computes message delay """
-        if receive:
-            if origin_id is None:
-                raise Exception("Origin_id for a receive event not entered!")
-            self._receives += 1
-            sent_time = self._messages[origin_id][self.process_id].get()
-            if time + self.time_offset < sent_time:
-                self._ccviolations += 1
-                self._delays.append(sent_time - time - self.time_offset)
-        return time
-    
\ No newline at end of file
+    def get_link_table(self):
+        """ Returns Table of message delays of each couple of sender and
+            receiver """
+        return self.analysis.get_link_table()
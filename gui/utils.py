@@ -18,6 +18,7 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import heapq
 import math
 import os
 import re
@@ -244,6 +245,27 @@ def index_of_minimal_value(items):
              index = j
     return index
 
+def merge_indexes(sequences):
+    """ Merge sorted sequences by a heap. For each value of the merged sequence
+        yields the index of the sequence the value comes from. Equal values
+        are taken from the sequence with the lower index first, so the result
+        is the same as repeated index_of_minimal_value over heads of sequences.
+    """
+    heap = [ (sequence[0], i) for i, sequence in enumerate(sequences)
+                              if sequence ]
+    heapq.heapify(heap)
+    positions = [ 0 ] * len(sequences)
+    while heap:
+        i = heap[0][1]
+        yield i
+        position = positions[i] + 1
+        positions[i] = position
+        sequence = sequences[i]
+        if position < len(sequence):
+            heapq.heapreplace(heap, (sequence[position], i))
+        else:
+            heapq.heappop(heap)
+
 def xml_int(element, attr, default = None):
     if element.get(attr) is None:
         if default is not None:
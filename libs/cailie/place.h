@@ -3,6 +3,7 @@
 
 #include "token.h"
 #include <map>
+#include <list>
 
 namespace ca {
 
@@ -75,12 +76,12 @@ template <typename T> class PlaceWithSource : public Place<T>
 {
 	public:
 
-		PlaceWithSource() {}
+		PlaceWithSource() : indexed(false) {}
 
-		PlaceWithSource(const PlaceWithSource &place) : Place<T>(place), default_source(place.default_source) {
+		PlaceWithSource(const PlaceWithSource &place) : Place<T>(place), default_source(place.default_source), indexed(place.indexed) {
 			Token<T> *s = this->token_list.begin();
 			for (Token<T> *t = place.token_list.begin(); t != NULL; t = place.token_list.next(t)) {
-				this->sources[s] = place.sources.find(t)->second;
+				set_source(s, place.sources.find(t)->second);
 				s = this->token_list.next(s);
 			}
 		}
@@ -88,10 +89,11 @@ template <typename T> class PlaceWithSource : public Place<T>
 		PlaceWithSource& operator=(const PlaceWithSource &place) {
 			Place<T>::operator=(place);
 			this->default_source = place.default_source;
-			this->sources.clear();
+			clear_sources();
+			this->indexed = place.indexed;
 			Token<T> *s = this->token_list.begin();
 			for (Token<T> *t = place.token_list.begin(); t != NULL; t = place.token_list.next(t)) {
-				this->sources[s] = place.sources.find(t)->second;
+				set_source(s, place.sources.find(t)->second);
 				s = this->token_list.next(s);
 			}
 			return *this;
@@ -107,15 +109,21 @@ template <typename T> class PlaceWithSource : public Place<T>
 
 		void overtake(TokenList<T> &list, int source) {
 			for (Token<T> *t = list.begin(); t != NULL; t = list.next(t)) {
-				sources[t] = source;
+				set_source(t, source);
 			}
 			this->token_list.overtake(list);
 		}
 
 		void overtake(PlaceWithSource<T> &place) {
+			for (Token<T> *t = place.token_list.begin(); t != NULL; t = place.token_list.next(t)) {
+				set_source(t, place.sources[t]);
+			}
 			place.put_into(this->token_list);
-			place.sources.clear();
-			sources = place.sources;
+		}
+
+		void put_into(TokenList<T> &list) {
+			list.overtake(this->token_list);
+			clear_sources();
 		}
 
 		void sorted_put_into(TokenList<T> &list) {
@@ -126,11 +134,13 @@ template <typename T> class PlaceWithSource : public Place<T>
 				remove(i->first);
 				list.add_token(i->first);
 			}
-			sources.clear();
+			clear_sources();
 		}
 
 		void copy_tokens(TokenList<T> &list) {
-			this->token_list.copy_tokens(list);
+			for (Token<T> *t = list.begin(); t != NULL; t = list.next(t)) {
+				add(t->value);
+			}
 		}
 
 		void add(const T &value) {
@@ -143,7 +153,7 @@ template <typename T> class PlaceWithSource : public Place<T>
 
 		void add(const T &value, int source) {
 			this->token_list.add(value);
-			sources[this->token_list.last()] = source;
+			set_source(this->token_list.last(), source);
 		}
 
 		void add(const std::vector<T> &values, int source) {
@@ -157,13 +167,13 @@ template <typename T> class PlaceWithSource : public Place<T>
 		}
 
 		void add_token(Token<T> *t, int source) {
-			sources[t] = source;
+			set_source(t, source);
 			this->token_list.add_token(t);
 		}
 
 		void remove(Token<T> *t)
 		{
-			sources.erase(t);
+			erase_source(t);
 			this->token_list.remove(t);
 		}
 
@@ -183,6 +193,35 @@ template <typename T> class PlaceWithSource : public Place<T>
 			return result;
 		}
 
+		/* The first token from the source, tokens are found through the index
+		   of sources. The index is built by the first call, places that are
+		   never searched by the source do not maintain it. */
+		Token<T>* begin_from(int source)
+		{
+			if (!indexed) {
+				build_index();
+			}
+			typename std::map<int, SourceList>::iterator i = index.find(source);
+			if (i == index.end()) {
+				return NULL;
+			}
+			return i->second.front();
+		}
+
+		/* The next token from the same source as t */
+		Token<T>* next_from(Token<T> *t)
+		{
+			if (!indexed) {
+				build_index();
+			}
+			SourcePosition &position = index_positions.find(t)->second;
+			typename SourceList::iterator i = position.second;
+			if (++i == position.first->end()) {
+				return NULL;
+			}
+			return *i;
+		}
+
 		void pack(Packer &packer) const
 		{
 			packer << this->token_list;
@@ -195,9 +234,56 @@ template <typename T> class PlaceWithSource : public Place<T>
 		}
 
 	protected:
+		typedef std::list<Token<T>*> SourceList;
+		typedef std::pair<SourceList*, typename SourceList::iterator> SourcePosition;
+
 		std::map<Token<T>*, int> sources;
 		int default_source;
 
+		/* Tokens of each source in the order of the place */
+		bool indexed;
+		std::map<int, SourceList> index;
+		std::map<Token<T>*, SourcePosition> index_positions;
+
+		void set_source(Token<T> *t, int source) {
+			sources[t] = source;
+			if (indexed) {
+				SourceList &list = index[source];
+				list.push_back(t);
+				index_positions[t] = SourcePosition(&list, --list.end());
+			}
+		}
+
+		void erase_source(Token<T> *t) {
+			if (indexed) {
+				typename std::map<Token<T>*, SourcePosition>::iterator i =
+					index_positions.find(t);
+				if (i != index_positions.end()) {
+					i->second.first->erase(i->second.second);
+					if (i->second.first->empty()) {
+						index.erase(sources[t]);
+					}
+					index_positions.erase(i);
+				}
+			}
+			sources.erase(t);
+		}
+
+		void clear_sources() {
+			sources.clear();
+			index.clear();
+			index_positions.clear();
+		}
+
+		void build_index() {
+			indexed = true;
+			for (Token<T> *t = this->token_list.begin(); t != NULL; t = this->token_list.next(t)) {
+				SourceList &list = index[sources[t]];
+				list.push_back(t);
+				index_positions[t] = SourcePosition(&list, --list.end());
+			}
+		}
+
 		static int sort_helper(const std::pair<Token<T>*, int> &p1,
 				   const std::pair<Token<T>*, int> &p2) {
 			return p1.second < p2.second;
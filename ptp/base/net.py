@@ -424,6 +424,19 @@ class EdgeInscription(utils.EqMixin):
                "from" in self.config or \
                "sort_by_source" in self.config
 
+    def is_source_indexed(self):
+        """ Returns True if tokens for the inscription can be looked up by the
+            index of sources in the place instead of going through all tokens,
+            i.e. the inscription has 'from' that does not depend on the token
+            itself """
+        if not self.is_token() or not self.config.get("from"):
+            return False
+        variables = self.edge.transition.net.project.get_expr_variables(
+            self.config["from"])
+        if self.config.get("svar") in variables:
+            return False
+        return not (self.is_expr_variable() and self.expr in variables)
+
     def has_same_pick_rule(self, inscription):
         return (inscription.config.get("filter") == self.config.get("filter") and
                 inscription.config.get("from") == self.config.get("from"))
@@ -78,6 +78,9 @@ class Project(object):
     def get_build_with_octave(self):
         return self.library_octave or self.get_build_option("USE_OCTAVE") == "True"
 
+    def get_build_split_nets(self):
+        return self.get_build_option("SPLIT_NETS") == "True"
+
     def get_parameter(self, name):
         return self.parameters.get(name)
 
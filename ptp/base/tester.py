@@ -79,6 +79,7 @@ class Tester:
         self.prepare_writer = None
         self.stdout = None
         self.stderr = None
+        self.returncode = None
 
     def add(self, check):
         self.checks.append(check)
@@ -108,6 +109,7 @@ class Tester:
                              stderr=subprocess.PIPE,
                              stdout=subprocess.PIPE)
         self.stdout, self.stderr = p.communicate()
+        self.returncode = p.returncode
         for line in self.stderr.split("\n"):
             check = self.process_message(line)
             if check is not None:
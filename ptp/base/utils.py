@@ -17,7 +17,9 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
 import re
+from StringIO import StringIO
 
 class PtpException(Exception):
 
@@ -131,6 +133,12 @@ def get_unique_id():
     id_counter += 1
     return id_counter
 
+def reset_unique_id():
+    """ Restarts ids, so a process building more projects generates the same
+        code as a new process """
+    global id_counter
+    id_counter = 1000
+
 class Makefile:
     """ Simple class for emitting makefile """
 
@@ -172,8 +180,9 @@ class Makefile:
                 out.write("\n")
 
     def write_to_file(self, filename):
-        with open(filename,"w") as f:
-            self.write(f)
+        out = StringIO()
+        self.write(out)
+        write_file_if_changed(filename, out.getvalue())
 
 def find_first(lst, fn):
     for i in lst:
@@ -209,3 +218,24 @@ def objects_with_same_attribute(list1, list2, key_fn):
         for b in list2:
             if key_fn(b) == key:
                 yield (a, b)
+
+# When it is a list, write_file_if_changed appends absolute paths of all
+# files to it (see ptp.serve)
+generated_files = None
+
+def write_file_if_changed(filename, content):
+    """ Writes content into the file only if the file does not already
+        contain it, so make does not rebuild targets depending on the
+        untouched file. Returns True if the file was written.
+    """
+    if generated_files is not None:
+        generated_files.append(os.path.abspath(filename))
+    try:
+        with open(filename, "r") as f:
+            if f.read() == content:
+                return False
+    except IOError:
+        pass
+    with open(filename, "w") as f:
+        f.write(content)
+    return True
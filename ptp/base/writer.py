@@ -17,6 +17,8 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import utils
+
 class Writer(object):
 
     filename = None
@@ -60,9 +62,8 @@ class Writer(object):
             assert self.filename is not None
             filename = self.filename
 
-        with open(filename, "w") as f:
-            for line in self.lines:
-                f.write(line + "\n")
+        utils.write_file_if_changed(
+            filename, "".join(line + "\n" for line in self.lines))
 
     def write_to_writer(self, writer):
         for line in self.lines:
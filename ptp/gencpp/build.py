@@ -45,7 +45,7 @@ def write_header(builder):
     write_first_lines(builder)
     builder.line("#include \"{0}.h\"", builder.project.get_name())
 
-def write_header_file(builder, close_guard=True):
+def write_header_file(builder, close_guard=True, head_code=True):
     write_first_lines(builder)
     guard = "KAIRA_PROJECT_{0}".format(get_safe_name(builder.project.get_name()))
     builder.line("#ifndef {0}", guard)
@@ -62,7 +62,7 @@ def write_header_file(builder, close_guard=True):
     builder.emptyline()
     write_parameters_forward(builder)
     builder.emptyline()
-    if builder.project.get_head_code():
+    if head_code and builder.project.get_head_code():
         builder.line_directive("*head", 1)
         builder.raw_text(builder.project.get_head_code())
         builder.emptyline()
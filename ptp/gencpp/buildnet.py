@@ -31,6 +31,16 @@ def write_register_net(builder, net):
     for i, tr in enumerate(net.transitions):
         builder.line("def_{0.id}->register_transition(&transition_{1.id});", net, tr)
 
+def write_register_net_function(builder, net):
+    builder.line("ca::NetDef * register_net_{0.id}()", net)
+    builder.block_begin()
+    write_register_net(builder, net)
+    builder.line("return def_{0.id};", net)
+    builder.block_end()
+
+def write_register_net_function_forward(builder, net):
+    builder.line("ca::NetDef * register_net_{0.id}();", net)
+
 def write_vars_struct(builder, tr):
     """
         Write class that servers as interface for transition's inner functions.
@@ -220,12 +230,15 @@ def write_user_functions(builder):
          and __BASE_FILE__ is overrdiden like __FILE__ in some compilers)
     """
     for net in builder.project.nets:
-        for tr in net.transitions:
-            if tr.code is not None:
-                write_transition_user_function(builder, tr)
-        for place in net.places:
-            if place.code is not None:
-                write_place_user_function(builder, place)
+        write_net_user_functions(builder, net)
+
+def write_net_user_functions(builder, net):
+    for tr in net.transitions:
+        if tr.code is not None:
+            write_transition_user_function(builder, tr)
+    for place in net.places:
+        if place.code is not None:
+            write_place_user_function(builder, place)
 
 def write_activation(builder, net, transitions):
     for tr in transitions:
@@ -716,9 +729,21 @@ def write_enable_pattern_match(builder,
             builder.write_else()
             builder.line("$inscription_if_{0.uid} = true;", inscription)
 
+        filter_expr = inscription.config.get("filter")
+        from_expr = inscription.config.get("from")
+
+        # Tokens from the source are found by the index of the place,
+        # other tokens are not visited at all
+        indexed = inscription.is_source_indexed()
+        if indexed:
+            next_method = "next_from"
+        else:
+            next_method = "next"
+
         prev = [ i for i in prev_inscriptions if i.edge == inscription.edge ]
         if prev and inscription.has_same_pick_rule(prev[-1]):
-            start_from = "$n->place_{0.edge.place.id}.next($token_{0.uid})".format(prev[-1])
+            start_from = "$n->place_{0.edge.place.id}.{1}($token_{0.uid})".format(
+                prev[-1], next_method)
             while prev and inscription.has_same_pick_rule(prev[-1]):
                 prev.pop()
             builder.line("$token_{0.uid} = {1};", inscription, builder.expand(start_from))
@@ -726,21 +751,22 @@ def write_enable_pattern_match(builder,
             call_fail()
             builder.block_end()
         else:
-            start_from = "$n->place_{0.id}.begin()".format(inscription.edge.place)
+            if indexed:
+                start_from = "$n->place_{0.id}.begin_from({1})".format(
+                    inscription.edge.place, from_expr)
+            else:
+                start_from = "$n->place_{0.id}.begin()".format(inscription.edge.place)
             builder.line("$token_{0.uid} = {1};", inscription, builder.expand(start_from))
-            if inscription.is_conditioned():
+            if inscription.is_conditioned() or indexed:
                 builder.if_begin("$token_{0.uid} == NULL", inscription)
                 call_fail()
                 builder.block_end()
 
-        filter_expr = inscription.config.get("filter")
-        from_expr = inscription.config.get("from")
-
         conditions = []
         if filter_expr:
             conditions.append(filter_expr)
 
-        if from_expr:
+        if from_expr and not indexed:
             conditions.append(
                 builder.expand("$n->place_{0.edge.place.id}.get_source($token_{0.uid}) == {1}",
                                inscription, from_expr))
@@ -754,7 +780,7 @@ def write_enable_pattern_match(builder,
 
         # If there are some token that can collide or filter expr
         # then we use cycle to go through other tokens
-        cycle = bool(prev or filter_expr or from_expr)
+        cycle = bool(conditions)
         if cycle:
             builder.line("for (;;)")
             builder.block_begin()
@@ -764,8 +790,8 @@ def write_enable_pattern_match(builder,
             builder.line("break;")
             builder.block_end()
 
-            builder.line("$token_{0.uid} = $n->place_{0.edge.place.id}.next($token_{0.uid});",
-                         inscription)
+            builder.line("$token_{0.uid} = $n->place_{0.edge.place.id}.{1}($token_{0.uid});",
+                         inscription, next_method)
 
             builder.if_begin("$token_{0.uid} == NULL", inscription)
             call_fail()
@@ -822,6 +848,18 @@ def write_core(builder):
     for net in builder.project.nets:
         write_net_functions(builder, net)
 
+def write_net_unit(builder, net):
+    """ Write a translation unit containing everything generated for the net,
+        the net is registered by register_net_<id>(). Units of different nets
+        share only the project header, so they can be compiled in parallel.
+    """
+    build.write_header(builder)
+    write_net_functions_forward(builder, net)
+    write_net_class(builder, net)
+    write_net_functions(builder, net)
+    write_register_net_function(builder, net)
+    write_net_user_functions(builder, net)
+
 def write_trace_token(builder, place, token_code, remove=False):
     if remove:
         builder.line("$tracelog->trace_token_remove({0.id}, {1});", place, token_code)
@@ -1052,7 +1090,10 @@ def write_net_functions(builder, net):
     for tr in net.transitions:
         write_transition_functions(builder, tr)
 
-def write_main_setup(builder, init_function="ca::init", start_process=True):
+def write_main_setup(builder,
+                     init_function="ca::init",
+                     start_process=True,
+                     net_units=False):
     builder.line("ca::project_description({0});",
         const_string(builder.project.description))
     builder.line("std::vector<ca::Parameter*> parameters;")
@@ -1065,7 +1106,10 @@ def write_main_setup(builder, init_function="ca::init", start_process=True):
     builder.emptyline()
 
     for net in builder.project.nets:
-        write_register_net(builder, net)
+        if net_units:
+            builder.line("ca::NetDef *def_{0.id} = register_net_{0.id}();", net)
+        else:
+            write_register_net(builder, net)
 
     defs = [ "def_{0.id}".format(net) for net in builder.project.nets ]
     builder.line("ca::NetDef *defs[] = {{{0}}};", ",".join(defs))
@@ -22,9 +22,15 @@ import base.tester
 import base.utils as utils
 import base.paths as paths
 from base.net import Declarations
+from base.writer import Writer
+import os
 import os.path
 import build
+import hashlib
+import re
+import subprocess
 from copy import copy
+from distutils.spawn import find_executable
 
 class CheckStatement(base.tester.Check):
 
@@ -125,6 +131,64 @@ class TypeChecker:
             tester.add(check)
 
 
+class CheckCache:
+
+    """ Keys of checks that were compiled without errors, stored in a file.
+        A key is a hash of the compiled context (the project header, the
+        prologue of the tested file, the compiler and its arguments) and of
+        the text of the check. Names created by new_id() are renamed by the order of
+        their appearance, so they do not change keys.
+    """
+
+    id_pattern = re.compile("____cpptest____\d+")
+
+    def __init__(self, filename, context):
+        self.filename = filename
+        self.context = hashlib.sha1(context).hexdigest()
+        self.passed = set()
+        self.used = set()
+        try:
+            with open(filename, "r") as f:
+                # Keys stored by another user are not trusted
+                if os.fstat(f.fileno()).st_uid == os.getuid():
+                    self.passed = set(line.strip() for line in f)
+        except IOError:
+            pass
+
+    def get_key(self, check=None):
+        """ Returns the key of a check, or of the context if check is None """
+        text = ""
+        if check is not None:
+            writer = Writer()
+            check.write(writer)
+            ids = {}
+            text = self.id_pattern.sub(
+                lambda m: "@{0}".format(ids.setdefault(m.group(0), len(ids))),
+                writer.get_string())
+        return hashlib.sha1(self.context + "\0" + text).hexdigest()
+
+    def is_passed(self, key):
+        self.used.add(key)
+        return key in self.passed
+
+    def add(self, keys):
+        self.passed.update(keys)
+
+    def save(self):
+        """ Stores keys of passed checks used in this run, failures are
+            ignored """
+        try:
+            fd = os.open(self.filename,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            os.fchmod(fd, 0600)
+            with os.fdopen(fd, "w") as f:
+                for key in sorted(self.passed & self.used):
+                    f.write(key + "\n")
+        except (IOError, OSError):
+            # The cache is optional, e.g. the directory may be read-only
+            pass
+
+
 class Checker:
 
     def __init__(self, project):
@@ -184,6 +248,7 @@ class Checker:
 
         build.write_header_file(builder)
         builder.write_to_file()
+        header = builder.get_string()
 
         tester = base.tester.Tester()
         tester.prepare_writer = self.prepare_writer
@@ -199,10 +264,20 @@ class Checker:
             tester.args += [ "-I", os.path.join(paths.KAIRA_ROOT, paths.CASIMRUN_INCLUDE_DIR) ]
 
         tester.args += self.project.get_build_option("CFLAGS").split()
-        tester.run()
 
-        if tester.stderr:
-            raise utils.PtpException(tester.stderr)
+        # Checks that passed with the same context are not compiled again
+        cache = CheckCache(self.get_cache_filename(),
+                           "\0".join([ header,
+                                       self.prepare_writer(tester.filename)
+                                           .get_string() ] +
+                                      get_compiler_id() +
+                                      list(tester.args)))
+        key = cache.get_key()
+        if not cache.is_passed(key):
+            tester.run()
+            if tester.stderr:
+                raise utils.PtpException(tester.stderr)
+            cache.add([ key ])
 
         for t in self.types.values():
             t.add_checks(tester)
@@ -210,6 +285,39 @@ class Checker:
         for check in self.checks:
             tester.add(check)
 
-        check = tester.run()
-        if check is not None:
-            check.throw_exception()
+        keys = [ cache.get_key(check) for check in tester.checks ]
+        tester.checks = [ check for check, key in zip(tester.checks, keys)
+                          if not cache.is_passed(key) ]
+        if tester.checks:
+            check = tester.run()
+            if check is not None or tester.returncode != 0:
+                # Nothing from a failed compilation is cached
+                cache.save()
+                if check is not None:
+                    check.throw_exception()
+                return
+        cache.add(keys)
+        cache.save()
+
+    def get_cache_filename(self):
+        # The cache belongs to the user like the file compiled by Tester;
+        # projects with the same name have their own files
+        directory = hashlib.sha1(self.project.root_directory).hexdigest()[:8]
+        return os.path.join("/tmp", "kaira-{0}-{1}-{2}.checks".format(
+            os.getuid(), self.project.get_name(), directory))
+
+
+def get_compiler_id():
+    """ Returns the path and the version of the compiler run by Tester, an
+        update of the compiler invalidates cached checks """
+    path = find_executable("g++")
+    if path is None:
+        return [ "" ]
+    try:
+        p = subprocess.Popen((path, "--version"),
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        version = p.communicate()[0]
+    except OSError:
+        version = ""
+    return [ path, version ]
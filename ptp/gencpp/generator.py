@@ -22,6 +22,7 @@ import base.utils
 import makefiles
 
 import build
+import buildnet
 import writer
 import program
 import library
@@ -98,9 +99,30 @@ class CppGenerator:
     def build(self, directory):
         self.write_header_file(directory)
         builder = build.Builder(self.project, self.get_filename(directory, ".cpp"))
-        program.write_standalone_program(builder)
+        units = []
+        if self.project.get_build_split_nets():
+            if len(self.project.nets) > 1 and self.project.get_head_code():
+                # Each unit includes the head code, so functions defined in
+                # it would be linked once for every net
+                raise base.utils.PtpException(
+                    "Nets cannot be compiled separately when the project "
+                    "has more than one net and a head code")
+            program.write_program_main(builder)
+            for net in self.project.nets:
+                units.append(self.write_net_unit(directory, net))
+        else:
+            program.write_standalone_program(builder)
+        builder.write_to_file()
+        makefiles.write_program_makefile(self.project, directory, units)
+
+    def write_net_unit(self, directory, net):
+        """ Writes the translation unit of the net, returns its name """
+        name = makefiles.get_net_unit_name(self.project, net)
+        builder = build.Builder(self.project,
+                                os.path.join(directory, name + ".cpp"))
+        buildnet.write_net_unit(builder, net)
         builder.write_to_file()
-        makefiles.write_program_makefile(self.project, directory)
+        return name
 
     def build_statespace(self, directory):
         self.write_header_file(directory)
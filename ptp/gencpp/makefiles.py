@@ -86,6 +86,15 @@ def prepare_makefile(project, config, directory):
 
     return makefile
 
+def get_source_dependancies(project, source):
+    """ Prerequisites of an object compiled from a generated source. Generated
+        files are rewritten only when their content changes, so the header
+        and the makefile (compiler flags) have to be listed explicitly. """
+    return [ source, project.get_name() + ".h", "makefile" ]
+
+def get_net_unit_name(project, net):
+    return "{0}_net{1.id}".format(project.get_name(), net)
+
 def get_other_dependancies(project, directory):
     d = os.path.relpath(project.get_root_directory(), directory)
     if project.get_build_option("OTHER_FILES"):
@@ -94,14 +103,15 @@ def get_other_dependancies(project, directory):
     else:
         return []
 
-def prepare_program_makefile(project, config, directory, other_files=None):
+def prepare_program_makefile(project, config, directory, other_files=None, units=()):
+    """ units -- names of additional generated translation units """
     makefile = prepare_makefile(project, config, directory)
 
     name = project.get_name()
-    name_o = name + ".o"
-    name_cpp = name + ".cpp"
+    units = [ name ] + list(units)
 
-    deps = [ name_o ] + get_other_dependancies(project, directory)
+    deps = [ unit + ".o" for unit in units ] + \
+        get_other_dependancies(project, directory)
 
     if other_files is None:
         other_files = []
@@ -110,9 +120,10 @@ def prepare_program_makefile(project, config, directory, other_files=None):
     makefile.rule(name,
                   deps,
                   "$(CXX) " + " ".join(deps) + " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(LIBS) ")
-    makefile.rule(name_o,
-                  [ name_cpp ],
-                  "$(CXX) $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_o))
+    for unit in units:
+        makefile.rule(unit + ".o",
+                      get_source_dependancies(project, unit + ".cpp"),
+                      "$(CXX) $(CFLAGS) $(INCLUDE) -c {0}.cpp -o {0}.o".format(unit))
     makefile.rule("clean",
                   [],
                   "rm -f {0} {1}".format(name, " ".join(deps + list(other_files))), phony=True)
@@ -136,23 +147,25 @@ def write_simrun_makefile(project, directory):
     makefile = prepare_program_makefile(project, config, directory)
     makefile.write_to_file(os.path.join(directory, "makefile"))
 
-def write_program_makefile(project, directory):
+def write_program_makefile(project, directory, units=()):
+    """ units -- names of translation units of nets (see get_net_unit_name)
+                 if the nets are not in the main source """
     name = project.get_name()
-    name_cpp = name + ".cpp"
     name_mpi = name + "_mpi"
-    name_mpi_o = name + "_mpi.o"
-    other_files = [ name_mpi, name_mpi_o ]
-    makefile = prepare_program_makefile(project, None, directory, other_files)
+    objects_mpi = [ unit + "_mpi.o" for unit in [ name ] + list(units) ]
+    other_files = [ name_mpi ] + objects_mpi
+    makefile = prepare_program_makefile(project, None, directory, other_files, units)
 
     makefile.rule("mpi", [ name_mpi ], phony=True)
 
     other_deps = get_other_dependancies(project, directory)
-    deps_mpi = [ name_mpi_o ] + other_deps
+    deps_mpi = objects_mpi + other_deps
 
     makefile.rule(name_mpi, deps_mpi, "$(MPICXX) -D CA_MPI " + " ".join(deps_mpi)
         + " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(MPILIBS)" )
-    makefile.rule(name_mpi_o, [ name_cpp ],
-        "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_mpi_o))
+    for unit in [ name ] + list(units):
+        makefile.rule(unit + "_mpi.o", get_source_dependancies(project, unit + ".cpp"),
+            "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0}.cpp -o {0}_mpi.o".format(unit))
     makefile.write_to_file(os.path.join(directory, "makefile"))
 
 def write_server_makefile(project, directory):
@@ -184,10 +197,10 @@ def write_server_makefile(project, directory):
     makefile.rule(name_mpi, deps_mpi, "$(MPICXX) " + " ".join(deps_mpi) +
         " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(MPILIBS)" )
 
-    makefile.rule(name_o, [ name_cpp ],
+    makefile.rule(name_o, get_source_dependancies(project, name_cpp),
         "$(CXX) $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_o))
 
-    makefile.rule(name_mpi_o, [ name_cpp ],
+    makefile.rule(name_mpi_o, get_source_dependancies(project, name_cpp),
         "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_mpi_o))
 
     makefile.rule("clean", [], "rm -f {0} {0}_mpi {0}_mpi.o {1}".format(name," ".join(deps)))
@@ -249,8 +262,9 @@ def write_library_makefile(project, directory, rpc=False):
     makefile.rule(libname_a, deps, "ar -cr lib{0}.a ".format(name) + " ".join(deps))
 
     makefile.rule(libname_mpi_a, deps_mpi, "ar -cr lib{0}_mpi.a ".format(name) + " ".join(deps_mpi))
+    makefile.rule(name_o, get_source_dependancies(project, name_cpp))
     makefile.rule(name_mpi_o,
-                  [ name_cpp ],
+                  get_source_dependancies(project, name_cpp),
                   "$(MPICXX) -DCA_MPI $(CFLAGS) $(INCLUDE) -c {0} -o {1}"
                     .format(name_cpp, name_mpi_o))
 
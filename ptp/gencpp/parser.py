@@ -19,6 +19,7 @@
 
 import pyparsing as pp
 import base.utils as utils
+from collections import OrderedDict
 
 # Reserved words of C++ (including C++11)
 reserved_words = set([
@@ -96,6 +97,52 @@ init_by_vector = pp.ParseElementEnhance(full_expression).setParseAction(
     lambda t: ("vector", t[0]))
 init_expression = init_by_expressions | init_by_vector
 
+
+class ParseCache(object):
+
+    """ Results of parsing of strings, the least recently used results are
+        dropped when the cache is full. Only successful parses are stored, so
+        errors are always reported with the right source. """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key, fn):
+        """ Returns the cached result for the key, or fn() if there is none """
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            value = fn()
+            if len(self.items) >= self.size:
+                self.items.popitem(last=False)
+        self.items[key] = value
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+expression_cache = ParseCache()
+edge_expression_cache = ParseCache()
+variables_cache = ParseCache()
+typename_cache = ParseCache()
+is_variable_cache = ParseCache()
+
+def freeze(results):
+    """ Returns parse results as nested tuples, so a cached result cannot be
+        changed by a caller """
+    if isinstance(results, pp.ParseResults):
+        return tuple(freeze(item) for item in results)
+    return results
+
+def clear_caches():
+    for cache in (expression_cache,
+                  edge_expression_cache,
+                  variables_cache,
+                  typename_cache,
+                  is_variable_cache):
+        cache.clear()
+
 def parse_expression(expr, source, allow_empty):
     if len(expr.strip()) == 0:
         if allow_empty:
@@ -103,33 +150,39 @@ def parse_expression(expr, source, allow_empty):
         else:
             return "Missing expression"
     try:
-        return full_expression.parseString(expr, parseAll=True)[0]
+        return expression_cache.get(
+            expr, lambda: full_expression.parseString(expr, parseAll=True)[0])
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
 def get_expr_variables(expr):
     if not expr:
         return set()
-    s = set(expression.parseString(expr, parseAll=True))
-    s.difference_update(reserved_words)
-    return s
+    def parse():
+        s = frozenset(expression.parseString(expr, parseAll=True))
+        return s.difference(reserved_words)
+    # Callers may modify the returned set
+    return set(variables_cache.get(expr, parse))
 
 def parse_typename(tname, source):
     if len(tname) == 0:
         raise utils.PtpException("Missing type", source)
     try:
-        return typename.parseString(tname, parseAll=True)
+        return typename_cache.get(
+            tname, lambda: freeze(typename.parseString(tname, parseAll=True)))
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
 def is_variable(expr):
     if expr is None or expr.strip() in reserved_words:
         return False
-    try:
-        ident.parseString(expr, parseAll=True)
-        return True
-    except pp.ParseException:
-        return False
+    def parse():
+        try:
+            ident.parseString(expr, parseAll=True)
+            return True
+        except pp.ParseException:
+            return False
+    return is_variable_cache.get(expr, parse)
 
 def take_substrings(string, pairs):
     return [ string[start:end] for start, end in pairs ]
@@ -155,7 +208,9 @@ def parse_edge_expression(string, source):
         raise utils.PtpException("Missing expression", source)
 
     try:
-        inscriptions = edge_expr.parseString(string, parseAll=True)
+        inscriptions = edge_expression_cache.get(
+            string,
+            lambda: freeze(edge_expr.parseString(string, parseAll=True)))
     except pp.ParseException, e:
         raise utils.PtpException(e.msg, source)
 
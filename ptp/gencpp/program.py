@@ -21,10 +21,10 @@
 import buildnet
 import build
 
-def write_main(builder):
+def write_main(builder, net_units=False):
     builder.line("int main(int argc, char **argv)")
     builder.block_begin()
-    buildnet.write_main_setup(builder)
+    buildnet.write_main_setup(builder, net_units=net_units)
     builder.line("ca::spawn_net(0);");
     builder.line("ca::main();");
     builder.line("return 0;")
@@ -35,3 +35,16 @@ def write_standalone_program(builder):
     buildnet.write_core(builder)
     write_main(builder)
     buildnet.write_user_functions(builder)
+
+def write_program_main(builder):
+    """ Write the main translation unit of a program whose nets are written
+        by buildnet.write_net_unit. The head code is not included, so
+        functions defined in it are compiled only once for one net.
+    """
+    build.write_header_file(builder, head_code=False)
+    builder.emptyline()
+    build.write_basic_definitions(builder)
+    for net in builder.project.nets:
+        buildnet.write_register_net_function_forward(builder, net)
+    builder.emptyline()
+    write_main(builder, net_units=True)
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 import sys
+import os
 import traceback
 import argparse
 import ConfigParser
+import hashlib
+from StringIO import StringIO
 
 import base.paths
 
@@ -14,6 +17,7 @@ if not config.read(base.paths.KAIRA_CONFIG_INI):
     sys.exit(1)
 
 import base.project as project
+import base.utils
 from base.utils import PtpException
 import gencpp.targetenv
 
@@ -35,16 +39,96 @@ def get_config(section, name, raise_error=True):
 def get_generator_from_xml(element, load_nets=True):
     return project.load_project(element, target_envs, load_nets=load_nets).get_generator()
 
+def build(filename, operation, output_directory):
+    p = project.load_project_from_file(filename, target_envs, operation)
+    p.check()
+    p.analyze()
+    generator = p.get_generator()
+
+    if operation == "build":
+        generator.build(output_directory)
+    elif operation == "statespace":
+        generator.build_statespace(output_directory)
+    elif operation == "simrun":
+        generator.build_simrun(output_directory)
+    elif operation == "lib":
+        generator.build_lib(output_directory)
+    else:
+        raise PtpException("Unknown operation")
+
+def serve(input, output):
+    """ Builds projects until the input is closed, so each build does not pay
+        for the start of Python and imports.
+
+        Each line of the input is a request: working directory, operation,
+        path to XML file, output directory and "True"/"False" (debug mode)
+        separated by tabs. The paths may be relative to the working
+        directory, the same as the arguments of ptp run in that directory.
+        The answer is a line "<exit code> <number of lines>" followed by that
+        many lines of messages, the same as ptp prints to stdout when it is
+        run for one project; stderr is not a part of answers. A malformed
+        request is answered by the exit code 1 and an error message. A
+        request whose XML file, operation and output directory are the same
+        as in the last successful build of the file is not built again,
+        unless a file generated by that build is missing.
+    """
+    built = {}
+    for request in iter(input.readline, ""):
+        messages = StringIO()
+        code = 0
+        debug = "False"
+        stdout = sys.stdout
+        sys.stdout = messages
+        try:
+            fields = request.rstrip("\n").split("\t")
+            if len(fields) != 5:
+                raise PtpException("Invalid request '{0}'".format(
+                    request.rstrip("\n")))
+            directory, operation, filename, output_directory, debug = fields
+            os.chdir(directory)
+            filename = os.path.abspath(filename)
+            output_directory = os.path.abspath(output_directory)
+            with open(filename, "r") as f:
+                key = (operation, output_directory,
+                       hashlib.sha1(f.read()).hexdigest())
+            last_key, files = built.pop(filename, (None, ()))
+            if last_key != key or not all(os.path.isfile(name)
+                                          for name in files):
+                base.utils.reset_unique_id()
+                base.utils.generated_files = []
+                build(filename, operation, output_directory)
+                files = base.utils.generated_files
+            built[filename] = (key, files)
+        except (PtpException, IOError, OSError), e:
+            print e
+            if debug == "True":
+                traceback.print_exc(file=sys.stdout)
+            code = 1
+        except Exception:
+            # A bug in ptp should not stop the server
+            traceback.print_exc(file=sys.stdout)
+            code = 1
+        finally:
+            sys.stdout = stdout
+            base.utils.generated_files = None
+        lines = messages.getvalue().splitlines()
+        output.write("{0} {1}\n".format(code, len(lines)))
+        for line in lines:
+            output.write(line + "\n")
+        output.flush()
+
 def main():
     parser = argparse.ArgumentParser(description="PTP - ProjectToProgram compiler")
     parser.add_argument("operation",
                         metavar="OPERATION",
                         type=str,
-                        help="Possible values: build, statespace,"
-                             "place-user-fn, transition-user-fn")
+                        help="Possible values: build, statespace, simrun, "
+                             "lib, server (builds requests from stdin, "
+                             "see serve())")
     parser.add_argument("project",
                         metavar="FILENAME",
                         type=str,
+                        nargs="?",
                         help="path to XML file generated by GUI")
     parser.add_argument("--debug",
                         action='store_true',
@@ -64,21 +148,14 @@ def main():
     else:
         output_directory = args.output
 
-    p = project.load_project_from_file(args.project, target_envs, args.operation)
-    p.check()
-    p.analyze()
-    generator = p.get_generator()
+    if args.operation == "server":
+        serve(sys.stdin, sys.stdout)
+        return
 
-    if args.operation == "build":
-        generator.build(output_directory)
-    elif args.operation == "statespace":
-        generator.build_statespace(output_directory)
-    elif args.operation == "simrun":
-        generator.build_simrun(output_directory)
-    elif args.operation == "lib":
-        generator.build_lib(output_directory)
-    else:
-        raise PtpException("Unknown operation")
+    if args.project is None:
+        parser.error("FILENAME is required for operation '{0}'"
+                        .format(args.operation))
+    build(args.project, args.operation, output_directory)
 
 if __name__ == '__main__':
     try:
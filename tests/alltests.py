@@ -4,5 +4,7 @@ from tests import *
 from tests_mpi import *
 from tests_octave import *
 from tests_verification import *
+from tests_tracelog import *
+from tests_table import *
 
 unittest.main()
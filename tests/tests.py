@@ -1,13 +1,40 @@
 # -*- coding: utf-8 -*-
 
-from testutils import Project
+from testutils import Project, PTP_BIN
+from StringIO import StringIO
+import os
+import sys
+import time
 import unittest
 
+sys.path.insert(0, os.path.dirname(PTP_BIN))
+import ptp
+import base.project
+import base.tester
+import gencpp.checker
+import gencpp.parser
+from base.net import Declarations
+from base.utils import PtpException
+
 class BuildTest(unittest.TestCase):
 
     def test_helloworld(self):
         Project("helloworld", "helloworlds").quick_test("Hello world 12\n")
 
+    def test_rebuild(self):
+        p = Project("helloworld", "helloworlds")
+        p.build()
+        filenames = [ os.path.join(p.get_directory(), name)
+                      for name in ("helloworld.cpp", "helloworld.h",
+                                   "makefile") ]
+        mtimes = [ os.path.getmtime(filename) for filename in filenames ]
+        # A rewritten file would get a different time
+        time.sleep(1)
+        p.build()
+        self.assertEquals(mtimes, [ os.path.getmtime(filename)
+                                    for filename in filenames ])
+        p.run("Hello world 12\n")
+
     def test_basictypes(self):
         Project("basictypes").quick_test("", processes=2)
 
@@ -20,6 +47,12 @@ class BuildTest(unittest.TestCase):
     def test_from(self):
         Project("from").quick_test("Ok\n", processes=4)
 
+    def test_from2(self):
+        # Tokens are found by sources after removals, received tokens and
+        # copied or moved local tokens are added to the place
+        output = "11\n21 22 12\n7 8 13 23\n9\n7\n8\n9\n"
+        Project("from2").quick_test(output, processes=3)
+
     def test_bulk(self):
         output = "1\n2\n3\n4\na\nb\nc\n"
         Project("bulk").quick_test(output, processes=3)
@@ -51,15 +84,34 @@ class BuildTest(unittest.TestCase):
     def test_priorities(self):
         Project("priorities").quick_test("C\nB\nB\nB\nB\nB\nB\nB\nB\nB\nB\n")
 
+    def check_workers_output(self, output):
+        self.assertEquals(76127, sum([ int(x) for x in output.split("\n")
+                                              if x.strip() != "" ]))
+
     def test_workers(self):
-        def check_output(output):
-            self.assertEquals(76127, sum([ int(x) for x in output.split("\n")
-                                                  if x.strip() != "" ]))
         params = { "LIMIT" : "1000", "SIZE" : "20" }
         p = Project("workers")
         p.build()
-        p.run(result_fn=check_output, processes=2, params=params)
-        p.run(result_fn=check_output, processes=6, params=params, repeat=70)
+        p.run(result_fn=self.check_workers_output, processes=2, params=params)
+        p.run(result_fn=self.check_workers_output, processes=6, params=params,
+              repeat=70)
+
+    def test_workers_split_nets(self):
+        params = { "LIMIT" : "1000", "SIZE" : "20" }
+        p = Project("workers", build_options={ "SPLIT_NETS" : "True" })
+        p.build()
+        units = [ name for name in os.listdir(p.get_directory())
+                  if name.startswith("workers_net") and name.endswith(".cpp") ]
+        self.assertTrue(units)
+        p.run(result_fn=self.check_workers_output, processes=2, params=params)
+        p.run(result_fn=self.check_workers_output, processes=6, params=params,
+              repeat=10)
+
+    def test_split_nets_with_head_code(self):
+        # Functions of the head code would be defined in units of both nets
+        Project("rpc", build_options={ "SPLIT_NETS" : "True" }).fail_ptp(
+            "Nets cannot be compiled separately when the project has more "
+            "than one net and a head code\n")
 
     def test_origin(self):
         Project("origin").quick_test("Ok\n", processes=3)
@@ -180,5 +232,175 @@ class LibTest(unittest.TestCase):
         finally:
             p.stop_server()
 
+class PtpServerTest(unittest.TestCase):
+
+    def serve(self, input):
+        output = StringIO()
+        # Requests change the working directory
+        cwd = os.getcwd()
+        try:
+            ptp.serve(input, output)
+        finally:
+            os.chdir(cwd)
+        return output.getvalue()
+
+    def test_server(self):
+        p = Project("helloworld", "helloworlds")
+        p.export()
+        # Paths are relative to the working directory of the request
+        request = "\t".join((p.get_directory(), "build",
+                             os.path.basename(p.get_xml_filename()), ".",
+                             "False"))
+        output = self.serve(StringIO("".join(
+            line + "\n" for line in [ "build", request, request ])))
+        self.assertEquals("1 1\nInvalid request 'build'\n0 0\n0 0\n", output)
+        p.make_project()
+        p.run("Hello world 12\n")
+
+    def test_missing_output(self):
+        p = Project("helloworld", "helloworlds")
+        p.export()
+        source = os.path.join(p.get_directory(), "helloworld.cpp")
+        lines = [ "\t".join((p.get_directory(), "build",
+                             p.get_xml_filename(), p.get_directory(),
+                             "False")) + "\n" ] * 3
+
+        class Input:
+            def readline(self):
+                if len(lines) == 1:
+                    os.remove(source)
+                return lines.pop(0) if lines else ""
+
+        # Numbers of requests left when a build is done
+        builds = []
+        build = ptp.build
+        def counted_build(*args):
+            build(*args)
+            builds.append(len(lines))
+        ptp.build = counted_build
+        try:
+            self.assertEquals("0 0\n0 0\n0 0\n", self.serve(Input()))
+        finally:
+            ptp.build = build
+        # The second request is skipped, the third one generates the
+        # removed source again
+        self.assertEquals([ 2, 0 ], builds)
+        self.assertTrue(os.path.exists(source))
+
+class CheckCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        p = Project("helloworld", "helloworlds")
+        p.export()
+        self.project = base.project.load_project_from_file(
+            p.get_xml_filename(), ptp.target_envs)
+        self.filename = \
+            gencpp.checker.Checker(self.project).get_cache_filename()
+        self.remove_cache()
+
+        # Numbers of checks compiled by each run of the compiler
+        self.compiled = []
+        run = base.tester.Tester.run
+        def counted_run(tester):
+            self.compiled.append(len(tester.checks))
+            return run(tester)
+        base.tester.Tester.run = counted_run
+        self.addCleanup(setattr, base.tester.Tester, "run", run)
+
+    def tearDown(self):
+        self.remove_cache()
+
+    def remove_cache(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def check(self, *expressions):
+        """ Runs the checker, each expression gives two checks """
+        checker = gencpp.checker.Checker(self.project)
+        for expression in expressions:
+            checker.check_expression(expression, Declarations(), "int", None)
+        del self.compiled[:]
+        checker.run()
+        return self.compiled
+
+    def test_hit(self):
+        # The context is compiled without checks first
+        self.assertEquals([0, 2], self.check("1 + 2"))
+        self.assertEquals([], self.check("1 + 2"))
+        stat = os.stat(self.filename)
+        self.assertEquals(os.getuid(), stat.st_uid)
+        self.assertEquals(0600, stat.st_mode & 0777)
+
+    def test_miss(self):
+        self.check("1 + 2")
+        self.assertEquals([2], self.check("1 + 2", "3 * 4"))
+        # Another compiler invalidates all checks
+        compiler_id = gencpp.checker.get_compiler_id
+        gencpp.checker.get_compiler_id = lambda: [ "/usr/bin/g++", "0.0" ]
+        try:
+            self.assertEquals([0, 4], self.check("1 + 2", "3 * 4"))
+        finally:
+            gencpp.checker.get_compiler_id = compiler_id
+
+    def test_failed_compilation(self):
+        self.check("1 + 2")
+        self.assertRaises(PtpException,
+                          self.check, "1 + 2", "3 * 4", "no_such_name")
+        # Checks compiled together with the failed one were not cached
+        self.assertEquals([2], self.check("1 + 2", "3 * 4"))
+        self.assertRaises(PtpException, self.check, "no_such_name")
+        self.assertEquals([2], self.compiled)
+
+class ParserTest(unittest.TestCase):
+
+    def setUp(self):
+        gencpp.parser.clear_caches()
+
+    def test_cache_eviction(self):
+        parsed = []
+        def parse(key):
+            def fn():
+                parsed.append(key)
+                return key.upper()
+            return fn
+        cache = gencpp.parser.ParseCache(size=2)
+        for key in [ "a", "b", "a", "c", "a", "b" ]:
+            self.assertEquals(key.upper(), cache.get(key, parse(key)))
+        # "b" is the least recently used when "c" is added
+        self.assertEquals([ "a", "b", "c", "b" ], parsed)
+        self.assertEquals([ "a", "b" ], list(cache.items))
+
+    def test_clear_caches(self):
+        gencpp.parser.parse_typename("int", None)
+        gencpp.parser.parse_edge_expression("x", None)
+        self.assertTrue(gencpp.parser.typename_cache.items)
+        self.assertTrue(gencpp.parser.edge_expression_cache.items)
+        gencpp.parser.clear_caches()
+        self.assertFalse(gencpp.parser.typename_cache.items)
+        self.assertFalse(gencpp.parser.edge_expression_cache.items)
+
+    def test_repeated_parses(self):
+        for i in xrange(2):
+            t = gencpp.parser.parse_typename("std::vector<int>", None)
+            self.assertEquals(("std::vector", ("int",)), t)
+            # The cached result cannot be changed
+            self.assertTrue(isinstance(t, tuple) and isinstance(t[1], tuple))
+
+        for i in xrange(2):
+            inscriptions = gencpp.parser.parse_edge_expression(
+                "[bulk, guard(x > 1)] x@y; z", None)
+            self.assertEquals(
+                [ ({ "bulk" : None, "guard" : "x > 1" }, "x", "y"),
+                  ({}, "z", None) ], inscriptions)
+            inscriptions[0][0]["bulk"] = "changed"
+            inscriptions.append(None)
+
+        # Errors found in cached results are raised again
+        for i in xrange(2):
+            self.assertRaises(PtpException,
+                              gencpp.parser.parse_edge_expression,
+                              "[bulk, bulk] x", "*1/inscription")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+from testutils import KAIRA_GUI
+import random
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, KAIRA_GUI)
+from table import Table
+
+
+class SmallTable(Table):
+
+    # Appends of a few rows cross chunks
+    chunk_size = 4
+
+
+class TableTest(unittest.TestCase):
+
+    columns = [ ("a", "<i4"), ("b", "<f8"), ("c", "S3") ]
+
+    def check_rows(self, table, rows):
+        self.assertEquals(len(rows), len(table))
+        self.assertEquals(rows, [ tuple(row) for row in table ])
+        for index, (name, t) in enumerate(self.columns):
+            valid = [ row[index] is not None for row in rows ]
+            self.assertEquals(valid, table.get_column_validity(name).tolist())
+            self.assertEquals(
+                [ value for value in (row[index] for row in rows)
+                  if value is not None ],
+                table.get_column(name)[np.array(valid, dtype=bool)].tolist())
+            self.assertEquals([ not v for v in valid ],
+                              np.ma.getmaskarray(table.data[name]).tolist())
+
+    def random_row(self):
+        return (random.choice((None, random.randint(-5, 5))),
+                random.choice((None, random.random())),
+                random.choice((None, "x", "yz")))
+
+    def test_appends_across_chunks(self):
+        random.seed(1)
+        for i in xrange(20):
+            table = SmallTable(self.columns, random.randint(1, 6))
+            rows = []
+            for j in xrange(30):
+                if random.random() < 0.6:
+                    row = self.random_row()
+                    table.add_row(row)
+                    rows.append(row)
+                else:
+                    new_rows = [ self.random_row()
+                                 for k in xrange(random.randint(0, 9)) ]
+                    if new_rows:
+                        columns = zip(*new_rows)
+                    else:
+                        columns = [ [], [], [] ]
+                    table.append_columns(
+                        [ [ 0 if v is None else v for v in column ]
+                          for column in columns ],
+                        [ [ v is not None for v in column ]
+                          for column in columns ])
+                    rows += new_rows
+                if random.random() < 0.3:
+                    # Reads consolidate chunks between appends
+                    self.check_rows(table, rows)
+            self.check_rows(table, rows)
+            table.trim()
+            self.check_rows(table, rows)
+
+    def test_append_columns_without_copy(self):
+        table = SmallTable(self.columns)
+        a = np.arange(10, dtype="<i4")
+        table.append_columns({ "a" : a,
+                               "b" : np.zeros(10),
+                               "c" : np.array(["x"] * 10) })
+        self.assertTrue(np.may_share_memory(table.get_column("a"), a))
+        self.assertEquals([True] * 10, table.get_column_validity("a").tolist())
+        table.add_row((10, 1.0, None))
+        self.assertEquals(range(11), table.get_column("a").tolist())
+        self.assertEquals(range(10), a.tolist())
+
+    def test_masked_values(self):
+        table = SmallTable(self.columns)
+        rows = [ (1, None, "x"), (None, 2.5, None), (3, 3.5, "abc") ]
+        for row in rows:
+            table.add_row(row)
+        self.check_rows(table, rows)
+        self.assertEquals([1, 3], table.select("a", [ ("a", np.greater, 0) ])
+                                       .compressed().tolist())
+        # Invalid values never pass filters
+        filtered = table.filter([ ("b", np.less, 10) ])
+        self.check_rows(filtered, rows[1:])
+
+        copy = Table.create_from_data(table.data)
+        self.check_rows(copy, rows)
+
+    def test_slicing(self):
+        table = SmallTable(self.columns)
+        rows = [ (i, i / 2.0, str(i)) if i % 3 else (i, None, None)
+                 for i in xrange(11) ]
+        for row in rows:
+            table.add_row(row)
+        self.assertEquals(rows[5], tuple(table[5]))
+        self.assertEquals(range(2, 9, 3), table[2:9:3]["a"].tolist())
+        self.assertEquals([ row[1] for row in rows[3:7] ],
+                          table[3:7]["b"].tolist())
+        self.assertEquals(range(11), table["a"].tolist())
+        self.assertEquals([ row[2] for row in rows[-4:] ],
+                          table.select(["a", "c"])[-4:]["c"].tolist())
+        self.assertEquals(0, len(table[11:]))
+
+    def test_clear(self):
+        table = SmallTable(self.columns)
+        for i in xrange(9):
+            table.add_row((i, None, "x"))
+        table.clear()
+        self.check_rows(table, [])
+        table.add_row((1, 1.0, None))
+        self.check_rows(table, [ (1, 1.0, None) ])
+
+    def create_groups_table(self):
+        table = SmallTable(self.columns)
+        rows = [ (2, 1.0, "x"), (1, 2.0, "y"), (2, None, "x"),
+                 (None, 4.0, "x"), (1, 5.0, "x"), (2, 6.0, None),
+                 (3, None, "y") ]
+        for row in rows:
+            table.add_row(row)
+        return table
+
+    def test_group_by(self):
+        table = self.create_groups_table()
+        groups = table.group_by("a", "b")
+        # Rows with an invalid key are skipped, the order within a group is
+        # kept
+        self.assertEquals([1, 2, 3], sorted(groups.keys()))
+        self.assertEquals([2.0, 5.0], groups[1].tolist())
+        self.assertEquals([1.0, None, 6.0], groups[2].tolist())
+        self.assertEquals([None], groups[3].tolist())
+
+        groups = table.group_by(["a", "c"], ["b"],
+                                [ ("b", np.greater, 1.5) ])
+        self.assertEquals([(1, "x"), (1, "y")], sorted(groups.keys()))
+        self.assertEquals([5.0], groups[(1, "x")].tolist())
+
+        groups = table.group_by("a", ["a", "b"], groups=[ 1, 4 ])
+        self.assertEquals([1, 4], sorted(groups.keys()))
+        self.assertEquals([1, 1], groups[1]["a"].tolist())
+        self.assertEquals(0, len(groups[4]))
+        self.assertEquals(("a", "b"), groups[4].dtype.names)
+
+        self.assertEquals({}, table.group_by("a", "b",
+                                             [ ("a", np.greater, 5) ]))
+        self.assertEquals({}, SmallTable(self.columns).group_by("a"))
+
+    def test_aggregate(self):
+        table = self.create_groups_table()
+        # Invalid values are not aggregated, groups with invalid values only
+        # are missing
+        self.assertEquals({ 1 : 7.0, 2 : 7.0 }, table.aggregate("a", "b"))
+        self.assertEquals({ 1 : 5.0, 2 : 6.0 },
+                          table.aggregate("a", "b", np.maximum))
+        self.assertEquals({ (1, "x") : 5.0, (1, "y") : 2.0, (2, "x") : 1.0 },
+                          table.aggregate(["a", "c"], "b"))
+        self.assertEquals({ "x" : 5, "y" : 4 }, table.aggregate("c", "a"))
+        self.assertEquals({ 2 : 6.0 },
+                          table.aggregate("a", "b", np.add,
+                                          [ ("b", np.greater, 5) ]))
+        self.assertEquals({}, table.aggregate("a", "b", np.add,
+                                              [ ("b", np.greater, 10) ]))
+        self.assertEquals({}, SmallTable(self.columns).aggregate("a", "b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,627 @@
+# -*- coding: utf-8 -*-
+
+from testutils import KAIRA_TESTS, KAIRA_TOOLS
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from cStringIO import StringIO
+import numpy as np
+
+# tracebench fakes gui libraries and makes modules of gui importable
+sys.path.insert(0, KAIRA_TOOLS)
+import tracebench
+import clockdrift
+import exportri
+import syncedtracelog
+import traceanalysis
+import tracedecoder
+import tracelog
+import tracelogcomparator
+import tracelogverif
+
+# A tracelog generated by tools/tracebench.py; its transitions send messages
+# in the same events as traced tokens. legacy.kst is a *.kst of the first
+# version synchronized from trace.kth with settings (0, 0, True, False,
+# False), synced.kst is the expected result of the same synchronization.
+SYNTHETIC_TRACELOG = os.path.join(KAIRA_TESTS, "tracelogs", "synthetic")
+# A tracelog without token values generated by tools/tracebench.py;
+# synced-<i>.kst is the result of the replay with BA_SETTINGS[i] by the
+# original walk of the backward amortization through records.
+TOKEN_FREE_TRACELOG = os.path.join(KAIRA_TESTS, "tracelogs", "tokenfree")
+BA_SETTINGS = [ (10, 1000, True, True, False),
+                (10, 50000, True, True, True) ]
+
+
+class RecordingRunInstance(object):
+
+    """ Stores what Trace.process_event reports about each event """
+
+    def __init__(self):
+        self.ids = []
+        self.tokens = []
+        self.sends = []
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+    def pre_event(self):
+        self.ids.append(-1)
+
+    def transition_fired(self, process_id, time, transition_id, values):
+        self.ids[-1] = transition_id
+
+    def event_spawn(self, process_id, time, net_id):
+        self.ids[-1] = net_id
+
+    def event_receive(self, process_id, time, origin_id):
+        self.ids[-1] = origin_id
+
+    def add_token(self, place_id, token_pointer, values, send_time):
+        self.tokens.append((len(self.ids) - 1, "t", place_id, token_pointer))
+
+    def remove_token(self, place_id, token_pointer):
+        self.tokens.append((len(self.ids) - 1, "r", place_id, token_pointer))
+
+    def event_send(self, process_id, time, target_id, size, edge_id):
+        self.sends.append((len(self.ids) - 1, time, target_id, size, edge_id))
+
+
+class TraceDecoderTest(unittest.TestCase):
+
+    def check_trace(self, trace):
+        decoded = tracedecoder.decode_trace(trace)
+        events = []
+        ri = RecordingRunInstance()
+        while not trace.is_pointer_at_end():
+            events.append((trace.data[trace.pointer],
+                           trace.get_next_event_time() - trace.time_offset,
+                           trace.pointer))
+            trace.process_event(ri)
+        self.assertEquals(events,
+                          [ (e["type"], e["time"], e["pointer"])
+                            for e in decoded.events ])
+        self.assertEquals(ri.ids, decoded.events["id"].tolist())
+        self.assertEquals(ri.tokens,
+                          [ (t["event"], t["kind"], t["place"], t["token"])
+                            for t in decoded.tokens ])
+        self.assertEquals(ri.sends,
+                          [ (s["event"], s["time"], s["target"], s["size"],
+                             s["edge"]) for s in decoded.sends ])
+
+    def test_synthetic_traces(self):
+        # The first event is a spawn with a token, transitions remove and
+        # add tokens and send messages, receives add tokens
+        directory = tempfile.mkdtemp()
+        try:
+            random.seed(3)
+            kth, _ = tracebench.generate_tracelog(directory, 3, 500, 2, 0.5,
+                                                  1000)
+            t = tracelog.TraceLog(kth)
+            for trace in t.traces:
+                self.check_trace(trace)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_all_records(self):
+        def event(t, time, id=None):
+            if id is None:
+                return t + struct.pack("<Q", time)
+            return t + struct.pack("<Qi", time, id)
+        def token(t, pointer, place_id):
+            return t + struct.pack("<Li", pointer, place_id)
+        def send(time, targets):
+            return "M" + struct.pack("<QQii", time, 16, 5, len(targets)) + \
+                "".join(struct.pack("<i", target) for target in targets)
+        data = "".join([
+            "KairaThreadTrace\x001\x00\x00\x00",
+            event("S", 10, 0), token("t", 1, 1), "i" + struct.pack("<i", 3),
+            "sspawned\x00",
+            event("T", 20, 2), token("r", 1, 1), "d" + struct.pack("<d", 1.5),
+            "sQ\x00", event("Q", 25), token("t", 2, 1), send(26, [ 1, 2 ]),
+            token("t", 3, 4), event("X", 30),
+            event("F", 40), event("Q", 41), token("t", 4, 1), event("X", 42),
+            event("R", 50, 1), token("t", 5, 4), send(51, []),
+            event("X", 52),
+            event("I", 60), event("Q", 70), event("T", 80, 2),
+            event("X", 90) ])
+        trace = tracelog.Trace(data, 0, 4)
+        self.check_trace(trace)
+
+        trace.pointer = len(data) - 9
+        self.assertRaises(Exception, tracedecoder.decode_trace, trace)
+
+
+def describe_runinstance(ri):
+    """ Returns the replay state of the run instance as comparable values """
+    def describe_activity(activity):
+        if activity is None:
+            return None
+        if activity.name == "fire":
+            return ("fire", activity.time, activity.process_id,
+                    activity.transition.id, activity.values, activity.quit,
+                    activity.blocked)
+        return ("receive", activity.time, activity.process_id,
+                activity.origin_id)
+    def describe_tokens(tokens):
+        return sorted((place_id, lst and lst[:])
+                      for place_id, lst in tokens.items())
+    instances = [ (i, describe_tokens(n.tokens), describe_tokens(n.new_tokens),
+                   describe_tokens(n.removed_tokens))
+                  for i, n in sorted(ri.net_instances.items()) ]
+    if ri.last_event_instance is not None:
+        last_instance = ri.last_event_instance.process_id
+    else:
+        last_instance = None
+    return (ri.last_event, ri.last_event_time, last_instance,
+            describe_activity(ri.last_event_activity), ri.missed_receives,
+            instances,
+            [ describe_activity(a) for a in ri.activites ],
+            [ [ (p.time, p.size, p.edge_id) for p in packets ]
+              for packets in ri.packets ],
+            [ [ describe_activity(r) for r in debts ]
+              for debts in ri.debt_receives ])
+
+
+class TraceLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        random.seed(4)
+        kth, _ = tracebench.generate_tracelog(self.directory, 3, 150, 1, 0.5,
+                                              1000)
+        self.tracelog = tracelog.TraceLog(kth)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_states(self):
+        """ Returns states after each number of visible events replayed from
+            the beginning """
+        t = self.tracelog
+        ri = t.first_runinstance.copy()
+        states = [ describe_runinstance(ri) ]
+        for i in xrange(len(t.timeline)):
+            t.execute_visible_events(ri, i, i + 1)
+            states.append(describe_runinstance(ri))
+        return states
+
+    def test_random_seeks(self):
+        t = self.tracelog
+        states = self.get_states()
+        count = len(states)
+        # Small limits, so seeks cross checkpoints and go beyond the undo
+        t.checkpoint_interval = 40
+        t.undo_limit = 15
+        index = 0
+        random.seed(5)
+        for i in xrange(200):
+            move = random.choice((-1, 1, 1, -1, -8, 30, None))
+            if move is None:
+                index = random.randrange(count)
+            else:
+                index = min(max(index + move, 0), count - 1)
+            self.assertEquals(states[index],
+                              describe_runinstance(
+                                  t.get_event_runinstance(index)))
+        self.assertTrue(t.checkpoints)
+
+    def test_undo(self):
+        t = self.tracelog
+        states = self.get_states()
+        ri = t.first_runinstance.copy()
+        t.execute_visible_events(ri, 0, 100)
+        ri.enable_undo(30)
+        self.assertFalse(ri.can_undo())
+        for i in xrange(100, 150):
+            t.execute_visible_events(ri, i, i + 1)
+            self.assertEquals(states[i + 1], describe_runinstance(ri))
+        # Only the last 30 events are recorded
+        for i in xrange(149, 119, -1):
+            self.assertTrue(ri.can_undo())
+            ri.undo()
+            self.assertEquals(states[i], describe_runinstance(ri))
+        self.assertFalse(ri.can_undo())
+
+        # The replay continues from the restored state
+        t.execute_visible_events(ri, 120, 140)
+        self.assertEquals(states[140], describe_runinstance(ri))
+        ri.undo()
+        self.assertEquals(states[139], describe_runinstance(ri))
+
+    def export(self, output):
+        t = self.tracelog
+        net = t.project.nets[0]
+        filename = os.path.join(self.directory, "export." + output)
+        rows = exportri.export_to_file(
+            t, net.transitions(), [ (p, 0) for p in net.places() ],
+            exportri.ExportRunInstance.basic_header, output, filename,
+            chunk_size=100)
+        return filename, rows
+
+    def test_export_to_file(self):
+        filename, rows = self.export("npy")
+        data = np.load(filename)
+        mask = np.load(os.path.join(self.directory, "export.mask.npy"))
+        self.assertEquals(rows, len(data))
+        self.assertEquals(len(data), len(mask))
+        self.assertTrue(rows > 100)
+        filename, rows = self.export("csv")
+        with open(filename) as f:
+            # Types and header are followed by rows
+            self.assertEquals(rows + 2, len(f.readlines()))
+
+    def test_failed_export_to_file(self):
+        t = self.tracelog
+        execute_all_events = t.execute_all_events
+        def fail(ri):
+            execute_all_events(ri, 0, len(t.full_timeline) // 2)
+            raise IOError("Export failed")
+        t.execute_all_events = fail
+        for output, stale in (("npy", "export.mask.npy"), ("csv", None)):
+            if stale:
+                open(os.path.join(self.directory, stale), "w").close()
+            self.assertRaises(IOError, self.export, output)
+            self.assertEquals(["trace-0-0.ktt", "trace-1-0.ktt",
+                               "trace-2-0.ktt", "trace.kth"],
+                              sorted(os.listdir(self.directory)))
+
+
+class SyncedTraceLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def generate_tracelog(self, seed, skew, processes=4, events=300,
+                          payload=1):
+        random.seed(seed)
+        directory = tempfile.mkdtemp(dir=self.directory)
+        filename, _ = tracebench.generate_tracelog(
+            directory, processes, events, payload, 0.5, skew)
+        return filename
+
+    def sync(self, kth, settings, vectorized=False, compress=False, jobs=1,
+             drift=False):
+        """ Synchronizes the tracelog and returns the name of the *.kst """
+        filename = os.path.join(os.path.dirname(kth), "trace.kst")
+        t = syncedtracelog.SyncedTraceLog(fromtracelog=(kth, settings),
+                                          vectorized=vectorized, jobs=jobs,
+                                          drift=drift)
+        t.export_to_file(filename, compress)
+        return filename
+
+    def read(self, filename):
+        with open(filename, "rb") as f:
+            return f.read()
+
+    def test_vectorized_sync(self):
+        # min_event_diff, min_msg_delay, forward_amort, backward_amort,
+        # weak_sync
+        settings = [ (0, 0, True, False, False),
+                     (100, 1000, True, False, False),
+                     (100, 1000, False, False, True),
+                     (10, 50000, True, False, True) ]
+        # Without payload, tokens have no values and the replay drops them
+        for seed, skew, payload in [ (0, 0, 1), (1, 50000, 1), (2, 300000, 1),
+                                     (3, 0, 0), (4, 50000, 0) ]:
+            kth = self.generate_tracelog(seed, skew, payload=payload)
+            for s in settings:
+                replay = self.read(self.sync(kth, s, False))
+                self.assertEquals(replay, self.read(self.sync(kth, s, True)))
+
+    def test_vectorized_sync_jobs(self):
+        # ProcessTimes created by workers give the same times
+        kth = self.generate_tracelog(1, 50000)
+        for s in [ (0, 0, True, False, False),
+                   (100, 1000, False, False, True) ]:
+            for drift in (False, True):
+                expected = self.read(self.sync(kth, s, True, drift=drift))
+                self.assertEquals(
+                    expected, self.read(self.sync(kth, s, True, jobs=2,
+                                                  drift=drift)))
+
+    def check_loaded(self, filename, traces, project):
+        loader = syncedtracelog.SyncedTraceLogLoader(filename)
+        process_count, pointer_size, loaded, loaded_project = loader.load()
+        self.assertEquals(len(traces), process_count)
+        self.assertEquals(8, pointer_size)
+        for trace, expected in zip(loaded, traces):
+            self.assertEquals(expected, str(trace.data))
+        self.assertEquals(
+            [ p.id for p in project.nets[0].places() ],
+            [ p.id for p in loaded_project.nets[0].places() ])
+        self.assertEquals(
+            [ tr.id for tr in project.nets[0].transitions() ],
+            [ tr.id for tr in loaded_project.nets[0].transitions() ])
+        return syncedtracelog.SyncedTraceLog(fromfile=filename)
+
+    def test_kst_roundtrip(self):
+        kth = self.generate_tracelog(1, 50000)
+        t = syncedtracelog.SyncedTraceLog(
+            fromtracelog=(kth, (100, 1000, True, False, False)))
+        traces = []
+        for trace in t.traces:
+            stream = StringIO()
+            trace.write_data(stream)
+            traces.append(stream.getvalue())
+
+        timelines = []
+        for compress in (False, True):
+            filename = os.path.join(self.directory,
+                                    "trace-{0}.kst".format(compress))
+            t.export_to_file(filename, compress)
+            self.assertFalse(os.path.exists(filename + ".tmp"))
+            synced = self.check_loaded(filename, traces, t.project)
+            timelines.append(synced.full_timeline.get_column("pointer"))
+
+        # The original layout: text lines with the pointer size, the number
+        # of processes and lengths of traces, then traces and the project
+        filename = os.path.join(self.directory, "legacy.kst")
+        with open(filename, "wb") as f:
+            f.write("8\n{0}\n".format(len(traces)))
+            for trace in traces:
+                f.write("{0}\n".format(len(trace)))
+            for trace in traces:
+                f.write(trace)
+            with open(kth) as source:
+                source.readline()
+                f.write(source.read())
+        synced = self.check_loaded(filename, traces, t.project)
+        timelines.append(synced.full_timeline.get_column("pointer"))
+        for timeline in timelines[1:]:
+            self.assertEquals(timelines[0].tolist(), timeline.tolist())
+
+    def test_sync_sends_with_tokens(self):
+        # Copied into a temporary directory, the *.kst is written next to it
+        directory = tempfile.mkdtemp(dir=self.directory)
+        for filename in os.listdir(SYNTHETIC_TRACELOG):
+            shutil.copy(os.path.join(SYNTHETIC_TRACELOG, filename), directory)
+        kst = self.sync(os.path.join(directory, "trace.kth"),
+                        (0, 0, True, False, False))
+        self.assertEquals(
+            self.read(os.path.join(SYNTHETIC_TRACELOG, "synced.kst")),
+            self.read(kst))
+
+    def test_backward_amortization(self):
+        directory = tempfile.mkdtemp(dir=self.directory)
+        for filename in os.listdir(TOKEN_FREE_TRACELOG):
+            shutil.copy(os.path.join(TOKEN_FREE_TRACELOG, filename), directory)
+        for i, settings in enumerate(BA_SETTINGS):
+            kst = self.sync(os.path.join(directory, "trace.kth"), settings)
+            self.assertEquals(
+                self.read(os.path.join(TOKEN_FREE_TRACELOG,
+                                       "synced-{0}.kst".format(i))),
+                self.read(kst))
+
+    def test_backward_amortization_walk(self):
+        # Sends kept in arrays are amortized in the same way as by the walk
+        # through records, which is used when send times are not unique
+        settings = BA_SETTINGS + [ (0, 0, True, True, False),
+                                   (100, 1000, False, True, True) ]
+        trace_class = syncedtracelog.SyncedTrace
+        amortize_sends = trace_class.__dict__["_amortize_sends"]
+        for seed, skew in [ (0, 1000), (1, 50000), (2, 300000) ]:
+            kth = self.generate_tracelog(seed, skew, 3, 200)
+            for s in settings:
+                arrays = self.read(self.sync(kth, s))
+                trace_class._amortize_sends = lambda self, *args: False
+                try:
+                    walk = self.read(self.sync(kth, s))
+                finally:
+                    trace_class._amortize_sends = amortize_sends
+                self.assertEquals(walk, arrays)
+
+    def test_kst_failed_export(self):
+        kth = self.generate_tracelog(0, 0)
+        t = syncedtracelog.SyncedTraceLog(
+            fromtracelog=(kth, (0, 0, True, False, False)))
+        filename = os.path.join(self.directory, "trace.kst")
+        # The project is copied from the source tracelog at the end
+        t.filename = os.path.join(self.directory, "missing.kth")
+        self.assertRaises(IOError, t.export_to_file, filename)
+        self.assertFalse(os.path.exists(filename))
+        self.assertFalse(os.path.exists(filename + ".tmp"))
+
+
+class TracelogComparatorTest(unittest.TestCase):
+
+    def compare(self, kth, kst):
+        comparator = tracelogcomparator.TracelogComparator(kth, kst, False)
+        return dict((row[0], row[1:]) for row in comparator.get_results())
+
+    def test_legacy_kst(self):
+        kth = os.path.join(SYNTHETIC_TRACELOG, "trace.kth")
+        results = self.compare(
+            kth, os.path.join(SYNTHETIC_TRACELOG, "legacy.kst"))
+        # Each send is stored twice in the first version
+        self.assertEquals([0, 3], results["Processes with different sends"])
+        self.assertEquals([0, 0], results["Number of breakpoints"])
+
+        directory = tempfile.mkdtemp()
+        try:
+            kst = os.path.join(directory, "trace.kst")
+            t = syncedtracelog.SyncedTraceLog(
+                fromtracelog=(kth, (0, 0, True, False, False)))
+            t.export_to_file(kst)
+            results = self.compare(kth, kst)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEquals([0, 0], results["Processes with different sends"])
+        self.assertEquals([24, 0], results["Clock condition violations"])
+
+
+class TraceAnalysisTest(unittest.TestCase):
+
+    percentiles = (0, 1, 50, 99, 99.9, 100)
+
+    def assertEstimate(self, expected, values, accuracy):
+        for e, v in zip(expected, values):
+            # Values of buckets are rounded
+            self.assertTrue(abs(v - e) <= accuracy * abs(e) + 1,
+                            "{0} is not an estimate of {1}".format(v, e))
+
+    def test_delay_sketch(self):
+        rs = np.random.RandomState(1)
+        links = rs.randint(0, 4, 20000) * 3
+        delays = (rs.lognormal(6, 3, 20000) *
+                  rs.choice([-1, 0, 1, 1], 20000)).astype(np.int64)
+        sketch = traceanalysis.DelaySketch()
+        sketch.add(links, delays)
+        # Merged sketches of chunks give the same results
+        merged = traceanalysis.DelaySketch()
+        for start in xrange(0, len(links), 3000):
+            chunk = traceanalysis.DelaySketch()
+            chunk.add(links[start:start + 3000], delays[start:start + 3000])
+            merged.merge(chunk)
+        for s in (sketch, merged):
+            self.assertEquals([0, 3, 6, 9], s.links.tolist())
+            values = s.get_percentiles(self.percentiles)
+            for i, link in enumerate(s.links):
+                d = delays[links == link]
+                self.assertEquals(len(d), s.get_counts()[i])
+                self.assertEquals((d < 0).sum(), s.get_counts(True)[i])
+                self.assertEquals(d.min(), s.minimums[i])
+                self.assertEquals(d.max(), s.maximums[i])
+                self.assertEstimate(
+                    np.percentile(d, self.percentiles, interpolation="lower"),
+                    values[i], s.accuracy)
+        self.assertEquals(sketch.get_percentiles(self.percentiles).tolist(),
+                          merged.get_percentiles(self.percentiles).tolist())
+
+        total = merged.merge_links()
+        self.assertEquals([0], total.links.tolist())
+        self.assertEquals([len(delays)], total.get_counts().tolist())
+        self.assertEstimate(
+            np.percentile(delays, self.percentiles, interpolation="lower"),
+            total.get_percentiles(self.percentiles)[0], total.accuracy)
+
+        empty = traceanalysis.DelaySketch()
+        empty.add([], [])
+        self.assertEquals((0, 2), empty.get_percentiles((50, 99)).shape)
+        self.assertEquals(0, len(empty.merge_links().links))
+
+    def test_link_table(self):
+        directory = tempfile.mkdtemp()
+        try:
+            random.seed(2)
+            kth, _ = tracebench.generate_tracelog(directory, 4, 300, 0, 0.5,
+                                                  300000)
+            analysis = tracelogverif.VTraceLog(kth, False).analysis
+        finally:
+            shutil.rmtree(directory)
+        delays = analysis.get_message_delays()
+        self.assertTrue((delays < 0).any())
+        accuracy = analysis.get_delay_sketch().accuracy
+        self.assertEstimate(
+            np.percentile(delays, self.percentiles, interpolation="lower"),
+            analysis.get_delay_percentiles(self.percentiles), accuracy)
+
+        table = analysis.get_link_table(self.percentiles)
+        links = set(zip(analysis.senders, analysis.receivers))
+        self.assertEquals(sorted(links),
+                          zip(table.get_column("Sender"),
+                              table.get_column("Receiver")))
+        for row in np.ma.getdata(table.data):
+            d = delays[(analysis.senders == row["Sender"]) &
+                       (analysis.receivers == row["Receiver"])]
+            self.assertEquals(len(d), row["Messages"])
+            self.assertEquals((d < 0).sum(), row["Violations"])
+            self.assertEquals(d.min(), row["Minimum delay [ns]"])
+            self.assertEquals(d.max(), row["Maximum delay [ns]"])
+            self.assertEstimate(
+                np.percentile(d, self.percentiles, interpolation="lower"),
+                [ row["Delay p{0:g} [ns]".format(p)]
+                  for p in self.percentiles ], accuracy)
+
+
+class ClockDriftTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def generate_tracelog(self, seed, rates, skew=0, events=500):
+        """ Generates a tracelog whose clocks of processes run faster by
+            rates [ns/s] """
+        random.seed(seed)
+        kth, _ = tracebench.generate_tracelog(self.directory, len(rates),
+                                              events, 0, 0.5, skew)
+        index = tracelog.TraceLog(kth, export_data=False).get_message_index()
+        for process_id, times in enumerate(index.times):
+            filename = os.path.join(self.directory,
+                                    "trace-{0}-0.ktt".format(process_id))
+            with open(filename, "rb") as f:
+                data = bytearray(f.read())
+            for pointer, time in zip(times["pointer"], times["time"]):
+                time = int(time)
+                struct.pack_into("<Q", data, int(pointer) + 1, time +
+                                 int(rates[process_id] * time / 1e9))
+            with open(filename, "wb") as f:
+                f.write(data)
+        return kth
+
+    def fit(self, kth):
+        """ Returns the fitted ClockDrift and raw times of all events """
+        t = tracelog.TraceLog(kth, export_data=False)
+        offsets = traceanalysis.get_time_offsets(t.traces, False)
+        index = t.get_message_index()
+        return (clockdrift.fit_clock_drift(index, offsets),
+                [ times["time"] for times in index.times ])
+
+    def sync(self, kth, settings, vectorized):
+        filename = os.path.join(self.directory, "trace.kst")
+        t = syncedtracelog.SyncedTraceLog(fromtracelog=(kth, settings),
+                                          vectorized=vectorized, drift=True)
+        t.export_to_file(filename)
+        with open(filename, "rb") as f:
+            return f.read()
+
+    def test_injected_drift(self):
+        rates = [ 0, 2e7, -1.5e7, 3e7 ]
+        drift, times = self.fit(self.generate_tracelog(1, rates))
+        # Corrections go against the drift of the process 0
+        for rate, fitted in zip(rates, drift.rates):
+            self.assertTrue(abs(rate + fitted) <= 0.1 * abs(rate),
+                            "{0} is not fitted by {1}".format(rate, fitted))
+        # No event is moved backwards, the smallest correction is zero
+        self.assertEquals(0, min(drift.get_corrections(i, t).min()
+                                 for i, t in enumerate(times)))
+
+    def test_replay_and_vectorized(self):
+        kth = self.generate_tracelog(2, [ 0, -1e7, 2e7 ], 50000, 200)
+        for settings in [ (0, 0, True, False, False),
+                          (100, 1000, False, False, True) ]:
+            self.assertEquals(self.sync(kth, settings, False),
+                              self.sync(kth, settings, True))
+
+    def test_process_without_messages(self):
+        random.seed(3)
+        kth, _ = tracebench.generate_tracelog(self.directory, 2, 100, 0, 0.5,
+                                              1000)
+        # The third process neither sends nor receives a message, its
+        # coefficients are not determined by the normal equations
+        with open(kth) as f:
+            header = f.read()
+        with open(kth, "w") as f:
+            f.write(header.replace("process-count='2'", "process-count='3'"))
+        tracebench.write_synthetic_trace(
+            os.path.join(self.directory, "trace-2-0.ktt"), 2,
+            [ (i * 1000, i * 1000 + 500, None) for i in xrange(1, 50) ],
+            [], 0, 300)
+        drift, _ = self.fit(kth)
+        self.assertEquals(0, drift.rates[2])
+        self.assertTrue(all(np.isfinite(drift.offsets + drift.rates)))
+        self.assertEquals(self.sync(kth, (0, 0, True, False, False), False),
+                          self.sync(kth, (0, 0, True, False, False), True))
+
+
+if __name__ == '__main__':
+    unittest.main()
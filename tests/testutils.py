@@ -2,6 +2,7 @@
 import subprocess
 import os
 import time
+import xml.etree.ElementTree as xml
 
 KAIRA_TESTS = os.path.dirname(os.path.abspath(__file__))
 KAIRA_ROOT = os.path.dirname(KAIRA_TESTS)
@@ -68,7 +69,8 @@ class Project:
 
     server = None
 
-    def __init__(self, name, directory_name=None, mpi=False, rpc=False, trace=False, lib=False):
+    def __init__(self, name, directory_name=None, mpi=False, rpc=False, trace=False, lib=False,
+                 build_options=None):
         self.name = name
         if directory_name is None:
             self.directory_name = name
@@ -79,6 +81,8 @@ class Project:
         self.rpc = rpc
         self.trace = trace
         self.lib = lib
+        # Build options that replace options of the project
+        self.build_options = build_options
 
         self.clean()
 
@@ -115,6 +119,21 @@ class Project:
         if self.lib:
             args.append("--lib")
         RunProgram("python", args).run()
+        if self.build_options:
+            self.set_build_options(self.build_options)
+
+    def set_build_options(self, options):
+        """ Sets build options in the exported project """
+        tree = xml.parse(self.get_xml_filename())
+        configuration = tree.getroot().find("configuration")
+        for e in configuration.findall("build-option"):
+            if e.get("name") in options:
+                configuration.remove(e)
+        for name, value in options.items():
+            e = xml.SubElement(configuration, "build-option")
+            e.set("name", name)
+            e.text = value
+        tree.write(self.get_xml_filename())
 
     def run_ptp(self, operation=None):
         if operation is None:
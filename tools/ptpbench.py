@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# Benchmark of the ptp front-end: loading, checking and analysis of projects.
+# Run it from any directory, e.g. 'python tools/ptpbench.py' (all samples)
+# or 'python tools/ptpbench.py --repeat 20 samples/workers/workers.proj'.
+
+import argparse
+import csv
+import datetime
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+KAIRA_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KAIRA_GUI = os.path.join(KAIRA_ROOT, "gui")
+
+# We fake gui libraries as cmdutils does, projects are exported without gtk
+class Empty(object):
+    def __getattribute__(self, name):
+        return Empty()
+
+    def __call__(self, *args, **kw):
+        return Empty()
+
+sys.modules["gtk"] = Empty()
+sys.modules["cairo"] = Empty()
+sys.modules["settingswindow"] = Empty()
+
+sys.path.insert(0, KAIRA_GUI)
+import paths
+sys.path.append(paths.PTP_DIR)
+import loader
+import ptp
+import gencpp.parser as parser
+
+
+def export_project(filename, directory):
+    """ Exports the project into the directory, returns the XML filename """
+    p = loader.load_project(filename)
+    build_config = p.get_build_config("release")
+    build_config.directory = directory
+    p.export(build_config)
+    return build_config.get_export_filename()
+
+def check_and_analyze(filename):
+    p = ptp.project.load_project_from_file(filename, ptp.target_envs, "build")
+    p.check()
+    p.analyze()
+
+def measure(filename, repeat, cold):
+    """ Returns the average time of check_and_analyze. If cold is True,
+        caches of the parser are cleared before each run, as in a new ptp
+        process; otherwise they are kept, as in the ptp server. """
+    clear_caches = getattr(parser, "clear_caches", lambda: None)
+    total = 0
+    for i in xrange(repeat):
+        if cold:
+            clear_caches()
+        start = time.time()
+        check_and_analyze(filename)
+        total += time.time() - start
+    return total / repeat
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ("git", "rev-parse", "--short", "HEAD"),
+            cwd=KAIRA_ROOT, stderr=subprocess.PIPE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of loading, checking and analysis in ptp")
+    parser.add_argument("projects", metavar="FILENAME", nargs="*",
+                        help=".proj files, all samples by default")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", default="ptpbench-results.csv",
+                        help="CSV file the results are appended to")
+    args = parser.parse_args()
+
+    projects = args.projects or sorted(
+        glob.glob(os.path.join(KAIRA_ROOT, "samples", "*", "*.proj")))
+
+    new_file = not os.path.isfile(args.output)
+    results = open(args.output, "ab")
+    writer = csv.writer(results)
+    if new_file:
+        writer.writerow([ "date", "commit", "project", "cold_seconds",
+                          "warm_seconds" ])
+    date = datetime.datetime.now().isoformat()
+    commit = get_commit()
+
+    directory = tempfile.mkdtemp(prefix="ptpbench-")
+    print "{0:>20} {1:>10} {2:>10}".format("project", "cold [ms]", "warm [ms]")
+    try:
+        totals = [ 0, 0 ]
+        for project in projects:
+            name = os.path.splitext(os.path.basename(project))[0]
+            output = os.path.join(directory, name)
+            filename = export_project(os.path.abspath(project), output)
+            try:
+                # The first run fills the cache of C++ checks, so the compiler
+                # is not measured
+                check_and_analyze(filename)
+            except ptp.PtpException, e:
+                print "{0:>20} {1}".format(name, str(e).split("\n")[0])
+                continue
+            cold = measure(filename, args.repeat, True)
+            warm = measure(filename, args.repeat, False)
+            totals[0] += cold
+            totals[1] += warm
+            print "{0:>20} {1:>10.2f} {2:>10.2f}".format(
+                name, cold * 1000, warm * 1000)
+            writer.writerow([ date, commit, name, cold, warm ])
+        print "{0:>20} {1:>10.2f} {2:>10.2f}".format(
+            "total", totals[0] * 1000, totals[1] * 1000)
+    finally:
+        results.close()
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+
+# Benchmarks of tracelog processing. Run it from any directory,
+# e.g. 'python tools/tracebench.py merge' or
+# 'python tools/tracebench.py stages --processes 8 64 --events 10000'.
+
+import argparse
+import csv
+import datetime
+import multiprocessing as mp
+import os
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+KAIRA_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KAIRA_GUI = os.path.join(KAIRA_ROOT, "gui")
+
+# We fake gui libraries as cmdutils does, tracelogs are processed without gtk
+class Empty(object):
+    def __getattribute__(self, name):
+        return Empty()
+
+    def __call__(self, *args, **kw):
+        return Empty()
+
+sys.modules["gtk"] = Empty()
+sys.modules["cairo"] = Empty()
+sys.modules["settingswindow"] = Empty()
+
+sys.path.insert(0, KAIRA_GUI)
+import paths
+sys.path.append(paths.PTP_DIR)
+import utils
+
+# Project of synthetic tracelogs: the transition 3 takes the state token
+# from the place 1 and all received tokens from the place 2, it puts a new
+# state token back and it may send a message
+SYNTHETIC_PROJECT = """\
+<project library-octave="False" library-rpc="False" target_env="C++">\
+<configuration><build-option name="CFLAGS">-O2</build-option></configuration>\
+<net id="0" name="Main">\
+<place id="1" name="state" radius="20" sx="0" sy="0" x="0" y="0">\
+<place-type x="0" y="20">int</place-type><init x="0" y="-20" />\
+<trace trace-tokens="True">{functions}</trace></place>\
+<place id="2" name="inbox" radius="20" sx="0" sy="0" x="0" y="100">\
+<place-type x="0" y="120">int</place-type><init x="0" y="80" />\
+<trace trace-tokens="True">{functions}</trace></place>\
+<transition clock="False" id="3" name="step" priority="" sx="70" sy="35" \
+x="150" y="50"><guard x="150" y="30" /><trace>fire</trace></transition>\
+<edge from_item="1" id="4" to_item="3"><inscription x="75" y="25">x\
+</inscription></edge>\
+<edge from_item="2" id="5" to_item="3"><inscription x="75" y="75">\
+[bulk] y</inscription></edge>\
+<edge from_item="3" id="6" to_item="1"><inscription x="75" y="0">x + 1\
+</inscription></edge>\
+<edge from_item="3" id="7" to_item="2"><inscription x="75" y="100">\
+x@target</inscription></edge>\
+</net></project>"""
+
+
+def linear_merge(sequences):
+    """ The original merge: a linear scan over heads of all sequences """
+    positions = [ 0 ] * len(sequences)
+    heads = [ s[0] if s else None for s in sequences ]
+    while True:
+        i = utils.index_of_minimal_value(heads)
+        if i is None:
+            return
+        yield i
+        positions[i] += 1
+        if positions[i] < len(sequences[i]):
+            heads[i] = sequences[i][positions[i]]
+        else:
+            heads[i] = None
+
+def make_timestamps(process_count, events):
+    """ Returns sorted timestamps of 'events' events split among processes """
+    sequences = []
+    for p in xrange(process_count):
+        t = random.randint(0, 1000)
+        sequence = []
+        for i in xrange(events / process_count):
+            t += random.randint(1, 1000)
+            sequence.append(t)
+        sequences.append(sequence)
+    return sequences
+
+def measure(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+def write_synthetic_trace(filename, process_id, transitions, receives,
+                          payload, skew):
+    """ Writes one KairaThreadTrace (pointer size 8), returns the number of
+        its events.
+
+        Arguments:
+        filename -- path to the *.ktt file
+        process_id -- ID of the process
+        transitions -- list of (start, end, send) in global times, send is
+                       None or (time, target)
+        receives -- list of (arrival, sender) ordered by the arrival
+        payload -- number of int values of each token
+        skew -- the clock of the process is ahead of the global time by skew
+    """
+    basic = struct.Struct("<Q")
+    event = struct.Struct("<Qi")
+    send = struct.Struct("<QQiii")
+    token = struct.Struct("<Qi")
+    values = "".join("i" + struct.pack("<i", i) for i in xrange(payload))
+    pointers = [ 0 ]
+
+    def new_token(place_id):
+        pointers[0] += 1
+        return "t" + token.pack(pointers[0], place_id) + values
+
+    data = [ "KairaThreadTrace\x001\x00hostname\x00bench\x00"
+             "inittime\x001000000\x00\x00\x00" ]
+    state = pointers[0] + 1
+    data.append("S" + event.pack(skew + 1, 0) + new_token(1))
+    inbox = []
+    count = 1
+    now = 1
+    t = 0
+
+    def fire(t, now):
+        start, end, message = transitions[t]
+        if start > now + 10:
+            data.append("I" + basic.pack(skew + now + 1))
+        removed = "r" + token.pack(state, 1) + \
+            "".join("r" + token.pack(p, 2) for p in inbox)
+        del inbox[:]
+        record = "T" + event.pack(skew + start, 3) + removed + new_token(1)
+        if message is not None:
+            record += "M" + send.pack(skew + message[0], 4 + payload * 4, 7, 1,
+                                      message[1])
+        data.append(record + "X" + basic.pack(skew + end))
+        return end
+
+    for arrival, sender in receives:
+        r = max(arrival, now + 1)
+        while t < len(transitions) and transitions[t][0] <= r:
+            now = fire(t, now)
+            state = pointers[0]
+            t += 1
+            count += 1
+            r = max(r, now + 1)
+        data.append("R" + event.pack(skew + r, sender) + new_token(2))
+        inbox.append(pointers[0])
+        now = r
+        count += 1
+    while t < len(transitions):
+        now = fire(t, now)
+        state = pointers[0]
+        t += 1
+        count += 1
+    # The trace ends by a transition, the reader expects a record after
+    # a receive
+    data.append("T" + event.pack(skew + now + 1, 3) +
+                "r" + token.pack(state, 1) +
+                "".join("r" + token.pack(p, 2) for p in inbox) +
+                "X" + basic.pack(skew + now + 2))
+    count += 1
+
+    with open(filename, "wb") as f:
+        f.write("".join(data))
+    return count
+
+def generate_tracelog(directory, process_count, events, payload, density,
+                      skew):
+    """ Writes a synthetic tracelog 'trace.kth' into the directory. Returns
+        its filename and the total number of events of its traces.
+
+        Arguments:
+        directory -- an existing directory
+        process_count -- number of processes
+        events -- number of transitions fired by each process
+        payload -- number of int values of each token
+        density -- probability that a transition sends a message
+        skew -- maximal clock skew between processes [ns]
+    """
+    functions = "".join("<function name=\"value_{0}\" return-type=\"int\" />"
+                        .format(i) for i in xrange(payload))
+    filename = os.path.join(directory, "trace.kth")
+    project = SYNTHETIC_PROJECT.format(functions=functions)
+    with open(filename, "w") as f:
+        f.write("<header pointer-size='8' process-count='{0}' "
+                "description-lines='1' />\n".format(process_count))
+        f.write(project + "\n")
+
+    transitions = []
+    receives = [ [] for p in xrange(process_count) ]
+    last_arrivals = {}
+    for p in xrange(process_count):
+        process_transitions = []
+        t = 1000 + random.randint(0, 1000)
+        for i in xrange(events):
+            start = t + random.randint(20, 5000)
+            end = start + random.randint(100, 10000)
+            message = None
+            if process_count > 1 and random.random() < density:
+                target = random.randrange(process_count - 1)
+                if target >= p:
+                    target += 1
+                sent = (start + end) // 2
+                arrival = max(sent + random.randint(1000, 20000),
+                              last_arrivals.get((p, target), 0) + 1)
+                last_arrivals[(p, target)] = arrival
+                receives[target].append((arrival, p))
+                message = (sent, target)
+            process_transitions.append((start, end, message))
+            t = end
+        transitions.append(process_transitions)
+
+    total = 0
+    for p in xrange(process_count):
+        receives[p].sort()
+        total += write_synthetic_trace(
+            os.path.join(directory, "trace-{0}-0.ktt".format(p)), p,
+            transitions[p], receives[p], payload, random.randint(0, skew))
+    return filename, total
+
+def run_stage(fn, *args):
+    """ Runs fn(*args) in a new process, so the peak memory of the stage is
+        not affected by other stages. fn returns the measured time.
+        Returns a couple (seconds, peak RSS [KiB]).
+    """
+    queue = mp.Queue()
+    def target():
+        try:
+            seconds = fn(*args)
+        except Exception:
+            queue.put(traceback.format_exc())
+            raise
+        queue.put((seconds,
+                   resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    process = mp.Process(target=target)
+    process.start()
+    result = queue.get()
+    process.join()
+    if isinstance(result, str):
+        raise Exception("Stage failed:\n" + result)
+    return result
+
+def stage_load(args, kth, kst):
+    import tracelog
+    start = time.time()
+    tracelog.TraceLog(kth, jobs=args.jobs)
+    return time.time() - start
+
+def stage_decode(args, kth, kst):
+    import tracedecoder
+    import tracelog
+    t = tracelog.TraceLog(kth, export_data=False)
+    start = time.time()
+    for trace in t.traces:
+        tracedecoder.decode_trace(trace)
+    return time.time() - start
+
+def stage_sync(args, kth, kst):
+    import syncedtracelog
+    start = time.time()
+    t = syncedtracelog.SyncedTraceLog(
+        fromtracelog=(kth, (args.min_event_diff, args.min_msg_delay,
+                            True, args.backward_amort, False)),
+        vectorized=args.vectorized, jobs=args.jobs)
+    t.export_to_file(kst)
+    return time.time() - start
+
+def stage_verify(args, kth, kst):
+    import tracelogverif
+    start = time.time()
+    tracelogverif.VTraceLog(kth, False, jobs=args.jobs)
+    return time.time() - start
+
+def stage_compare(args, kth, kst):
+    import tracelogcomparator
+    if not os.path.isfile(kst):
+        stage_sync(args, kth, kst)
+    start = time.time()
+    tracelogcomparator.TracelogComparator(kth, kst, False, jobs=args.jobs)
+    return time.time() - start
+
+def stage_export(args, kth, kst):
+    import exportri
+    import tablewriter
+    import tracelog
+    t = tracelog.TraceLog(kth)
+    start = time.time()
+    net = t.project.nets[0]
+    columns = exportri.ExportRunInstance.basic_header + \
+        [ exportri.place_counter_name(p) for p in net.places()
+          if p.trace_tokens ]
+    ri = exportri.ExportRunInstance(
+        t,
+        [ tr for tr in net.transitions() if tr.trace_fire ],
+        [ (p, i) for p in net.places()
+                 for i in xrange(len(p.trace_tokens_functions)) ],
+        columns,
+        lambda columns: tablewriter.create_writer(
+            "npy", kth + ".npy", columns))
+    t.execute_all_events(ri)
+    ri.finish()
+    return time.time() - start
+
+stages = [ ("load", stage_load),
+           ("decode", stage_decode),
+           ("sync", stage_sync),
+           ("verify", stage_verify),
+           ("compare", stage_compare),
+           ("export", stage_export) ]
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ("git", "rev-parse", "--short", "HEAD"),
+            cwd=KAIRA_ROOT, stderr=subprocess.PIPE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def bench_stages(args):
+    header = [ "date", "commit", "stage", "processes", "events", "payload",
+               "density", "seconds", "events_per_s", "peak_rss_kib" ]
+    new_file = not os.path.isfile(args.output)
+    results = open(args.output, "ab")
+    writer = csv.writer(results)
+    if new_file:
+        writer.writerow(header)
+    date = datetime.datetime.now().isoformat()
+    commit = get_commit()
+
+    print "{0:>8} {1:>10} {2:>10} {3:>10} {4:>12} {5:>12}".format(
+        "stage", "processes", "events", "time [s]", "events/s", "RSS [MiB]")
+    for process_count in args.processes:
+        directory = tempfile.mkdtemp(prefix="tracebench-")
+        try:
+            kth, events = generate_tracelog(
+                directory, process_count, args.events, args.payload,
+                args.density, args.skew)
+            kst = os.path.join(directory, "trace.kst")
+            for name, fn in stages:
+                if name not in args.stages:
+                    continue
+                seconds, rss = run_stage(fn, args, kth, kst)
+                rate = events / seconds if seconds > 0 else 0
+                print "{0:>8} {1:>10} {2:>10} {3:>10.3f} {4:>12.0f} " \
+                      "{5:>12.1f}".format(name, process_count, events,
+                                          seconds, rate, rss / 1024.0)
+                writer.writerow([ date, commit, name, process_count, events,
+                                  args.payload, args.density,
+                                  "{0:.6f}".format(seconds),
+                                  "{0:.0f}".format(rate), rss ])
+                results.flush()
+        finally:
+            if args.keep:
+                print "Tracelog kept in '{0}'".format(directory)
+            else:
+                shutil.rmtree(directory)
+    results.close()
+
+def bench_merge(args):
+    print "{0:>10} {1:>10} {2:>12} {3:>12} {4:>8}".format(
+        "processes", "events", "linear [s]", "heap [s]", "speedup")
+    for process_count in args.processes:
+        sequences = make_timestamps(process_count, args.events)
+        heap = []
+        t_heap = measure(lambda: heap.extend(utils.merge_indexes(sequences)))
+        if args.skip_linear:
+            t_linear = None
+        else:
+            linear = []
+            t_linear = measure(
+                lambda: linear.extend(linear_merge(sequences)))
+            assert linear == heap
+        print "{0:>10} {1:>10} {2:>12} {3:>12.3f} {4:>8}".format(
+            process_count,
+            sum(len(s) for s in sequences),
+            "-" if t_linear is None else "{0:.3f}".format(t_linear),
+            t_heap,
+            "-" if t_linear is None else "{0:.1f}x".format(t_linear / t_heap))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of Kaira tracelog processing")
+    subparsers = parser.add_subparsers()
+
+    p = subparsers.add_parser("merge",
+        help="merge of per-process event streams into the global timeline")
+    p.add_argument("--processes", type=int, nargs="+",
+                   default=[ 2, 8, 32, 128, 512, 1024 ])
+    p.add_argument("--events", type=int, default=200000,
+                   help="total number of events")
+    p.add_argument("--skip-linear", action="store_true",
+                   help="do not measure the original linear scan")
+    p.set_defaults(fn=bench_merge)
+
+    p = subparsers.add_parser("stages",
+        help="load, decode, sync, verify, compare and export of synthetic "
+             "tracelogs")
+    p.add_argument("--processes", type=int, nargs="+",
+                   default=[ 2, 8, 32, 128 ])
+    p.add_argument("--events", type=int, default=10000,
+                   help="number of transitions fired by each process")
+    p.add_argument("--payload", type=int, default=1,
+                   help="number of traced values of each token")
+    p.add_argument("--density", type=float, default=0.5,
+                   help="probability that a transition sends a message")
+    p.add_argument("--skew", type=int, default=50000,
+                   help="maximal clock skew between processes [ns]")
+    p.add_argument("--stages", nargs="+", default=[ n for n, f in stages ],
+                   choices=[ n for n, f in stages ])
+    p.add_argument("--jobs", type=int, default=1,
+                   help="number of processes decoding traces")
+    p.add_argument("--vectorized", action="store_true",
+                   help="use the vectorized synchronization")
+    p.add_argument("--backward-amort", action="store_true",
+                   help="apply the backward amortization in the sync")
+    p.add_argument("--min-event-diff", type=int, default=10)
+    p.add_argument("--min-msg-delay", type=int, default=10)
+    p.add_argument("--output", default="tracebench-results.csv",
+                   help="CSV file the results are appended to")
+    p.add_argument("--keep", action="store_true",
+                   help="do not delete generated tracelogs")
+    p.set_defaults(fn=bench_stages)
+
+    args = parser.parse_args()
+    random.seed(0)
+    args.fn(args)
+
+if __name__ == "__main__":
+    main()